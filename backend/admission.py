@@ -0,0 +1,203 @@
+"""Admission control and load shedding for the analyze endpoints.
+
+Every analyze request must hold one slot of a global concurrency budget.
+Requests that can't get a slot wait in a short, bounded queue where:
+  * only the newest frame per stream (camera, or user + browser tab) is kept;
+    an older queued frame is dropped as soon as a newer one arrives,
+  * streams with a recent weapon alert are served first, then the stream that
+    was served longest ago, so one busy dashboard can't starve the others,
+  * nothing waits longer than ADMISSION_MAX_WAIT_MS.
+Everything else is rejected immediately with 429/503 and a Retry-After hint,
+which keeps tail latency bounded instead of letting requests pile up in the
+WSGI server.
+
+Budgets are per process. serve.py splits the host-wide inference budget
+(SERVE_INFERENCE_CONCURRENCY) across its workers by setting
+INFERENCE_CONCURRENCY for each of them before this module is imported.
+"""
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, jsonify, request
+
+from metrics import Gauge
+
+INFERENCE_CONCURRENCY = int(os.getenv('INFERENCE_CONCURRENCY', 2))  # Per process
+VLM_CONCURRENCY = int(os.getenv('VLM_CONCURRENCY', 1))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 16))
+ADMISSION_MAX_WAIT_MS = int(os.getenv('ADMISSION_MAX_WAIT_MS', 500))
+ALERT_PRIORITY_SECONDS = float(os.getenv('ALERT_PRIORITY_SECONDS', 30))
+
+_WAITING, _GRANTED, _SUPERSEDED, _EXPIRED = range(4)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after  # seconds (float)
+
+
+class _Waiter:
+    __slots__ = ('key', 'state', 'event')
+
+    def __init__(self, key):
+        self.key = key
+        self.state = _WAITING
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    def __init__(self, name, concurrency, max_queue=ADMISSION_MAX_QUEUE, max_wait_ms=ADMISSION_MAX_WAIT_MS):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._heap = []             # (tier, last_served, seq, waiter); stale entries are skipped lazily
+        self._queued = {}           # stream key -> its single waiting _Waiter
+        self._last_served = {}      # stream key -> monotonic time it last got a slot
+        self._last_alert = {}       # stream key -> monotonic time of its last weapon alert
+        self._service_time = 0.2    # EWMA of seconds per request, for Retry-After hints
+        self.admitted = 0
+        self.rejected = 0
+        self.superseded = 0
+        self.expired = 0
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def queue_depth(self):
+        return len(self._queued)
+
+    def has_recent_alert(self, key, now=None):
+        alerted_at = self._last_alert.get(key)
+        return alerted_at is not None and (now or time.monotonic()) - alerted_at < ALERT_PRIORITY_SECONDS
+
+    def note_alert(self, key):
+        if key is not None:
+            self._last_alert[key] = time.monotonic()
+
+    def acquire(self, key):
+        """Blocks until the request may run. Raises AdmissionRejected instead of waiting too long."""
+        now = time.monotonic()
+        with self._lock:
+            previous = self._queued.pop(key, None)
+            if previous is not None:
+                # Latest frame wins: the older queued frame from this stream is now stale
+                previous.state = _SUPERSEDED
+                previous.event.set()
+
+            if self._in_flight < self.concurrency and not self._queued:
+                self._grant(key, now)
+                return
+
+            if len(self._queued) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(503, "Server is overloaded, frame dropped.", self._retry_after())
+
+            waiter = _Waiter(key)
+            tier = 0 if self.has_recent_alert(key, now) else 1
+            heapq.heappush(self._heap, (tier, self._last_served.get(key, 0.0), next(self._seq), waiter))
+            self._queued[key] = waiter
+
+        waiter.event.wait(self.max_wait)
+
+        with self._lock:
+            if waiter.state == _GRANTED:
+                return
+            if waiter.state == _SUPERSEDED:
+                self.superseded += 1
+                raise AdmissionRejected(429, "Frame superseded by a newer frame.", 0)
+            waiter.state = _EXPIRED
+            if self._queued.get(key) is waiter:
+                del self._queued[key]
+            self.expired += 1
+            raise AdmissionRejected(503, "Server is busy, frame dropped.", self._retry_after())
+
+    def release(self, started_at=None):
+        with self._lock:
+            self._in_flight -= 1
+            if started_at is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - started_at)
+            now = time.monotonic()
+            while self._heap and self._in_flight < self.concurrency:
+                _, _, _, waiter = heapq.heappop(self._heap)
+                if waiter.state != _WAITING:
+                    continue
+                del self._queued[waiter.key]
+                waiter.state = _GRANTED
+                self._grant(waiter.key, now)
+                waiter.event.set()
+
+    def _grant(self, key, now):
+        # Caller holds _lock
+        self._in_flight += 1
+        self._last_served[key] = now
+        self.admitted += 1
+        if len(self._last_served) > 4096:
+            # Browser tabs come and go; forget streams that have been quiet for a while
+            self._last_served = {k: t for k, t in self._last_served.items() if now - t < 600}
+            self._last_alert = {k: t for k, t in self._last_alert.items() if now - t < ALERT_PRIORITY_SECONDS}
+
+    def _retry_after(self):
+        # Caller holds _lock: rough time for the current backlog to drain
+        backlog = len(self._queued) + self._in_flight
+        return max(0.1, self._service_time * backlog / self.concurrency)
+
+
+inference_admission = AdmissionController('inference', INFERENCE_CONCURRENCY)
+vlm_admission = AdmissionController('vlm', VLM_CONCURRENCY, max_queue=2, max_wait_ms=ADMISSION_MAX_WAIT_MS)
+
+_controllers = (inference_admission, vlm_admission)
+Gauge('camwatch_admission_in_flight', "Requests holding an admission slot.",
+      lambda: {(c.name,): c.in_flight for c in _controllers}, ('pool',))
+Gauge('camwatch_admission_queue_depth', "Requests waiting for an admission slot.",
+      lambda: {(c.name,): c.queue_depth for c in _controllers}, ('pool',))
+Gauge('camwatch_admission_shed_total', "Requests shed by admission control, by reason.",
+      lambda: {(c.name, reason): getattr(c, reason) for c in _controllers for reason in ('rejected', 'superseded', 'expired')},
+      ('pool', 'reason'), metric_type='counter')
+
+
+def get_stream_key(current_user, data):
+    """Identifies a frame source: a registered camera, or one user's browser tab."""
+    if data.get('camera_id') is not None:
+        return f"camera:{data['camera_id']}"
+    return f"user:{current_user.get('id')}:{data.get('stream_id', '')}"
+
+
+def admission_controlled(controller):
+    """Decorator for analyze routes; must sit below @token_required."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(current_user, *args, **kwargs):
+            key = get_stream_key(current_user, request.get_json(silent=True) or {})
+            g.stream_key = key
+            try:
+                controller.acquire(key)
+            except AdmissionRejected as rejected:
+                response = jsonify({
+                    "success": False,
+                    "message": rejected.message,
+                    "retry_after_ms": int(rejected.retry_after * 1000)
+                })
+                response.headers['Retry-After'] = str(math.ceil(rejected.retry_after))
+                return response, rejected.status
+
+            started_at = time.monotonic()
+            try:
+                return f(current_user, *args, **kwargs)
+            finally:
+                controller.release(started_at)
+        return decorated_function
+    return decorator
@@ -0,0 +1,545 @@
+"""Weapon alert dispatch to webhook, SMTP and syslog sinks.
+
+The detection path calls notify(), which only hands the detection to the
+dispatcher's scheduler thread (merged per camera in memory, so the hand-off
+never blocks and never grows past one entry per camera). That thread updates
+the incident table and queues deliveries on the 'alerts' BoundedExecutor, so
+a request never does file I/O for an alert or waits on a slow mail server or
+webhook. Detections of the same camera are coalesced into one incident:
+  * the first detection opens the incident and is sent at once,
+  * a weapon type not seen yet in the incident escalates it (sent at once),
+  * repeats only update the incident's counters,
+  * ALERT_COALESCE_SECONDS without a detection resolves it; the resolved
+    message carries the totals (frames, weapon types, duration).
+Frames of one camera are spread over all worker processes, so the open
+incidents live in ALERT_INCIDENT_DIR, one JSON file per camera updated under
+flock (IncidentStore): one event sends one alert, whichever worker saw it.
+Any worker's scheduler thread may resolve a quiet incident.
+
+Each sink delivers on the executor's worker threads over pooled connections
+(a keep-alive requests.Session for webhooks, one SMTP connection per worker
+thread). A failed delivery is retried by the scheduler thread with
+exponential backoff and jitter; after ALERT_MAX_ATTEMPTS, or on a permanent
+error, the delivery is appended to the dead-letter file (JSON lines), from
+which redeliver_dead_letters() can queue it again.
+
+Sinks are enabled by their settings: ALERT_WEBHOOK_URL, ALERT_SMTP_HOST +
+ALERT_EMAIL_TO, ALERT_SYSLOG_ADDRESS. With none set, notify() is a no-op.
+"""
+import hashlib
+import heapq
+import hmac
+import json
+import logging
+import fcntl
+import os
+import random
+import re
+import smtplib
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.message import EmailMessage
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from camera_registry import camera_registry
+from metrics import Counter, Histogram
+from task_queue import BoundedExecutor
+
+logger = logging.getLogger(__name__)
+
+ALERT_WORKERS = int(os.getenv('ALERT_WORKERS', 2))
+ALERT_QUEUE_SIZE = int(os.getenv('ALERT_QUEUE_SIZE', 128))
+ALERT_COALESCE_SECONDS = float(os.getenv('ALERT_COALESCE_SECONDS', 30))
+ALERT_SEND_RESOLVED = os.getenv('ALERT_SEND_RESOLVED', 'true').lower() == 'true'
+ALERT_MAX_ATTEMPTS = int(os.getenv('ALERT_MAX_ATTEMPTS', 5))
+ALERT_RETRY_BASE_MS = int(os.getenv('ALERT_RETRY_BASE_MS', 500))
+ALERT_RETRY_MAX_MS = int(os.getenv('ALERT_RETRY_MAX_MS', 30000))
+ALERT_TIMEOUT_SECONDS = float(os.getenv('ALERT_TIMEOUT_SECONDS', 5))
+ALERT_DEAD_LETTER_PATH = os.getenv('ALERT_DEAD_LETTER_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'alert_dead_letters.jsonl'))
+# Shared by every worker process of the host (see IncidentStore)
+ALERT_INCIDENT_DIR = os.getenv('ALERT_INCIDENT_DIR', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'alert_incidents'))
+
+ALERTS = Counter('camwatch_alert_deliveries_total',
+                 "Alert deliveries by sink and outcome (delivered, retried, dead_lettered).", ('sink', 'outcome'))
+INCIDENTS = Counter('camwatch_alert_incidents_total',
+                    "Alert incident events (opened, escalated, coalesced, resolved).", ('event',))
+DELIVERY_SECONDS = Histogram('camwatch_alert_delivery_seconds',
+                             "Time from the detection to the sink accepting the alert.", ('sink',))
+
+# Deliveries refused by a full queue are dead-lettered instead: never silently dropped
+alert_executor = BoundedExecutor('alerts', workers=ALERT_WORKERS, capacity=ALERT_QUEUE_SIZE, policy='reject')
+
+
+class PermanentDeliveryError(Exception):
+    """The sink refused the alert in a way a retry can't fix (bad request, auth)."""
+
+
+def _csv(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def format_text(alert):
+    weapons = ', '.join(alert['weapon_types'])
+    camera = alert.get('camera_name') or f"camera {alert['camera_id']}"
+    if alert['event'] == 'resolved':
+        return (f"Resolved: {weapons} on {camera}, {alert['frames']} frame(s) over "
+                f"{alert['duration_seconds']:.0f}s (max confidence {alert['max_confidence']:.0%})")
+    prefix = {'opened': 'WEAPON DETECTED', 'escalated': 'ESCALATED'}.get(alert['event'], 'TEST')
+    return f"{prefix}: {weapons} on {camera} ({alert['max_confidence']:.0%} confidence) at {alert['last_seen']}"
+
+
+class WebhookSink:
+    name = 'webhook'
+
+    def __init__(self, url, secret=None, timeout=ALERT_TIMEOUT_SECONDS):
+        self.url = url
+        self.secret = secret.encode('utf-8') if secret else None
+        self.timeout = timeout
+        self.session = requests.Session()  # Keep-alive: the TLS handshake is paid once, not per alert
+        self.session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=ALERT_WORKERS))
+
+    def send(self, alert):
+        body = json.dumps(alert, separators=(',', ':')).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'X-CamWatch-Event': alert['event']}
+        if self.secret:
+            headers['X-CamWatch-Signature'] = 'sha256=' + hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        try:
+            response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ConnectionError(str(e)) from e
+        if response.status_code in (408, 429) or response.status_code >= 500:
+            raise ConnectionError(f"HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise PermanentDeliveryError(f"HTTP {response.status_code}")
+
+
+class SmtpSink:
+    name = 'smtp'
+
+    def __init__(self, host, port, sender, recipients, user=None, password=None, starttls=False,
+                 timeout=ALERT_TIMEOUT_SECONDS):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._local = threading.local()  # smtplib connections aren't thread-safe: one per worker thread
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                connection.starttls()
+            if self.user:
+                connection.login(self.user, self.password)
+            self._local.connection = connection
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except (OSError, smtplib.SMTPException):
+                pass
+
+    def send(self, alert):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message['Subject'] = f"[CamWatch] {format_text(alert)}"
+        message.set_content(format_text(alert) + '\n\n' + json.dumps(alert, indent=2))
+        for attempt in range(2):
+            try:
+                self._connection().send_message(message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._drop_connection()  # Idle connection closed by the server: reconnect once
+                if attempt:
+                    raise ConnectionError("SMTP server disconnected")
+            except smtplib.SMTPRecipientsRefused as e:
+                raise PermanentDeliveryError(str(e)) from e
+            except (smtplib.SMTPException, OSError) as e:
+                self._drop_connection()
+                raise ConnectionError(str(e)) from e
+
+
+class SyslogSink:
+    name = 'syslog'
+
+    FACILITIES = {'user': 1, 'daemon': 3, 'auth': 4, 'local0': 16, 'local1': 17, 'local2': 18, 'local3': 19,
+                  'local4': 20, 'local5': 21, 'local6': 22, 'local7': 23}
+
+    def __init__(self, address, facility='local0'):
+        if address.startswith('/'):
+            self.address, family = address, socket.AF_UNIX
+        else:
+            host, _, port = address.partition(':')
+            self.address, family = (host, int(port or 514)), socket.AF_INET
+        self.priority = self.FACILITIES.get(facility, 16) * 8 + 2  # severity: critical
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        severity = self.priority if alert['event'] != 'resolved' else self.priority + 3  # resolved: notice
+        message = f"<{severity}>camwatch[{os.getpid()}]: {format_text(alert)} alert_id={alert['alert_id']}"
+        with self._lock:
+            self._socket.sendto(message.encode('utf-8'), self.address)
+
+
+def sinks_from_env():
+    sinks = []
+    for url in _csv(os.getenv('ALERT_WEBHOOK_URL')):
+        sinks.append(WebhookSink(url, os.getenv('ALERT_WEBHOOK_SECRET')))
+    if os.getenv('ALERT_SMTP_HOST') and _csv(os.getenv('ALERT_EMAIL_TO')):
+        sinks.append(SmtpSink(
+            os.getenv('ALERT_SMTP_HOST'), int(os.getenv('ALERT_SMTP_PORT', 25)),
+            os.getenv('ALERT_EMAIL_FROM', 'camwatch@localhost'), _csv(os.getenv('ALERT_EMAIL_TO')),
+            os.getenv('ALERT_SMTP_USER'), os.getenv('ALERT_SMTP_PASSWORD'),
+            os.getenv('ALERT_SMTP_STARTTLS', 'false').lower() == 'true'))
+    if os.getenv('ALERT_SYSLOG_ADDRESS'):
+        sinks.append(SyslogSink(os.getenv('ALERT_SYSLOG_ADDRESS'), os.getenv('ALERT_SYSLOG_FACILITY', 'local0')))
+    return sinks
+
+
+class IncidentStore:
+    """Open incidents shared between processes: <camera>.json per camera, changed under flock on <camera>.lock.
+
+    The lock files stay (one per camera) so a waiter never holds the lock of a
+    deleted file. If the directory can't be used, incidents are coalesced per
+    process instead, which at worst duplicates alerts rather than losing them.
+    """
+
+    def __init__(self, directory=ALERT_INCIDENT_DIR):
+        self.directory = directory
+        self._fallback = {}
+        self._fallback_lock = threading.Lock()
+        self._warned = False
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    @staticmethod
+    def _key(camera_id):
+        return re.sub(r'[^A-Za-z0-9_-]', '_', str(camera_id))
+
+    def _read(self, key):
+        try:
+            with open(self._path(key, '.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            return None  # Torn by a crash mid-write: start a new incident
+
+    def _write(self, key, incident):
+        tmp_path = self._path(key, '.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(incident, f, separators=(',', ':'))
+        os.replace(tmp_path, self._path(key, '.json'))  # Lock-free readers never see a partial file
+
+    def update(self, camera_id, change):
+        """Applies change(incident or None) -> (incident, result) atomically across processes; returns result."""
+        key = self._key(camera_id)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(key, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                incident, result = change(self._read(key))
+                self._write(key, incident)
+                return result
+        except OSError as e:
+            if not self._warned:
+                self._warned = True
+                logger.error(f"❌ Alert incident directory {self.directory} unusable, coalescing per process: {e}")
+            with self._fallback_lock:
+                self._fallback[key], result = change(self._fallback.get(key))
+                return result
+
+    def resolve_quiet(self, quiet_seconds):
+        """Removes and returns the incidents without a detection for quiet_seconds."""
+        cutoff = time.time() - quiet_seconds
+        resolved = []
+        with self._fallback_lock:
+            for key, incident in list(self._fallback.items()):
+                if incident['last_seen_ts'] <= cutoff:
+                    resolved.append(self._fallback.pop(key))
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return resolved
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            incident = self._read(key)
+            if incident is None or incident['last_seen_ts'] > cutoff:
+                continue  # Cheap unlocked check first; re-checked under the lock
+            try:
+                with open(self._path(key, '.lock'), 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    incident = self._read(key)
+                    if incident is None or incident['last_seen_ts'] > cutoff:
+                        continue  # Resolved by another worker, or seen again meanwhile
+                    os.remove(self._path(key, '.json'))
+            except OSError as e:
+                logger.error(f"❌ Could not resolve alert incident {key}: {e}")
+                continue
+            resolved.append(incident)
+        return resolved
+
+    def count(self):
+        try:
+            shared = sum(1 for name in os.listdir(self.directory) if name.endswith('.json'))
+        except OSError:
+            shared = 0
+        return shared + len(self._fallback)
+
+
+def _merge_detection(pending, weapon_types, confidence, evidence):
+    """Folds one detection into the camera's not yet recorded detections (None for the first one)."""
+    now = datetime.now(timezone.utc)
+    if pending is None:
+        pending = {'weapon_types': [], 'max_confidence': 0.0, 'frames': 0, 'first_seen': now, 'evidence': None}
+    for weapon in weapon_types:
+        if weapon not in pending['weapon_types']:
+            pending['weapon_types'].append(weapon)
+    pending['max_confidence'] = max(pending['max_confidence'], confidence)
+    pending['frames'] += 1
+    pending['last_seen'] = now
+    pending['evidence'] = evidence or pending['evidence']
+    return pending
+
+
+def _record_detection(incident, camera_id, pending):
+    """Folds a camera's pending detections into its incident. Returns (incident, event)."""
+    if incident is None:
+        incident = {
+            'incident_id': str(uuid.uuid4()), 'camera_id': camera_id, 'weapon_types': [], 'max_confidence': 0.0,
+            'frames': 0, 'first_seen': pending['first_seen'].isoformat(), 'evidence': None,
+        }
+        event = 'opened'
+    elif any(weapon not in incident['weapon_types'] for weapon in pending['weapon_types']):
+        event = 'escalated'
+    else:
+        event = 'coalesced'
+    for weapon in pending['weapon_types']:
+        if weapon not in incident['weapon_types']:
+            incident['weapon_types'].append(weapon)
+    incident['max_confidence'] = max(incident['max_confidence'], pending['max_confidence'])
+    incident['frames'] += pending['frames']
+    incident['last_seen'] = pending['last_seen'].isoformat()
+    incident['last_seen_ts'] = pending['last_seen'].timestamp()
+    incident['evidence'] = pending['evidence'] or incident['evidence']
+    return incident, (incident, event)
+
+
+class AlertDispatcher:
+    def __init__(self, sinks=None, executor=alert_executor, coalesce_seconds=ALERT_COALESCE_SECONDS,
+                 dead_letter_path=ALERT_DEAD_LETTER_PATH, incidents=None):
+        self.sinks = sinks_from_env() if sinks is None else sinks
+        self.executor = executor
+        self.coalesce_seconds = coalesce_seconds
+        self.dead_letter_path = dead_letter_path
+        self.incidents = IncidentStore() if incidents is None else incidents
+        self._retries = []     # heap of (due monotonic, seq, sink, alert, attempt)
+        self._pending = {}     # camera_id -> detections not yet folded into its incident (see _merge_detection)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._dead_letter_lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return bool(self.sinks)
+
+    def notify(self, camera_id, weapon_types, confidence, evidence=None):
+        """Queues a weapon detection for the scheduler thread. No I/O and never blocks on a sink."""
+        if not weapon_types or not self.enabled:
+            return
+        with self._lock:
+            self._ensure_scheduler()
+            self._pending[camera_id] = _merge_detection(self._pending.get(camera_id), weapon_types, confidence, evidence)
+            self._wakeup.notify()
+
+    def _record(self, camera_id, pending):
+        """Scheduler thread: folds detections into the shared incident; sends when it opens or escalates it."""
+        incident, event = self.incidents.update(camera_id, lambda current: _record_detection(current, camera_id, pending))
+        INCIDENTS.inc((event,))
+        if event != 'coalesced':
+            self._dispatch(self._alert(incident, event))
+
+    def _alert(self, incident, event):
+        # Only if already loaded: never a database round trip on the detection path
+        camera = camera_registry.get(incident['camera_id']) if camera_registry.is_loaded else None
+        duration = datetime.fromisoformat(incident['last_seen']) - datetime.fromisoformat(incident['first_seen'])
+        return {
+            'alert_id': str(uuid.uuid4()),
+            'incident_id': incident['incident_id'],
+            'event': event,
+            'camera_id': incident['camera_id'],
+            'camera_name': camera['name'] if camera else None,
+            'location': camera['location'] if camera else None,
+            'weapon_types': list(incident['weapon_types']),
+            'max_confidence': round(incident['max_confidence'], 4),
+            'frames': incident['frames'],
+            'first_seen': incident['first_seen'],
+            'last_seen': incident['last_seen'],
+            'duration_seconds': round(duration.total_seconds(), 3),
+            'evidence': incident['evidence'],
+        }
+
+    def _dispatch(self, alert, sinks=None, attempt=1):
+        with self._lock:
+            self._ensure_scheduler()
+        for sink in sinks or self.sinks:
+            if not self.executor.submit(self._deliver, sink, alert, attempt):
+                self._dead_letter(sink, alert, attempt - 1, "alert queue full")
+
+    def _deliver(self, sink, alert, attempt):
+        try:
+            sink.send(alert)
+        except PermanentDeliveryError as e:
+            self._dead_letter(sink, alert, attempt, str(e))
+            return
+        except Exception as e:
+            if attempt >= ALERT_MAX_ATTEMPTS:
+                self._dead_letter(sink, alert, attempt, str(e))
+                return
+            delay_ms = min(ALERT_RETRY_MAX_MS, ALERT_RETRY_BASE_MS * 2 ** (attempt - 1))
+            delay = delay_ms * random.uniform(0.5, 1.0) / 1000.0  # Jitter: don't retry every alert in lockstep
+            ALERTS.inc((sink.name, 'retried'))
+            logger.warning(f"⚠️ {sink.name} alert delivery failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+            with self._lock:
+                self._seq += 1
+                heapq.heappush(self._retries, (time.monotonic() + delay, self._seq, sink, alert, attempt + 1))
+                self._wakeup.notify()
+            return
+        ALERTS.inc((sink.name, 'delivered'))
+        if alert['event'] != 'resolved':
+            detected_at = datetime.fromisoformat(alert['last_seen'])
+            DELIVERY_SECONDS.observe((datetime.now(timezone.utc) - detected_at).total_seconds(), (sink.name,))
+
+    def _dead_letter(self, sink, alert, attempts, error):
+        ALERTS.inc((sink.name, 'dead_lettered'))
+        logger.error(f"❌ Alert {alert['alert_id']} to {sink.name} dead-lettered after {attempts} attempt(s): {error}")
+        entry = {'sink': sink.name, 'alert': alert, 'attempts': attempts, 'error': error,
+                 'failed_at': datetime.now(timezone.utc).isoformat()}
+        try:
+            with self._dead_letter_lock, open(self.dead_letter_path, 'a') as f:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        except OSError as e:
+            logger.error(f"❌ Could not write the alert dead-letter file: {e}")
+
+    def _ensure_scheduler(self):
+        # Called with the lock held; the thread doesn't survive fork(), so a new pid starts a new one
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._retries = []
+        self._pending = {}
+        threading.Thread(target=self._schedule, name='alert-scheduler', daemon=True).start()
+
+    def _schedule(self):
+        """Records queued detections, re-queues due retries and resolves incidents that have gone quiet."""
+        pid = os.getpid()
+        next_scan = 0.0
+        while self._pid == pid:
+            resolved = []
+            due = []
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for camera_id, detections in pending.items():
+                try:
+                    self._record(camera_id, detections)
+                except Exception as e:
+                    logger.error(f"❌ Could not record weapon alert for camera {camera_id}: {e}")
+            if time.monotonic() >= next_scan:
+                # Shared with the other workers; whoever finds an incident quiet first resolves it
+                next_scan = time.monotonic() + 1.0
+                quiet = self.incidents.resolve_quiet(self.coalesce_seconds)
+                resolved = [self._alert(incident, 'resolved') for incident in quiet]
+            with self._lock:
+                now = time.monotonic()
+                while self._retries and self._retries[0][0] <= now:
+                    due.append(heapq.heappop(self._retries))
+                next_retry = self._retries[0][0] - now if self._retries else 1.0
+                if not due and not resolved and not self._pending:
+                    self._wakeup.wait(max(0.01, min(next_scan - now, next_retry)))
+                    continue
+            for _, _, sink, alert, attempt in due:
+                self._dispatch(alert, [sink], attempt)
+            for alert in resolved:
+                INCIDENTS.inc(('resolved',))
+                if ALERT_SEND_RESOLVED:
+                    self._dispatch(alert)
+
+    def pending_retries(self):
+        return len(self._retries)
+
+    def open_incidents(self):
+        """Open incidents of every worker on this host."""
+        return self.incidents.count()
+
+    def dead_letter_count(self):
+        try:
+            with open(self.dead_letter_path) as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def redeliver_dead_letters(self):
+        """Queues every dead-lettered delivery again (for sinks still configured). Returns how many."""
+        processing_path = f"{self.dead_letter_path}.{os.getpid()}.redeliver"
+        with self._dead_letter_lock:
+            try:
+                os.replace(self.dead_letter_path, processing_path)
+            except FileNotFoundError:
+                return 0
+        sinks = {sink.name: sink for sink in self.sinks}
+        queued = 0
+        with open(processing_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                sink = sinks.get(entry.get('sink'))
+                if sink is None:
+                    self._dead_letter_entry(line)
+                    continue
+                self._dispatch(entry['alert'], [sink])
+                queued += 1
+        os.remove(processing_path)
+        return queued
+
+    def _dead_letter_entry(self, line):
+        with self._dead_letter_lock, open(self.dead_letter_path, 'a') as f:
+            f.write(line if line.endswith('\n') else line + '\n')
+
+    def send_test(self):
+        """Sends a test alert to every sink through the normal delivery path."""
+        now = datetime.now(timezone.utc).isoformat()
+        alert = {
+            'alert_id': str(uuid.uuid4()), 'incident_id': None, 'event': 'test', 'camera_id': None,
+            'camera_name': 'test', 'location': None, 'weapon_types': ['test'], 'max_confidence': 1.0, 'frames': 0,
+            'first_seen': now, 'last_seen': now, 'duration_seconds': 0.0, 'evidence': None,
+        }
+        self._dispatch(alert)
+        return alert
+
+
+dispatcher = AlertDispatcher()
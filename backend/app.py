@@ -8,21 +8,70 @@ load_dotenv()
 from routes.auth import auth_bp
 from routes.admin_routes import admin_bp   # <-- ADD THIS LINE
 from routes.dashboard_routes import dashboard_bp
+from partition_maintenance import start_maintenance_thread
+import metrics
+import profiler
+import inference
+import task_queue
+import spool
+import cpu_topology
 
 app = Flask(__name__)
 CORS(app) 
 
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'camwatch-secret-key-fallback')
 
+# Per-route request metrics and the Prometheus /metrics endpoint
+metrics.init_app(app)
+# Admin-toggled slow-request tracing (see /api/admin/profiling)
+profiler.init_app(app)
+
+# Cores and thread pools for inference vs request/I/O threads (serve.py does this per worker instead)
+cpu_topology.configure_process(app.logger)
+
+# Drain queued alert deliveries on SIGTERM/exit instead of dropping them
+task_queue.install_shutdown_hooks()
+
 # Register the auth_bp blueprint with a URL prefix
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')   # <-- ADD THIS LINE
 app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
 
+# Keep detection_logs partitions created ahead of time and expire old ones (0 disables; use cron instead)
+partition_maintenance_interval = int(os.getenv('PARTITION_MAINTENANCE_INTERVAL_MINUTES', 60))
+if partition_maintenance_interval > 0:
+    start_maintenance_thread(app, partition_maintenance_interval)
+
+# Replay spooled detections into Postgres (0 disables; run the drainer elsewhere)
+if spool.SPOOL_DRAIN_INTERVAL_MS > 0:
+    spool.start_drainer(app)
+
+# 'background' loads the YOLO model at boot, 'sync' before the app is returned (serve.py, pre-fork),
+# 'off' defers it to the first analyze request (auth/admin-only workers)
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', 'background').lower()
+if MODEL_WARMUP == 'background':
+    inference.start_background_warmup(app)
+elif MODEL_WARMUP == 'sync':
+    with app.app_context():
+        inference.get_optimized_yolo_model()
+
 @app.route('/')
 def home():
     return "CamWatch Backend is running! Now with DB authentication under /api/auth/."
 
+@app.route('/health/live')
+def health_live():
+    return jsonify({"status": "alive"}), 200
+
+@app.route('/health/ready')
+def health_ready():
+    # Only route frames to workers whose model is loaded and warm
+    if MODEL_WARMUP == 'off' or inference.is_model_ready():
+        return jsonify({"status": "ready", "model_loaded": inference.is_model_ready()}), 200
+    if inference.warmup_error:
+        return jsonify({"status": "failed", "message": inference.warmup_error}), 503
+    return jsonify({"status": "warming_up"}), 503
+
 if __name__ == '__main__':
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     port = int(os.getenv('PORT', 5000))
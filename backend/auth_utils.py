@@ -1,7 +1,192 @@
+import fcntl
 import jwt
 import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify, current_app, g
+from db_utils import get_user_active_status
+
+# Verified tokens, keyed by SHA-256 digest -> (user info, exp). Entries never outlive the token's exp.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+# Deactivations and deletions are appended to USER_REVOCATIONS_FILE; every worker on the host reads it at most
+# once a second and drops the affected users, so revocation takes effect within ~1s on all workers sharing the file.
+# USER_STATUS_CACHE_TTL bounds the delay for anything that doesn't see the file (other hosts, direct SQL updates).
+# Entries older than that can't invalidate anything still cached, so writers rotate them out (see _rotate_revocations).
+USER_STATUS_CACHE_TTL = float(os.getenv('USER_STATUS_CACHE_TTL', 60))
+USER_REVOCATIONS_FILE = os.getenv('USER_REVOCATIONS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'user_revocations.log'))
+# After a failed status lookup, skip the database for this long (last known status, or 503 if there is none)
+USER_STATUS_RETRY_SECONDS = float(os.getenv('USER_STATUS_RETRY_SECONDS', 5))
+_REVOCATIONS_CHECK_S = 1.0
+
+_jwt_secret = None
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+_user_status_cache = {}  # user_id -> (is_active or None if deleted, cached_at)
+_user_status_lock = threading.Lock()
+_status_lookup_failed_at = None  # monotonic time of the last failed lookup
+_revocations = {'checked_at': 0.0, 'inode': None, 'offset': None}  # How far this process has read USER_REVOCATIONS_FILE
+
+class UserStatusUnavailable(Exception):
+    """A user's status is unknown: the database is unreachable and nothing is cached."""
+
+def get_jwt_secret():
+    """JWT secret, read from the environment once per process."""
+    global _jwt_secret
+    if _jwt_secret is None:
+        _jwt_secret = os.getenv('JWT_SECRET')
+    return _jwt_secret
+
+def _decode_token_cached(token, jwt_secret):
+    """Returns the user info for a token, verifying its signature only on the first sighting."""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            user_info, expires_at = cached
+            if expires_at is None or expires_at > now:
+                _token_cache.move_to_end(key)
+                return dict(user_info)
+            del _token_cache[key]
+            raise jwt.ExpiredSignatureError("Signature has expired")
+
+    payload = jwt.decode(token, jwt_secret, algorithms=["HS256"])
+    user_info = {
+        'id': payload.get('user_id'),
+        'role': payload.get('role'),
+        'email': payload.get('email'),
+        'name': payload.get('name')
+    }
+    with _token_cache_lock:
+        _token_cache[key] = (user_info, payload.get('exp'))
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return dict(user_info)
+
+def is_user_active(user_id):
+    """Cached is_active lookup. Hits the database at most once per user per USER_STATUS_CACHE_TTL.
+
+    Fails closed: if the database is unreachable, the last known status is used, and
+    UserStatusUnavailable is raised for users without one (including just-revoked users).
+    """
+    global _status_lookup_failed_at
+    _apply_revocations()
+    now = time.monotonic()
+    with _user_status_lock:
+        cached = _user_status_cache.get(user_id)
+        failed_at = _status_lookup_failed_at
+    if cached is not None and now - cached[1] < USER_STATUS_CACHE_TTL:
+        return bool(cached[0])
+
+    if failed_at is None or now - failed_at >= USER_STATUS_RETRY_SECONDS:
+        try:
+            is_active = get_user_active_status(user_id)
+        except Exception as e:
+            current_app.logger.error(f"Could not check status for user {user_id}: {e}")
+            with _user_status_lock:
+                _status_lookup_failed_at = now
+        else:
+            with _user_status_lock:
+                _status_lookup_failed_at = None
+                _user_status_cache[user_id] = (is_active, time.monotonic())
+            return bool(is_active)
+
+    if cached is None:
+        raise UserStatusUnavailable(f"Status of user {user_id} is unknown")
+    return bool(cached[0])
+
+def set_user_status(user_id, is_active):
+    """Write-through update of the user-status cache (is_active=None marks the user as deleted).
+
+    Also tells the other workers to re-read the user's status (see USER_REVOCATIONS_FILE).
+    """
+    with _user_status_lock:
+        _user_status_cache[user_id] = (is_active, time.monotonic())
+    try:
+        # Writers hold the lock so nobody appends to a file that is being rotated away
+        with open(f"{USER_REVOCATIONS_FILE}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _rotate_revocations()
+            fd = os.open(USER_REVOCATIONS_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, f"{user_id} {time.time():.0f}\n".encode('ascii'))
+            finally:
+                os.close(fd)
+    except OSError as e:
+        current_app.logger.error(f"Could not publish status change for user {user_id}, other workers "
+                                 f"pick it up within {USER_STATUS_CACHE_TTL:.0f}s: {e}")
+
+def _revocation_time(line):
+    """Unix time of a `<user_id> <time>` entry; 0 for entries written before they carried one."""
+    try:
+        return float(line.split()[1])
+    except (IndexError, ValueError):
+        return 0.0
+
+def _rotate_revocations():
+    """Replaces USER_REVOCATIONS_FILE with its last USER_STATUS_CACHE_TTL of entries once older ones pile up.
+
+    Called with the writers' lock held. The new file is a new inode: readers notice and read
+    it from the start, so every entry that can still matter is applied without a cache flush.
+    """
+    cutoff = time.time() - USER_STATUS_CACHE_TTL
+    try:
+        with open(USER_REVOCATIONS_FILE, 'rb') as f:
+            first = f.readline()
+            if not first or _revocation_time(first) >= cutoff:
+                return  # The oldest entry can still matter
+            f.seek(0)
+            recent = [line for line in f if _revocation_time(line) >= cutoff]
+    except FileNotFoundError:
+        return
+    tmp_path = f"{USER_REVOCATIONS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.writelines(recent)
+    os.replace(tmp_path, USER_REVOCATIONS_FILE)
+
+def _apply_revocations():
+    """Drops the cached status of users changed by other workers since the last check (at most once a second)."""
+    now = time.monotonic()
+    if now - _revocations['checked_at'] < _REVOCATIONS_CHECK_S:
+        return
+    with _user_status_lock:
+        if now - _revocations['checked_at'] < _REVOCATIONS_CHECK_S:
+            return
+        _revocations['checked_at'] = now
+        try:
+            stat = os.stat(USER_REVOCATIONS_FILE)
+            inode, size = stat.st_ino, stat.st_size
+        except OSError:
+            inode, size = None, 0
+        previous_inode, offset = _revocations['inode'], _revocations['offset']
+        _revocations['inode'], _revocations['offset'] = inode, size
+        if offset is None:
+            return  # First check: nothing is cached yet, so older entries don't matter
+        if inode != previous_inode:
+            if inode is None:
+                _user_status_cache.clear()  # Deleted: start over
+                return
+            offset = 0  # Rotated: the new file holds every entry that can still matter
+        elif size < offset:
+            _user_status_cache.clear()  # Truncated in place: start over
+            return
+        if size == offset:
+            return
+        try:
+            with open(USER_REVOCATIONS_FILE, 'rb') as f:
+                f.seek(offset)
+                lines = f.read(size - offset).splitlines()
+        except OSError:
+            _user_status_cache.clear()
+            return
+        for line in lines:
+            try:
+                _user_status_cache.pop(int(line.split()[0]), None)
+            except (ValueError, IndexError):
+                pass
 
 def token_required(f):
     @wraps(f)
@@ -15,30 +200,24 @@ def token_required(f):
             return jsonify({'success': False, 'message': 'Token is missing!'}), 401
 
         try:
-            jwt_secret = os.getenv('JWT_SECRET')
+            jwt_secret = get_jwt_secret()
             if not jwt_secret:
                 current_app.logger.error("JWT_SECRET environment variable is not set.")
                 return jsonify({'success': False, 'message': 'Server configuration error: JWT secret not found.'}), 500
             
-            payload = jwt.decode(token, jwt_secret, algorithms=["HS256"])
-            
             # Store essential user info from token in Flask's g object
-            g.current_user_from_token = {
-                'id': payload.get('user_id'), 
-                'role': payload.get('role'), 
-                'email': payload.get('email'),
-                'name': payload.get('name') 
-            }
-            # For enhanced security, you might re-fetch user from DB here to check active status
-            # e.g., user_db_record = get_user_by_id(g.current_user_from_token['id'])
-            # if not user_db_record or not user_db_record['is_active']:
-            #     return jsonify({'success': False, 'message': 'User not found or inactive.'}), 401
-            # g.current_user = user_db_record # If fetched
+            g.current_user_from_token = _decode_token_cached(token, jwt_secret)
+
+            # Deleted or deactivated users are rejected immediately, served from the user-status cache
+            if not is_user_active(g.current_user_from_token['id']):
+                return jsonify({'success': False, 'message': 'User not found or inactive.'}), 401
 
         except jwt.ExpiredSignatureError:
             return jsonify({'success': False, 'message': 'Token has expired!'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'success': False, 'message': 'Token is invalid!'}), 401
+        except UserStatusUnavailable:
+            return jsonify({'success': False, 'message': 'Unable to verify user status, please retry shortly.'}), 503
         except Exception as e:
             current_app.logger.error(f"Token validation error: {e}")
             return jsonify({'success': False, 'message': 'Error processing token.'}), 500
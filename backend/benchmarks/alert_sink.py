@@ -0,0 +1,78 @@
+"""Local webhook receiver for testing alert delivery (alerts.py).
+
+Prints every alert it receives with the latency from the detection
+(last_seen) to arrival, and can fail the first N requests to exercise the
+retry/backoff path.
+
+Examples (from the backend directory):
+  python -m benchmarks.alert_sink --port 8099
+  python -m benchmarks.alert_sink --port 8099 --fail-first 3 --status 503
+  # then run the backend with ALERT_WEBHOOK_URL=http://127.0.0.1:8099/alerts
+"""
+import argparse
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import summarize_latencies
+
+
+def make_handler(fail_first, fail_status, latencies_ms):
+    failures = {'left': fail_first}
+    lock = threading.Lock()
+
+    class AlertHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like a real receiver
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            with lock:
+                fail = failures['left'] > 0
+                failures['left'] -= 1 if fail else 0
+            if fail:
+                self._reply(fail_status)
+                print(f"✗ refused with HTTP {fail_status}")
+                return
+            alert = json.loads(body)
+            latency_ms = (datetime.now(timezone.utc) - datetime.fromisoformat(alert['last_seen'])).total_seconds() * 1000.0
+            with lock:
+                latencies_ms.append(latency_ms)
+            print(f"✓ {alert['event']:<9} camera {alert['camera_id']}: {', '.join(alert['weapon_types'])} "
+                  f"frames={alert['frames']} latency={latency_ms:.1f} ms")
+            self._reply(204)
+
+        def _reply(self, status):
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return AlertHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive alert webhooks and report delivery latency.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--fail-first', type=int, default=0, help="Refuse this many requests before accepting.")
+    parser.add_argument('--status', type=int, default=503, help="Status code for refused requests.")
+    args = parser.parse_args()
+
+    latencies_ms = []
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.fail_first, args.status, latencies_ms))
+    print(f"Listening on http://{args.host}:{args.port}/ (Ctrl+C for the latency summary)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        summary = summarize_latencies(latencies_ms)
+        print(f"\n{len(latencies_ms)} alert(s): p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, max {summary['max_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Shared helpers for the benchmark and replay tools.
+
+Run the tools from the backend directory, e.g. `python -m benchmarks.loadtest`.
+"""
+import datetime
+import glob
+import os
+import sys
+import threading
+
+import jwt
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (0 for an empty list)."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize_latencies(latencies_ms):
+    values = sorted(latencies_ms)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+    }
+
+
+def make_token(user_id=1, role='staff', secret=None, hours=24):
+    """Mints a dashboard JWT the same way routes/auth.py does."""
+    secret = secret or os.getenv('JWT_SECRET')
+    if not secret:
+        raise SystemExit("JWT_SECRET must be set to mint benchmark tokens.")
+    payload = {
+        'user_id': user_id,
+        'role': role,
+        'name': f'bench-{user_id}',
+        'email': f'bench-{user_id}@camwatch.local',
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=hours)
+    }
+    return jwt.encode(payload, secret, algorithm='HS256')
+
+
+def load_frames(frames_dir=None, count=16, size=320, quality=60, seed=0):
+    """Returns a list of JPEG byte strings: every *.jpg/*.jpeg/*.png in frames_dir, or synthetic frames."""
+    import cv2
+    import numpy as np
+
+    if frames_dir:
+        paths = sorted(glob.glob(os.path.join(frames_dir, '*.jp*g')) + glob.glob(os.path.join(frames_dir, '*.png')))
+        if not paths:
+            raise SystemExit(f"No images found in {frames_dir}")
+        frames = []
+        for path in paths:
+            image = cv2.imread(path)
+            ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ok:
+                frames.append(encoded.tobytes())
+        return frames
+
+    # Deterministic noisy scenes with a few moving shapes, roughly webcam-like in JPEG size
+    rng = np.random.default_rng(seed)
+    background = rng.integers(40, 200, (size, size, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        frame = cv2.GaussianBlur(background, (7, 7), 0)
+        offset = (i * 7) % size
+        cv2.rectangle(frame, (offset, 60), (min(size - 1, offset + 60), 200), (30, 30, 30), -1)
+        cv2.circle(frame, (size - offset - 1, size // 2), 25, (220, 220, 220), -1)
+        noise = rng.integers(-12, 12, frame.shape, dtype=np.int16)
+        frame = np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frames.append(encoded.tobytes())
+    return frames
+
+
+class StubDatabase:
+    """In-process stand-in for Postgres: answers the queries the analyze path makes and counts inserts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self.statements = 0
+
+    def connect(self, *args, **kwargs):
+        return _StubConnection(self)
+
+    def record(self, sql, rowcount):
+        with self._lock:
+            self.statements += 1
+            if 'INSERT INTO detection_logs' in sql:
+                self.rows_written += rowcount
+
+
+class _StubConnection:
+    encoding = 'UTF8'
+
+    def __init__(self, database):
+        self._database = database
+
+    def cursor(self, *args, **kwargs):
+        return _StubCursor(self._database, self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _StubCursor:
+    def __init__(self, database, connection=None):
+        self._database = database
+        self.connection = connection
+        self._rows = []
+        self._values = 0  # Rows mogrified for the next execute_values() statement
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, template, args):
+        self._values += 1
+        return b'(...)'
+
+    def execute(self, sql, params=None):
+        self.rowcount, self._values = max(1, self._values), 0
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        if 'FROM users' in sql:
+            self._rows = [(True,)]  # Every benchmark user is active
+        else:
+            self._rows = []
+        self._database.record(sql, self.rowcount)
+
+    def executemany(self, sql, params_seq):
+        params_seq = list(params_seq)
+        self.rowcount = len(params_seq)
+        self._database.record(sql, self.rowcount)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+
+def use_scratch_storage():
+    """Points the spool, evidence store and frame recordings at a temp directory (call before importing the app)."""
+    import tempfile
+
+    scratch = tempfile.mkdtemp(prefix='camwatch-bench-')
+    os.environ.setdefault('SPOOL_DIR', os.path.join(scratch, 'spool'))
+    os.environ.setdefault('EVIDENCE_DIR', os.path.join(scratch, 'evidence'))
+    os.environ.setdefault('RECORDINGS_DIR', os.path.join(scratch, 'recordings'))
+    return scratch
+
+
+def install_stub_database():
+    """Points every imported get_db_connection at a StubDatabase and returns it."""
+    import db_utils
+
+    database = StubDatabase()
+    original = db_utils.get_db_connection
+    for module in list(sys.modules.values()):
+        if getattr(module, 'get_db_connection', None) is original:
+            module.get_db_connection = database.connect
+    return database
+
+
+def count_detection_rows_since(started_at):
+    """Rows written to detection_logs since started_at (datetime), against the real database."""
+    from db_utils import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM detection_logs WHERE created_at >= %s", (started_at,))
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
@@ -0,0 +1,219 @@
+"""End-to-end load test for /api/dashboard/analyze-frame-smart.
+
+Simulates N dashboards, each posting JPEG frames the way StaffDashboard.js does
+(wait for the response, then wait the frame interval), and reports latency
+percentiles, achieved FPS, error/429 rates and detection rows written.
+
+Examples (from the backend directory):
+  # In-process server with the stand-in database and synthetic frames
+  JWT_SECRET=dev YOLO_MODEL_PATH=yolov8n.pt python -m benchmarks.loadtest --dashboards 8 --duration 30
+
+  # Existing server and real Postgres, recorded frames, results saved for comparison
+  python -m benchmarks.loadtest --url http://127.0.0.1:5000 --db postgres --frames ./frames --output run.json
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from benchmarks.common import (
+    count_detection_rows_since, install_stub_database, load_frames, make_token, summarize_latencies, use_scratch_storage
+)
+
+ANALYZE_PATH = '/api/dashboard/analyze-frame-smart'
+
+
+def start_in_process_server(host, port):
+    """Imports the Flask app and serves it from a background thread (threaded, like the dev server)."""
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # No access log line per frame
+    server = make_server(host, port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+class Dashboard(threading.Thread):
+    """One simulated StaffDashboard tab."""
+
+    def __init__(self, index, base_url, token, frames_b64, interval_s, follow_control, stop_at, measure_from, results):
+        super().__init__(name=f'dashboard-{index}', daemon=True)
+        self.index = index
+        self.url = base_url + ANALYZE_PATH
+        self.token = token
+        self.frames_b64 = frames_b64
+        self.interval_s = interval_s
+        self.follow_control = follow_control
+        self.stop_at = stop_at
+        self.measure_from = measure_from
+        self.results = results
+
+    def run(self):
+        import requests
+
+        session = requests.Session()
+        headers = {'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'}
+        interval_s = self.interval_s
+        frame_index = self.index
+        while time.monotonic() < self.stop_at:
+            body = json.dumps({
+                'image_b64': self.frames_b64[frame_index % len(self.frames_b64)],
+                'stream_id': f'loadtest-{self.index}',
+                'realtime': True,
+                'silent': True
+            })
+            frame_index += 1
+            started = time.monotonic()
+            try:
+                response = session.post(self.url, data=body, headers=headers, timeout=30)
+                status = response.status_code
+                payload = response.json() if response.content else {}
+            except Exception:
+                status, payload = 'error', {}
+            elapsed_ms = (time.monotonic() - started) * 1000.0
+
+            if started >= self.measure_from:
+                self.results.record(status, elapsed_ms, payload.get('weapon_detected', False))
+
+            if self.follow_control:
+                if payload.get('control'):
+                    interval_s = payload['control']['interval_ms'] / 1000.0
+                elif 'retry_after_ms' in payload:
+                    interval_s = max(interval_s, payload['retry_after_ms'] / 1000.0)
+            time.sleep(interval_s)
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies_ms = []
+        self.statuses = Counter()
+        self.weapon_frames = 0
+
+    def record(self, status, elapsed_ms, weapon_detected):
+        with self._lock:
+            self.statuses[str(status)] += 1
+            if status == 200:
+                self.latencies_ms.append(elapsed_ms)
+                if weapon_detected:
+                    self.weapon_frames += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the analyze pipeline.")
+    parser.add_argument('--url', help="Base URL of a running backend. Default: start one in-process.")
+    parser.add_argument('--db', choices=['stub', 'postgres'], default='stub',
+                        help="In-process only: 'stub' replaces Postgres with an in-memory stand-in.")
+    parser.add_argument('--model', help="YOLO weights for the in-process server (sets YOLO_MODEL_PATH).")
+    parser.add_argument('--dashboards', type=int, default=4, help="Number of simulated dashboards.")
+    parser.add_argument('--fps', type=float, default=5.0, help="Target frames per second per dashboard.")
+    parser.add_argument('--follow-control', action='store_true', help="Honor the server's control block / Retry-After.")
+    parser.add_argument('--duration', type=float, default=30.0, help="Measured seconds.")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Unmeasured seconds before measuring.")
+    parser.add_argument('--frames', help="Directory of recorded frames. Default: synthetic frames.")
+    parser.add_argument('--user-id', type=int, default=1, help="user_id put in the JWTs (must exist with --db postgres).")
+    parser.add_argument('--output', help="Write machine-readable results to this JSON file.")
+    args = parser.parse_args()
+
+    server = None
+    database = None
+    base_url = args.url
+    if not base_url:
+        if args.model:
+            os.environ['YOLO_MODEL_PATH'] = args.model
+        os.environ.setdefault('PARTITION_MAINTENANCE_INTERVAL_MINUTES', '0')
+        if args.db == 'stub':
+            use_scratch_storage()
+        server, base_url = start_in_process_server('127.0.0.1', 0)
+        if args.db == 'stub':
+            database = install_stub_database()
+
+    frames_b64 = [base64.b64encode(frame).decode('ascii') for frame in load_frames(args.frames)]
+    token = make_token(args.user_id)
+    results = Results()
+
+    started_wall = datetime.now(timezone.utc)
+    rows_before = database.rows_written if database else 0
+    now = time.monotonic()
+    measure_from = now + args.warmup
+    stop_at = measure_from + args.duration
+    dashboards = [
+        Dashboard(i, base_url, token, frames_b64, 1.0 / args.fps, args.follow_control, stop_at, measure_from, results)
+        for i in range(args.dashboards)
+    ]
+    for dashboard in dashboards:
+        dashboard.start()
+    for dashboard in dashboards:
+        dashboard.join()
+
+    if server:
+        # Detections are spooled; seal and replay what this run wrote so the row count is complete
+        import spool
+        spool.writer.close()
+        try:
+            while spool.drain() is None:
+                time.sleep(0.05)
+        except Exception as e:
+            print(f"Could not replay the spool: {e}")
+
+    if database:
+        rows_written = database.rows_written - rows_before
+    else:
+        try:
+            rows_written = count_detection_rows_since(started_wall)
+        except Exception as e:
+            print(f"Could not count detection rows: {e}")
+            rows_written = None
+
+    total = sum(results.statuses.values())
+    report = {
+        "benchmark": "analyze-frame-smart",
+        "started_at": started_wall.isoformat(),
+        "config": {
+            "dashboards": args.dashboards,
+            "target_fps_per_dashboard": args.fps,
+            "follow_control": args.follow_control,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "frames": args.frames or "synthetic",
+            "frame_count": len(frames_b64),
+            "server": args.url or "in-process",
+            "db": "external" if args.url else args.db,
+            "model": os.getenv('YOLO_MODEL_PATH'),
+        },
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "latency": summarize_latencies(results.latencies_ms),
+        "achieved_fps": round(len(results.latencies_ms) / args.duration, 3),
+        "requests": total,
+        "status_counts": dict(results.statuses),
+        "error_rate": round(sum(n for s, n in results.statuses.items() if s not in ('200', '429')) / total, 4) if total else 0.0,
+        "rate_429": round(results.statuses.get('429', 0) / total, 4) if total else 0.0,
+        "weapon_frames": results.weapon_frames,
+        "db_rows_written": rows_written,
+    }
+
+    latency = report["latency"]
+    print(f"Dashboards: {args.dashboards} @ {args.fps} FPS target, {args.duration:.0f}s measured")
+    print(f"Achieved:   {report['achieved_fps']} FPS total, {total} requests, statuses {report['status_counts']}")
+    print(f"Latency:    p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, p99 {latency['p99_ms']} ms, max {latency['max_ms']} ms")
+    print(f"Errors:     {report['error_rate']:.2%}, 429s: {report['rate_429']:.2%}, detection rows written: {rows_written}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""Replays a frame recording through /api/dashboard/analyze-frame-smart and diffs the verdicts.
+
+Recordings are captured from production traffic through the admin API
+(POST /api/admin/recordings/start, see recording.py). Each recorded stream is
+replayed in order by its own client thread, either at the recorded pace
+(--speed 1, or 2 for twice as fast) or back to back (--speed 0). Every
+response is compared with the recorded verdict: a frame differs when the
+weapon/no-weapon verdict flips or when the objects don't pair up by class
+with IoU >= --iou.
+
+Tracked frames depend on timing, so for model comparisons record and replay
+with TRACKER_KEYFRAME_INTERVAL=1, or pass --keyframes-only to compare only
+frames the detector ran on in both runs.
+
+Examples (from the backend directory):
+  # In-process server, stand-in database, as fast as possible
+  JWT_SECRET=dev python -m benchmarks.replay ../recordings/lobby --speed 0 --model candidate.pt
+
+  # Running server, original pace, fail if more than 1% of frames differ
+  python -m benchmarks.replay ../recordings/lobby.*.rec --url http://127.0.0.1:5000 --max-diff-rate 0.01
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from benchmarks.common import install_stub_database, make_token, summarize_latencies, use_scratch_storage
+from benchmarks.loadtest import ANALYZE_PATH, start_in_process_server
+from tracking import iou
+
+
+def load_streams(paths):
+    """Groups the records of every file by stream, each stream in capture order.
+
+    Returns (streams, first timestamp ns, readers); frames stay memory-mapped until the readers are closed.
+    """
+    from recording import RecordingReader
+
+    readers, streams = [], defaultdict(list)
+    for path in paths:
+        reader = RecordingReader(path)
+        readers.append(reader)
+        for record in reader:
+            key = f"camera:{record.camera_id}" if record.camera_id is not None else f"stream:{record.meta.get('stream_id')}"
+            streams[key].append(record)
+    for records in streams.values():
+        records.sort(key=lambda record: record.timestamp_ns)
+    starts = [records[0].timestamp_ns for records in streams.values()]
+    return dict(streams), min(starts) if starts else 0, readers
+
+
+def diff_verdicts(recorded, replayed, min_iou):
+    """Reasons the two verdicts differ (empty when they agree)."""
+    reasons = []
+    if recorded['weapon_detected'] != replayed['weapon_detected']:
+        reasons.append('missed' if recorded['weapon_detected'] else 'new_alert')
+    unmatched = list(replayed['objects'])
+    for obj in recorded['objects']:
+        best = max((candidate for candidate in unmatched if candidate['class_id'] == obj['class_id']),
+                   key=lambda candidate: iou(obj['bbox'], candidate['bbox']), default=None)
+        if best is not None and iou(obj['bbox'], best['bbox']) >= min_iou:
+            unmatched.remove(best)
+        else:
+            reasons.append('object_lost')
+            break
+    if unmatched:
+        reasons.append('object_added')
+    return reasons
+
+
+class Results:
+    def __init__(self, min_iou, keyframes_only):
+        self.min_iou = min_iou
+        self.keyframes_only = keyframes_only
+        self._lock = threading.Lock()
+        self.latencies_ms = []
+        self.statuses = Counter()
+        self.reasons = Counter()
+        self.compared = 0
+        self.differing = 0
+        self.examples = []
+
+    def record(self, record, status, elapsed_ms, payload):
+        from recording import verdict_of
+
+        with self._lock:
+            self.statuses[str(status)] += 1
+            if status != 200:
+                return
+            self.latencies_ms.append(elapsed_ms)
+            recorded = record.meta['verdict']
+            replayed = verdict_of(payload)
+            if self.keyframes_only and not (recorded['keyframe'] and replayed['keyframe']):
+                return
+            self.compared += 1
+            reasons = diff_verdicts(recorded, replayed, self.min_iou)
+            if reasons:
+                self.differing += 1
+                self.reasons.update(reasons)
+                if len(self.examples) < 20:
+                    self.examples.append({"timestamp_ns": record.timestamp_ns, "camera_id": record.camera_id,
+                                          "reasons": reasons, "recorded": recorded, "replayed": replayed})
+
+
+class StreamReplayer(threading.Thread):
+    """Sends one recorded stream's frames in order, paced by their recorded timestamps."""
+
+    def __init__(self, key, records, base_url, token, first_ns, started, speed, results):
+        super().__init__(name=f'replay-{key}', daemon=True)
+        self.records = records
+        self.url = base_url + ANALYZE_PATH
+        self.token = token
+        self.first_ns = first_ns
+        self.started = started
+        self.speed = speed
+        self.results = results
+
+    def run(self):
+        import requests
+
+        session = requests.Session()
+        headers = {'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'}
+        for record in self.records:
+            if self.speed > 0:
+                due = self.started + (record.timestamp_ns - self.first_ns) / 1e9 / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            body = {
+                'image_b64': base64.b64encode(record.frame).decode('ascii'),
+                'stream_id': record.meta.get('stream_id'),
+                'realtime': True,
+                'silent': True
+            }
+            if record.camera_id is not None:
+                body['camera_id'] = record.camera_id
+            started = time.monotonic()
+            try:
+                response = session.post(self.url, data=json.dumps(body), headers=headers, timeout=30)
+                status = response.status_code
+                payload = response.json() if response.content else {}
+            except Exception:
+                status, payload = 'error', {}
+            self.results.record(record, status, (time.monotonic() - started) * 1000.0, payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a frame recording and diff the verdicts.")
+    parser.add_argument('recordings', nargs='+',
+                        help="Recording data files (.rec), or a recording name prefix such as ../recordings/lobby.")
+    parser.add_argument('--url', help="Base URL of a running backend. Default: start one in-process.")
+    parser.add_argument('--db', choices=['stub', 'postgres'], default='stub',
+                        help="In-process only: 'stub' replaces Postgres with an in-memory stand-in.")
+    parser.add_argument('--model', help="YOLO weights for the in-process server (sets YOLO_MODEL_PATH).")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Playback speed relative to the recording; 0 sends every stream back to back.")
+    parser.add_argument('--iou', type=float, default=0.5, help="Minimum IoU for a replayed object to match a recorded one.")
+    parser.add_argument('--keyframes-only', action='store_true', help="Only compare frames the detector ran on in both runs.")
+    parser.add_argument('--user-id', type=int, default=1, help="user_id put in the JWTs (must exist with --db postgres).")
+    parser.add_argument('--max-diff-rate', type=float, help="Exit with status 1 when more frames than this fraction differ.")
+    parser.add_argument('--output', help="Write machine-readable results to this JSON file.")
+    args = parser.parse_args()
+    if not args.url and args.db == 'stub':
+        use_scratch_storage()  # Before recording.py is imported, so the replay itself is never captured
+    from recording import recording_files
+
+    paths = []
+    for target in args.recordings:
+        if target.endswith('.rec'):
+            paths.append(target)
+        else:
+            paths.extend(recording_files(os.path.basename(target), os.path.dirname(target) or '.'))
+    if not paths:
+        parser.error("No recording files found.")
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        if args.model:
+            os.environ['YOLO_MODEL_PATH'] = args.model
+        os.environ.setdefault('PARTITION_MAINTENANCE_INTERVAL_MINUTES', '0')
+        server, base_url = start_in_process_server('127.0.0.1', 0)
+        if args.db == 'stub':
+            install_stub_database()
+
+    streams, first_ns, readers = load_streams(paths)
+    frames = sum(len(records) for records in streams.values())
+    token = make_token(args.user_id)
+    results = Results(args.iou, args.keyframes_only)
+
+    started = time.monotonic()
+    replayers = [StreamReplayer(key, records, base_url, token, first_ns, started, args.speed, results)
+                 for key, records in streams.items()]
+    for replayer in replayers:
+        replayer.start()
+    for replayer in replayers:
+        replayer.join()
+    elapsed = time.monotonic() - started
+
+    diff_rate = round(results.differing / results.compared, 4) if results.compared else 0.0
+    report = {
+        "benchmark": "replay",
+        "config": {
+            "recordings": paths,
+            "speed": args.speed,
+            "iou": args.iou,
+            "keyframes_only": args.keyframes_only,
+            "server": args.url or "in-process",
+            "db": "external" if args.url else args.db,
+            "model": os.getenv('YOLO_MODEL_PATH'),
+        },
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "frames": frames,
+        "streams": len(streams),
+        "elapsed_s": round(elapsed, 3),
+        "achieved_fps": round(len(results.latencies_ms) / elapsed, 3) if elapsed else 0.0,
+        "latency": summarize_latencies(results.latencies_ms),
+        "status_counts": dict(results.statuses),
+        "compared": results.compared,
+        "differing": results.differing,
+        "diff_rate": diff_rate,
+        "diff_reasons": dict(results.reasons),
+        "examples": results.examples,
+    }
+
+    latency = report["latency"]
+    print(f"Replayed:   {frames} frames from {len(streams)} stream(s) in {elapsed:.1f}s "
+          f"({report['achieved_fps']} FPS, speed {args.speed or 'max'}), statuses {report['status_counts']}")
+    print(f"Latency:    p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, p99 {latency['p99_ms']} ms, max {latency['max_ms']} ms")
+    print(f"Verdicts:   {results.differing}/{results.compared} differ ({diff_rate:.2%}) {report['diff_reasons']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    del streams, replayers  # Release the frame views before unmapping
+    for reader in readers:
+        reader.close()
+    if server:
+        server.shutdown()
+    if args.max_diff_rate is not None and diff_rate > args.max_diff_rate:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Per-stage micro-benchmarks for the analyze-frame-smart hot path.
+
+Times each stage on its own with fixed fixture frames:
+    b64decode, imdecode, preprocess, inference, postprocess, serialize,
+    serialize_msgpack, spool_append, spool_replay
+and compares the medians against a saved baseline, so a regression in
+end-to-end latency can be pinned to one stage without a profiler.
+
+serialize and serialize_msgpack time the encoders serialization.respond()
+uses; serialize_msgpack is skipped when msgpack is not installed.
+
+spool_append is what the request pays to persist a detection (hashing the
+evidence frame and appending it with the spool record). spool_replay is the drainer's side: one call replays
+a freshly written segment of --replay-rows records with spool.replay_segment
+(execute_values + ON CONFLICT). Run it with --db postgres to time the real
+insert; the rows it writes are deleted again afterwards.
+
+Examples (from the backend directory):
+  python -m benchmarks.stage_bench --model yolov8n.pt --save-baseline bench_baseline.json
+  python -m benchmarks.stage_bench --model yolov8n.pt --baseline bench_baseline.json --tolerance 0.25
+  python -m benchmarks.stage_bench --model yolov8n.pt --max-ms inference=40 --max-ms imdecode=2
+
+Exits with status 1 when a stage regresses past the tolerance or a --max-ms limit.
+
+The same stages run as a pytest-benchmark suite (tests/test_stage_bench.py),
+which keeps its history with --benchmark-autosave and gates with
+--benchmark-compare-fail.
+"""
+import argparse
+import base64
+import contextlib
+import glob
+import json
+import os
+import platform
+import tempfile
+import time
+
+from benchmarks.common import install_stub_database, load_frames, summarize_latencies, use_scratch_storage
+
+STAGES = ['b64decode', 'imdecode', 'preprocess', 'inference', 'postprocess', 'serialize', 'serialize_msgpack',
+          'spool_append', 'spool_replay']
+DETECTED_OBJECTS = [
+    {'object': 'knife', 'confidence': 0.9, 'class_id': 2, 'bbox': [0.1, 0.2, 0.3, 0.5]},
+    {'object': 'pistol', 'confidence': 0.6, 'class_id': 4, 'bbox': [0.55, 0.4, 0.7, 0.6]},
+]
+
+
+def time_stage(fn, inputs, iterations, warmup):
+    """Runs fn over the inputs round-robin; returns per-call latencies in ms (warm-up calls excluded)."""
+    for i in range(warmup):
+        fn(inputs[i % len(inputs)])
+    latencies_ms = []
+    for i in range(iterations):
+        item = inputs[i % len(inputs)]
+        started = time.perf_counter_ns()
+        fn(item)
+        latencies_ms.append((time.perf_counter_ns() - started) / 1e6)
+    return latencies_ms
+
+
+def build_replay_segments(directory, segments, rows):
+    """Writes `segments` sealed spool segments of `rows` detections each. Returns (paths, event_ids)."""
+    import uuid
+    from datetime import datetime, timezone
+
+    import spool
+    from inference import pack_objects
+
+    writer = spool.SpoolWriter(directory=directory, segment_bytes=1 << 40, seal_ms=3_600_000)
+    objects = pack_objects(DETECTED_OBJECTS)
+    event_ids = []
+    for _ in range(segments):
+        for _ in range(rows):
+            event_id = str(uuid.uuid4())
+            event_ids.append(event_id)
+            writer.append(spool.encode_record({
+                'event_id': event_id,
+                'camera_id': None,  # No camera row needs to exist in the target database
+                'detection_type': 'weapon',
+                'confidence': 0.9,
+                'detected_at': datetime.now(timezone.utc).isoformat(),
+                'image_path': None,
+                'details': 'stage_bench',
+                'objects': objects,
+            }))
+        writer.close()  # Seals the segment; the next append opens a new one
+    paths = sorted(glob.glob(os.path.join(directory, '*.log')), key=spool._segment_sort_key)
+    return paths, event_ids
+
+
+def delete_replayed_rows(conn, event_ids):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM detection_logs WHERE event_id = ANY(%s::uuid[])", (event_ids,))
+    conn.commit()
+
+
+@contextlib.contextmanager
+def prepared_stages(args):
+    """Loads the model and fixtures and yields ({stage: (fn, inputs)}, weapon summaries of the fixtures).
+
+    Shared by run_stages() and the pytest-benchmark suite in tests/test_stage_bench.py.
+    """
+    if args.model:
+        os.environ['YOLO_MODEL_PATH'] = args.model
+    if args.db == 'stub':
+        use_scratch_storage()  # Spooled rows and evidence frames go to a temp dir, not detection_images/
+    from flask import Flask
+    import inference
+    import serialization
+
+    frames = load_frames(args.frames, count=args.fixtures)
+    frames_b64 = [base64.b64encode(frame).decode('ascii') for frame in frames]
+    app = Flask(__name__)
+
+    with app.app_context():
+        model = inference.get_optimized_yolo_model()
+
+        # Each stage's inputs are the previous stage's outputs, computed once up front
+        images = [inference.decode_frame(frame) for frame in frames]
+        resized = [inference.preprocess_frame(image) for image in images]
+        results = [inference.run_inference(model, image, args.conf, imgsz=inference.INPUT_SIZE) for image in resized]
+        summaries = [inference.summarize_weapon_detections(result, args.conf) for result in results]
+        payloads = [{
+            "success": True,
+            "weapon_detected": bool(weapon_types),
+            "weapon_types": weapon_types,
+            "confidence": confidence,
+            "description": f"🚨 {', '.join(weapon_types)} detected",
+            "detected_objects": detected_objects,
+            "control": {"interval_ms": 200, "width": 320, "height": 320, "jpeg_quality": 0.6}
+        } for weapon_types, confidence, detected_objects in summaries]
+
+        from routes.dashboard_routes import save_detection_silent
+        import db_utils
+        import spool
+        if args.db == 'stub':
+            install_stub_database()
+        replay_conn = None
+        replay_event_ids = []
+        replay_segments = []
+        if 'spool_replay' in args.stages:
+            # Every call replays a segment it hasn't seen, so inserts aren't answered by ON CONFLICT
+            replay_segments, replay_event_ids = build_replay_segments(
+                tempfile.mkdtemp(prefix='camwatch-bench-replay-'), args.warmup + args.replay_iterations, args.replay_rows)
+            replay_conn = db_utils.get_db_connection()
+
+        stage_fns = {
+            'b64decode': (inference.decode_base64, frames_b64),
+            'imdecode': (inference.decode_frame, frames),
+            'preprocess': (inference.preprocess_frame, images),
+            'inference': (lambda image: inference.run_inference(model, image, args.conf, imgsz=inference.INPUT_SIZE), resized),
+            'postprocess': (lambda result: inference.summarize_weapon_detections(result, args.conf), results),
+            'serialize': (serialization.dumps_json, payloads),
+            'spool_append': (lambda frame: save_detection_silent(frame, DETECTED_OBJECTS), frames),
+            'spool_replay': (lambda path: spool.replay_segment(replay_conn, path, args.replay_rows), replay_segments),
+        }
+        if serialization.msgpack is not None:
+            stage_fns['serialize_msgpack'] = (serialization.dumps_msgpack, payloads)
+        try:
+            yield stage_fns, summaries
+        finally:
+            if replay_conn is not None:
+                delete_replayed_rows(replay_conn, replay_event_ids)
+                replay_conn.close()
+
+
+def stage_iterations(args, stage):
+    return {'inference': args.inference_iterations, 'spool_replay': args.replay_iterations}.get(stage, args.iterations)
+
+
+def run_stages(args):
+    report = {}
+    with prepared_stages(args) as (stage_fns, summaries):
+        for stage in args.stages:
+            if stage not in stage_fns:
+                print(f"Skipping {stage}: msgpack is not installed")
+                continue
+            fn, inputs = stage_fns[stage]
+            report[stage] = summarize_latencies(time_stage(fn, inputs, stage_iterations(args, stage), args.warmup))
+        objects_per_frame = sum(len(summary[2]) for summary in summaries) / len(summaries)
+    return report, objects_per_frame
+
+
+def compare(report, baseline, tolerance, min_delta_ms, max_ms):
+    """Returns rows of (stage, median, baseline median, delta %, status) and whether anything regressed."""
+    rows = []
+    regressed = False
+    for stage, stats in report.items():
+        median = stats['p50_ms']
+        base = baseline.get(stage, {}).get('p50_ms') if baseline else None
+        delta_pct = ((median - base) / base * 100.0) if base else None
+        status = 'ok'
+        if base is not None and median > base * (1 + tolerance) and median - base > min_delta_ms:
+            status = 'REGRESSED'
+        if stage in max_ms and median > max_ms[stage]:
+            status = f'OVER LIMIT ({max_ms[stage]} ms)'
+        if status != 'ok':
+            regressed = True
+        rows.append((stage, median, base, delta_pct, status))
+    return rows, regressed
+
+
+def parse_limits(values):
+    limits = {}
+    for value in values or []:
+        stage, _, limit = value.partition('=')
+        if stage not in STAGES or not limit:
+            raise SystemExit(f"--max-ms expects STAGE=MS with STAGE in {', '.join(STAGES)}")
+        limits[stage] = float(limit)
+    return limits
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Per-stage micro-benchmarks for the detection hot path.")
+    parser.add_argument('--model', help="YOLO weights to benchmark (sets YOLO_MODEL_PATH); use a tiny model in CI.")
+    parser.add_argument('--frames', help="Directory of fixture frames. Default: deterministic synthetic frames.")
+    parser.add_argument('--fixtures', type=int, default=8, help="Number of synthetic fixture frames.")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--iterations', type=int, default=200, help="Timed calls per stage.")
+    parser.add_argument('--inference-iterations', type=int, default=30, help="Timed calls for the inference stage.")
+    parser.add_argument('--warmup', type=int, default=5, help="Untimed calls per stage before timing.")
+    parser.add_argument('--conf', type=float, default=0.15, help="Confidence threshold for inference/postprocess.")
+    parser.add_argument('--replay-iterations', type=int, default=20, help="Timed calls for the spool_replay stage.")
+    parser.add_argument('--replay-rows', type=int, default=500, help="Detections per replayed segment (one batch).")
+    parser.add_argument('--db', choices=['stub', 'postgres'], default='stub',
+                        help="Target of the spool_replay stage (stub only times reading and framing the segment).")
+    parser.add_argument('--baseline', help="Baseline JSON (from --save-baseline) to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.20, help="Allowed median slowdown vs baseline (0.20 = 20%%).")
+    parser.add_argument('--min-delta-ms', type=float, default=0.05, help="Ignore slowdowns smaller than this.")
+    parser.add_argument('--max-ms', action='append', metavar='STAGE=MS', help="Absolute median limit for a stage.")
+    parser.add_argument('--save-baseline', help="Write this run's results as a baseline file.")
+    parser.add_argument('--output', help="Write the full report (with comparison) as JSON.")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    max_ms = parse_limits(args.max_ms)
+    report, objects_per_frame = run_stages(args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['stages']
+    rows, regressed = compare(report, baseline, args.tolerance, args.min_delta_ms, max_ms)
+
+    print(f"{'stage':<18} {'p50 ms':>10} {'p95 ms':>10} {'baseline':>10} {'delta':>9}  status")
+    for stage, median, base, delta_pct, status in rows:
+        base_text = f"{base:.3f}" if base is not None else '-'
+        delta_text = f"{delta_pct:+.1f}%" if delta_pct is not None else '-'
+        print(f"{stage:<18} {median:>10.3f} {report[stage]['p95_ms']:>10.3f} {base_text:>10} {delta_text:>9}  {status}")
+    print(f"(postprocess fixtures average {objects_per_frame:.1f} weapon boxes per frame)")
+
+    result = {
+        "benchmark": "stage_bench",
+        "model": os.getenv('YOLO_MODEL_PATH'),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "stages": report,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    if args.output:
+        result["comparison"] = [
+            {"stage": stage, "p50_ms": median, "baseline_p50_ms": base, "delta_pct": delta_pct, "status": status}
+            for stage, median, base, delta_pct, status in rows
+        ]
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    raise SystemExit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
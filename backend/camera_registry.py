@@ -0,0 +1,159 @@
+"""In-process camera registry.
+
+Loads the cameras table once and serves per-camera settings (active flag, ROI,
+confidence threshold) from memory so per-frame code never queries Postgres.
+Routes that write to the cameras table push the new row in with upsert()/remove();
+other worker processes pick the change up when their copy is older than
+CAMERA_REGISTRY_TTL, reloaded in a background thread while get() keeps serving
+the old copy. Every write bumps a version counter; a load that overlapped a
+write drops its result, since its SELECT may predate the row just pushed in,
+and the next get() loads again.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import psycopg2.extras
+
+from db_utils import get_db_connection
+
+CAMERA_COLUMNS = "id, name, location, ip_address, rtsp_url, is_active, roi, confidence_threshold"
+
+# Other worker processes see writes made elsewhere after at most this many seconds
+CAMERA_REGISTRY_TTL = float(os.getenv('CAMERA_REGISTRY_TTL', 60))
+# After a failed load, get() leaves the database alone for this long
+CAMERA_REGISTRY_RETRY = float(os.getenv('CAMERA_REGISTRY_RETRY', 5))
+
+logger = logging.getLogger(__name__)
+
+
+class CameraRegistry:
+    """Copy-on-write map of camera id -> settings. Reads are lock-free; writers swap in a new map."""
+
+    def __init__(self):
+        self._cameras = {}
+        self._snapshot = ([], 'cameras-empty')  # (sorted list, etag), rebuilt on every write
+        self._loaded_at = None
+        self._failed_at = None
+        self._refreshing = False
+        self._version = 0  # Bumped by every write-through, so an overlapping load() can tell it is stale
+        self._write_lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._loaded_at is not None
+
+    def load(self):
+        """(Re)loads every camera from the database. Returns False if a write overlapped and the result was dropped."""
+        version = self._version
+        conn = None
+        try:
+            conn = get_db_connection()
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                cur.execute(f"SELECT {CAMERA_COLUMNS} FROM cameras ORDER BY id ASC")
+                cameras = {row['id']: dict(row) for row in cur.fetchall()}
+        finally:
+            if conn:
+                conn.close()
+        with self._write_lock:
+            if self._version != version:
+                logger.info("Camera registry changed during a reload; dropping the reloaded copy")
+                return False
+            self._publish(cameras)
+            self._loaded_at = time.monotonic()
+        return True
+
+    def ensure_loaded(self, max_age=None):
+        """Loads the registry if it never was, or if it is older than max_age seconds."""
+        loaded_at = self._loaded_at
+        if loaded_at is None or (max_age is not None and time.monotonic() - loaded_at > max_age):
+            self.load()
+
+    def get(self, camera_id):
+        """O(1) lookup of one camera's settings; None for unknown cameras.
+
+        Only the very first call waits for the database; later refreshes happen in
+        the background, and failed loads are retried after CAMERA_REGISTRY_RETRY.
+        """
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            if self._may_retry():
+                try:
+                    self.load()
+                except psycopg2.Error as e:
+                    logger.error(f"❌ Camera registry load failed: {e}")
+                    self._failed_at = time.monotonic()
+        elif time.monotonic() - loaded_at > CAMERA_REGISTRY_TTL:
+            self._refresh_in_background()
+        return self._cameras.get(camera_id)
+
+    def _may_retry(self):
+        failed_at = self._failed_at
+        return failed_at is None or time.monotonic() - failed_at >= CAMERA_REGISTRY_RETRY
+
+    def _refresh_in_background(self):
+        with self._write_lock:
+            if self._refreshing or not self._may_retry():
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='camera-registry-refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.load()
+            self._failed_at = None
+        except psycopg2.Error as e:
+            logger.error(f"❌ Camera registry refresh failed, serving the cached cameras: {e}")
+            self._failed_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def all(self):
+        """Returns (cameras sorted by id, unquoted etag)."""
+        self.ensure_loaded(CAMERA_REGISTRY_TTL)
+        return self._snapshot
+
+    def upsert(self, camera):
+        """Write-through: stores the row a route just wrote to the database."""
+        camera = dict(camera)
+        with self._write_lock:
+            self._version += 1
+            if self._loaded_at is None:
+                return  # The first load() will read it from the database anyway
+            cameras = dict(self._cameras)
+            cameras[camera['id']] = {**cameras.get(camera['id'], {}), **camera}
+            self._publish(cameras)
+
+    def upsert_many(self, cameras):
+        """Write-through for a bulk import: one snapshot rebuild for the whole batch."""
+        with self._write_lock:
+            self._version += 1
+            if self._loaded_at is None:
+                return
+            merged = dict(self._cameras)
+            for camera in cameras:
+                camera = dict(camera)
+                merged[camera['id']] = {**merged.get(camera['id'], {}), **camera}
+            self._publish(merged)
+
+    def remove(self, camera_id):
+        with self._write_lock:
+            self._version += 1
+            if self._loaded_at is None or camera_id not in self._cameras:
+                return
+            cameras = dict(self._cameras)
+            del cameras[camera_id]
+            self._publish(cameras)
+
+    def _publish(self, cameras):
+        # Caller holds _write_lock
+        ordered = [cameras[camera_id] for camera_id in sorted(cameras)]
+        digest = hashlib.sha1(json.dumps(ordered, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self._cameras = cameras
+        self._snapshot = (ordered, f'cameras-{digest[:16]}')
+
+
+camera_registry = CameraRegistry()
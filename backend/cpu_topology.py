@@ -0,0 +1,278 @@
+"""CPU layout for inference, request and I/O threads.
+
+By default torch starts one intra-op thread per logical CPU in every worker,
+OpenCV adds its own pool, and the request threads and background savers
+compete with both, so a many-core host runs several times more runnable
+threads than it has cores and inference latency swings with the scheduler.
+
+detect_topology() reads the usable CPUs (affinity mask and cgroup quota) and
+groups them into physical cores by NUMA node and package. plan_layout() then
+splits them:
+  * io cores (CPU_IO_CORES, default one per eight physical cores) run the
+    request threads' decode/encode work and the background executors;
+  * the remaining physical cores are divided into one contiguous set per
+    worker process, and each worker's torch/OpenMP pool gets one thread per
+    core divided by INFERENCE_CONCURRENCY, so concurrent inferences in one
+    worker don't oversubscribe its cores either. SMT siblings stay with the
+    io threads unless CPU_SMT_INFERENCE=1.
+
+CPU_LAYOUT=pin (default) also sets CPU affinity: the worker process to its
+inference + io CPUs and background threads (pin_current_thread) to the io
+CPUs only. CPU_LAYOUT=threads only sets the thread counts, for hosts where the
+orchestrator already pins; CPU_LAYOUT=off leaves the library defaults.
+When a cgroup quota is the only limit (the usual container: every host CPU in
+the affinity mask), the thread counts are sized to the quota but nothing is
+pinned, as if CPU_LAYOUT=threads: every such container would pick the same
+first CPUs of the host and pile onto them.
+
+app.py applies the single-process layout; serve.py plans for all workers in
+the master and applies each worker's share in post_fork.
+"""
+import glob
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+CPU_LAYOUT = os.getenv('CPU_LAYOUT', 'pin').lower()                        # pin | threads | off
+CPU_IO_CORES = int(os.getenv('CPU_IO_CORES', -1))                          # -1 = auto
+CPU_SMT_INFERENCE = os.getenv('CPU_SMT_INFERENCE', 'false').lower() == 'true'
+CPU_CV2_THREADS = int(os.getenv('CPU_CV2_THREADS', 1))                     # Frames are decoded per request thread
+WORKER_TORCH_THREADS = int(os.getenv('WORKER_TORCH_THREADS', 0))           # 0 = from the layout
+INFERENCE_CONCURRENCY = int(os.getenv('INFERENCE_CONCURRENCY', 2))        # Same setting admission.py enforces
+
+_SYSFS_CPU = '/sys/devices/system/cpu'
+_SYSFS_NODE = '/sys/devices/system/node'
+_THREAD_ENV = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+class CpuTopology:
+    def __init__(self, cpus, cores, nodes, packages, quota):
+        self.cpus = cpus          # Usable logical CPUs
+        self.cores = cores        # One tuple of sibling logical CPUs per physical core, grouped by node/package
+        self.nodes = nodes
+        self.packages = packages
+        self.quota = quota        # cgroup CPU limit in CPUs, or None
+
+
+class WorkerLayout:
+    def __init__(self, slot, inference_cpus, io_cpus, torch_threads, cv2_threads):
+        self.slot = slot
+        self.inference_cpus = inference_cpus
+        self.io_cpus = io_cpus
+        self.torch_threads = torch_threads
+        self.cv2_threads = cv2_threads
+
+    @property
+    def cpus(self):
+        return sorted(set(self.inference_cpus) | set(self.io_cpus))
+
+
+class CpuLayout:
+    def __init__(self, topology, mode, io_cpus, workers, concurrency):
+        self.topology = topology
+        self.mode = mode
+        self.io_cpus = io_cpus
+        self.workers = workers
+        self.concurrency = concurrency
+
+    def for_slot(self, slot):
+        return self.workers[slot % len(self.workers)]
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in (text or '').split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        elif part.strip():
+            cpus.append(int(part))
+    return cpus
+
+
+def format_cpulist(cpus):
+    """[0, 1, 2, 3, 8] -> '0-3,8'"""
+    ranges, cpus = [], sorted(cpus)
+    for cpu in cpus:
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f"{start}-{end}" if end > start else str(start) for start, end in ranges) or '-'
+
+
+def _cgroup_quota():
+    cpu_max = _read('/sys/fs/cgroup/cpu.max')  # cgroup v2: "<quota> <period>" or "max <period>"
+    if cpu_max:
+        quota, period = cpu_max.split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    quota = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')  # cgroup v1
+    period = _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def detect_topology():
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+
+    node_of = {}
+    for node_dir in glob.glob(os.path.join(_SYSFS_NODE, 'node[0-9]*')):
+        node = int(os.path.basename(node_dir)[4:])
+        for cpu in parse_cpulist(_read(os.path.join(node_dir, 'cpulist'))):
+            node_of[cpu] = node
+
+    siblings = {}
+    for cpu in cpus:
+        base = os.path.join(_SYSFS_CPU, f'cpu{cpu}', 'topology')
+        package = _read(os.path.join(base, 'physical_package_id'))
+        core = _read(os.path.join(base, 'core_id'))
+        key = (node_of.get(cpu, 0), int(package or 0), int(core) if core is not None else cpu)
+        siblings.setdefault(key, []).append(cpu)
+
+    return CpuTopology(
+        cpus=cpus,
+        cores=[tuple(sorted(siblings[key])) for key in sorted(siblings, key=lambda key: (key[0], key[1], min(siblings[key])))],
+        nodes=len({key[0] for key in siblings}),
+        packages=len({key[1] for key in siblings}),
+        quota=_cgroup_quota(),
+    )
+
+
+def plan_layout(topology, workers=1, mode=CPU_LAYOUT, io_cores=CPU_IO_CORES, smt_inference=CPU_SMT_INFERENCE,
+                concurrency=INFERENCE_CONCURRENCY, torch_threads=WORKER_TORCH_THREADS, cv2_threads=CPU_CV2_THREADS):
+    """Splits the topology's cores between the io threads and `workers` inference workers."""
+    workers = max(1, workers)
+    concurrency = max(1, concurrency)
+    cores = list(topology.cores)
+    if topology.quota and topology.quota < len(cores):
+        cores = cores[:max(1, int(topology.quota))]  # More threads than the quota only buys throttling
+        if mode == 'pin':
+            mode = 'threads'  # Which CPUs the quota gets is up to the scheduler, not the first N of the host
+
+    if io_cores < 0:
+        io_cores = 0 if len(cores) < 4 else max(1, len(cores) // 8)
+    io_cores = min(io_cores, len(cores) - 1)
+    # Take io cores from the end, so worker sets start at CPU 0 and stay contiguous within a node
+    inference_cores, reserved = cores[:len(cores) - io_cores], cores[len(cores) - io_cores:]
+
+    io_cpus = [cpu for core in reserved for cpu in core]
+    if not smt_inference:
+        io_cpus += [cpu for core in inference_cores for cpu in core[1:]]
+    if not io_cpus:
+        io_cpus = [cpu for core in cores for cpu in core]  # Small host: everything shares
+
+    layouts = []
+    for slot in range(workers):
+        if len(inference_cores) >= workers:
+            share, extra = divmod(len(inference_cores), workers)
+            start = slot * share + min(slot, extra)
+            assigned = inference_cores[start:start + share + (1 if slot < extra else 0)]
+        else:
+            assigned = [inference_cores[slot % len(inference_cores)]]  # More workers than cores: they share
+        inference_cpus = [cpu for core in assigned for cpu in (core if smt_inference else core[:1])]
+        threads = torch_threads or max(1, len(inference_cpus) // concurrency)
+        layouts.append(WorkerLayout(slot, sorted(inference_cpus), sorted(io_cpus), threads, cv2_threads))
+    return CpuLayout(topology, mode, sorted(io_cpus), layouts, concurrency)
+
+
+def format_report(layout, slots=None):
+    topology = layout.topology
+    quota = f", cgroup quota {topology.quota:.1f} CPUs" if topology.quota else ""
+    if topology.quota and topology.quota < len(topology.cores):
+        quota += " (threads sized to the quota, CPUs not pinned; CPU lists below are nominal)"
+    lines = [
+        f"CPU layout ({layout.mode}): {len(topology.cpus)} usable CPUs = {len(topology.cores)} physical cores, "
+        f"{topology.packages} package(s), {topology.nodes} NUMA node(s){quota}",
+        f"  io/request threads : CPUs {format_cpulist(layout.io_cpus)}",
+    ]
+    for worker in layout.workers if slots is None else [layout.for_slot(slot) for slot in slots]:
+        lines.append(
+            f"  worker {worker.slot} inference : CPUs {format_cpulist(worker.inference_cpus)} "
+            f"(torch {worker.torch_threads} x {layout.concurrency} concurrent, cv2 {worker.cv2_threads})"
+        )
+    return '\n'.join(lines)
+
+
+_topology = None   # Detected once, in the master when pre-forking, so every worker splits the same CPUs
+_current = None    # (layout mode, WorkerLayout) applied to this process
+_deferred = False
+
+
+def get_topology():
+    global _topology
+    if _topology is None:
+        _topology = detect_topology()
+    return _topology
+
+
+def defer_to_workers():
+    """Called by serve.py: the pre-fork master leaves the layout to post_fork."""
+    global _deferred
+    _deferred = True
+
+
+def apply_layout(layout, slot=0):
+    """Applies one worker's share to this process. Returns the WorkerLayout, or None when CPU_LAYOUT=off."""
+    global _current
+    if layout.mode == 'off':
+        return None
+    worker = layout.for_slot(slot)
+    for name in _THREAD_ENV:
+        os.environ[name] = str(worker.torch_threads)  # Read by torch/MKL/OpenBLAS when they load
+    if layout.mode == 'pin' and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, worker.cpus)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not set CPU affinity to {format_cpulist(worker.cpus)}: {e}")
+    _current = (layout.mode, worker)
+    apply_library_threads()
+    return worker
+
+
+def apply_library_threads():
+    """Sets the torch and OpenCV pools of the applied layout, for libraries that are already loaded.
+
+    inference.py calls this again after it imports them.
+    """
+    if _current is None:
+        return
+    worker = _current[1]
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(worker.torch_threads)
+    if 'cv2' in sys.modules:
+        sys.modules['cv2'].setNumThreads(worker.cv2_threads)
+
+
+def pin_current_thread(role='io'):
+    """Restricts the calling thread to the io CPUs (background executors, spool threads)."""
+    if _current is None or _current[0] != 'pin' or role != 'io' or not hasattr(os, 'sched_setaffinity'):
+        return
+    try:
+        os.sched_setaffinity(0, _current[1].io_cpus)  # pid 0: the calling thread only on Linux
+    except OSError:
+        pass
+
+
+def configure_process(log=None):
+    """Plans and applies the single-process layout (app.py). Returns the layout, or None if deferred/off."""
+    if _deferred or CPU_LAYOUT == 'off':
+        return None
+    layout = plan_layout(get_topology(), workers=1)
+    apply_layout(layout)
+    (log or logger).info(format_report(layout))
+    return layout
@@ -2,12 +2,15 @@ import psycopg2
 import psycopg2.extras
 import os
 import hashlib
+import time
 from dotenv import load_dotenv
+from metrics import DB_CONNECT_SECONDS, DB_ERRORS
 
 load_dotenv() # Load environment variables from .env
 
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database using .env variables."""
+    started_at = time.perf_counter()
     try:
         conn = psycopg2.connect(
             host=os.getenv('DB_HOST'),
@@ -16,8 +19,10 @@ def get_db_connection():
             password=os.getenv('DB_PASSWORD'),
             port=os.getenv('DB_PORT', '5432') # Default port if not specified
         )
+        DB_CONNECT_SECONDS.observe(time.perf_counter() - started_at)
         return conn
     except psycopg2.OperationalError as e:
+        DB_ERRORS.inc(('connect',))
         print(f"Error connecting to PostgreSQL: {e}")
         raise
 
@@ -70,4 +75,20 @@ def hash_password(password):
     salt = os.urandom(16) # Generate a random salt
     salted_password = salt + password.encode('utf-8')
     hashed_password = hashlib.sha256(salted_password).hexdigest()
-    return salt.hex() + ':' + hashed_password
\ No newline at end of file
+    return salt.hex() + ':' + hashed_password
+
+
+def get_user_active_status(user_id):
+    """Returns a user's is_active flag, or None if the user no longer exists.
+    Database errors are raised so callers can tell "unknown" apart from "inactive".
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            cur.execute("SELECT is_active FROM users WHERE id = %s", (user_id,))
+            row = cur.fetchone()
+            return bool(row[0]) if row else None
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,160 @@
+"""Content-addressed store for evidence frames.
+
+Frames are named by their SHA-256 and sharded two levels deep, so no
+directory grows past a few thousand entries and an identical frame is only
+stored once:
+
+    detection_images/ab/cd/abcd1234....jpg
+
+reference_of() hashes the frame in the request; the bytes travel inside the
+detection's spool record (see spool.py), which is as durable as the row
+itself, and the spool drainer calls store() to write the file (tmp file,
+fsync, rename) before it inserts the row. So a row never points at a frame
+that a crash lost, and the request never waits on the disk.
+detection_logs.image_path stores the relative path. Older
+rows hold flat names (realtime_weapon_<timestamp>.jpg) that the previous
+save code wrote to backend/detection_images/, the default EVIDENCE_DIR, so
+resolve() still finds them there. Move those files along if EVIDENCE_DIR
+is pointed elsewhere.
+
+Resized variants (thumb, preview) are generated on first request by
+variant_path() and cached under detection_images/variants/<size>/.
+
+Storing a frame that already exists only bumps its mtime, so the mtime is
+the last time anything referenced it. collect_garbage() uses that to delete
+frames no retained detection can point to (see partition_maintenance).
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+EVIDENCE_DIR = os.getenv('EVIDENCE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detection_images'))
+
+# Longest side in pixels for each cached variant; 'full' serves the stored frame
+VARIANT_SIZES = {'thumb': 160, 'preview': 640}
+VARIANT_JPEG_QUALITY = int(os.getenv('EVIDENCE_VARIANT_QUALITY', 80))
+
+WRITES = Counter('camwatch_evidence_writes_total',
+                 "Evidence frame writes by outcome (written, deduplicated, failed).", ('outcome',))
+GC_REMOVED = Counter('camwatch_evidence_gc_removed_total', "Evidence frames removed by retention GC.")
+
+
+def reference_for(digest, extension='.jpg'):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def digest_of(reference):
+    """SHA-256 a reference was named after, or None for older flat names."""
+    digest = os.path.splitext(os.path.basename(reference))[0]
+    return digest if len(digest) == 64 and all(c in '0123456789abcdef' for c in digest) else None
+
+
+def resolve(reference):
+    """Absolute path of a stored frame, or None for a reference that points outside the store."""
+    root = os.path.realpath(EVIDENCE_DIR)
+    path = os.path.realpath(os.path.join(root, reference))
+    if not path.startswith(root + os.sep):
+        return None
+    return path
+
+
+def reference_of(data, extension='.jpg'):
+    """The reference (detection_logs.image_path) a frame is stored under."""
+    return reference_for(hashlib.sha256(data).hexdigest(), extension)
+
+
+def store(reference, data):
+    """Writes a frame durably (tmp file, fsync, rename). Raises OSError if it couldn't be stored."""
+    path = resolve(reference)
+    if path is None:
+        raise OSError(f"Evidence reference {reference!r} points outside {EVIDENCE_DIR}")
+    try:
+        if os.path.exists(path):
+            os.utime(path)  # Referenced again: keep it alive for another retention period
+            WRITES.inc(('deduplicated',))
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        WRITES.inc(('written',))
+    except OSError:
+        WRITES.inc(('failed',))
+        raise
+
+
+def variant_path(reference, size):
+    """Path of a stored frame or of its `size` variant, generating the variant on first use.
+
+    Returns None when the frame (or the reference) doesn't exist.
+    """
+    original = resolve(reference)
+    if original is None or not os.path.isfile(original):
+        return None
+    if size == 'full':
+        return original
+    path = resolve(os.path.join('variants', size, reference))
+    if path is None:
+        return None
+    if os.path.isfile(path):
+        return path
+
+    import cv2  # Only workers that serve evidence pay for OpenCV
+
+    image = cv2.imread(original, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = VARIANT_SIZES[size] / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, VARIANT_JPEG_QUALITY])
+    if not ok:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(encoded.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def collect_garbage(cutoff, root=None):
+    """Deletes frames last referenced before `cutoff` (aware datetime). Returns the number removed."""
+    root = root or EVIDENCE_DIR
+    if not os.path.isdir(root):
+        return 0
+    cutoff_ts = cutoff.timestamp()
+    stale_tmp_ts = time.time() - 3600
+    removed = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        removed_here = 0
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                mtime = os.stat(path).st_mtime
+                # Leftover .tmp files are from writers that died mid-write
+                if mtime < cutoff_ts or (filename.endswith('.tmp') and mtime < stale_tmp_ts):
+                    os.remove(path)
+                    removed_here += 1
+            except FileNotFoundError:
+                pass
+        removed += removed_here
+        if dirpath != root and not dirnames and removed_here == len(filenames):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+    if removed:
+        GC_REMOVED.inc(amount=removed)
+        logger.info(f"Removed {removed} evidence frame(s) older than {cutoff:%Y-%m-%d %H:%M}")
+    return removed
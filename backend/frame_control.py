@@ -0,0 +1,78 @@
+"""Server-driven capture settings for the dashboards.
+
+Each analyze response carries a `control` block telling the client when to send
+the next frame and at what size/quality. Quiet streams slow down to ~1 FPS,
+streams with motion or a recent alert run at full rate, and everyone backs off
+when the inference queue is saturated.
+"""
+import os
+import threading
+import time
+
+from admission import inference_admission
+
+FRAME_INTERVAL_MIN_MS = int(os.getenv('FRAME_INTERVAL_MIN_MS', 200))    # alerting / active scenes
+FRAME_INTERVAL_IDLE_MS = int(os.getenv('FRAME_INTERVAL_IDLE_MS', 1000))  # quiet scenes
+FRAME_INTERVAL_MAX_MS = int(os.getenv('FRAME_INTERVAL_MAX_MS', 2000))    # upper bound under overload
+MOTION_THRESHOLD = float(os.getenv('MOTION_THRESHOLD', 0.02))            # mean abs pixel change (0..1)
+
+FULL_RESOLUTION = 320
+REDUCED_RESOLUTION = 256
+MOTION_THUMBNAIL_SIZE = (32, 32)
+
+_streams = {}  # stream key -> [previous thumbnail, motion EWMA, last seen]
+_streams_lock = threading.Lock()
+
+
+def update_motion(stream_key, image):
+    """Scores how much the scene changed since the stream's previous frame (0 = static)."""
+    import cv2  # Deferred like in inference.py: only inference workers load OpenCV
+    import numpy as np
+
+    thumbnail = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), MOTION_THUMBNAIL_SIZE,
+                           interpolation=cv2.INTER_AREA).astype(np.int16)
+    now = time.monotonic()
+    with _streams_lock:
+        state = _streams.get(stream_key)
+        if state is None:
+            # Unknown scene: treat as active until we have something to compare with
+            _streams[stream_key] = [thumbnail, 1.0, now]
+            if len(_streams) > 4096:
+                for key in [k for k, v in _streams.items() if now - v[2] > 600]:
+                    del _streams[key]
+            return 1.0
+        change = float(np.abs(thumbnail - state[0]).mean()) / 255.0
+        state[0] = thumbnail
+        state[1] = 0.5 * state[1] + 0.5 * change
+        state[2] = now
+        return state[1]
+
+
+def suggest_frame_control(stream_key):
+    """Returns the capture settings the client should use for its next frame."""
+    with _streams_lock:
+        state = _streams.get(stream_key)
+        motion = state[1] if state else 1.0
+
+    alerting = inference_admission.has_recent_alert(stream_key)
+    if alerting:
+        interval_ms, quality = FRAME_INTERVAL_MIN_MS, 0.7
+    elif motion >= MOTION_THRESHOLD:
+        interval_ms, quality = FRAME_INTERVAL_MIN_MS, 0.6
+    else:
+        interval_ms, quality = FRAME_INTERVAL_IDLE_MS, 0.5
+
+    # Back off proportionally when more work is queued than the inference budget can run
+    load = (inference_admission.in_flight + inference_admission.queue_depth) / inference_admission.concurrency
+    resolution = FULL_RESOLUTION
+    if load > 1:
+        interval_ms = min(FRAME_INTERVAL_MAX_MS, int(interval_ms * load))
+        if not alerting:
+            resolution = REDUCED_RESOLUTION
+
+    return {
+        "interval_ms": interval_ms,
+        "width": resolution,
+        "height": resolution,
+        "jpeg_quality": quality
+    }
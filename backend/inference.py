@@ -0,0 +1,168 @@
+"""Frame-path stages for weapon detection.
+
+Each stage of analyze-frame-smart lives in its own function so the route, the
+stage benchmarks (benchmarks/stage_bench.py) and future ingestion paths all
+run exactly the same code:
+    decode_frame -> preprocess_frame -> run_inference -> summarize_weapon_detections
+Between keyframes the route skips the last two and propagates tracks instead
+(see tracking.py).
+
+cv2, numpy and ultralytics/torch are imported on first use, not at import
+time, so workers that never run inference (auth/admin only) don't pay for
+them. start_background_warmup() loads the model at boot instead of on the
+first analyze request; /health/ready reports when it is done.
+"""
+import base64
+import os
+import threading
+import time
+
+from flask import current_app
+import cpu_topology
+from metrics import MODEL_WARMUP_SECONDS
+
+YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", r'H:\Code\Final Year Projectsss\CamWatch\code\runs\detect\train3\weights\best.pt')
+INPUT_SIZE = 320
+
+# ✅ YOUR ACTUAL TRAINED WEAPON CLASSES (from data.yaml)
+WEAPON_CLASS_NAMES = {
+    0: 'automatic rifle', 1: 'granade launcher', 2: 'knife',
+    3: 'machine gun', 4: 'pistol', 5: 'rocket launcher',
+    6: 'shotgun', 7: 'sniper', 8: 'sword'
+}
+
+# Global model cache
+yolo_model = None
+model_lock = threading.Lock()
+warmup_error = None  # Set if the background warm-up failed
+
+def get_optimized_yolo_model():
+    """Get cached, optimized YOLO model"""
+    global yolo_model
+    if yolo_model is None:
+        with model_lock:
+            if yolo_model is None:
+                import numpy as np
+                from ultralytics import YOLO  # Pulls in torch: only workers that run inference pay for it
+                cpu_topology.apply_library_threads()  # torch and cv2 are loaded now: size their pools
+
+                current_app.logger.info("🚀 Loading optimized YOLO model...")
+                started_at = time.perf_counter()
+                # model = YOLO('yolov8n.pt')  # Use nano for speed
+                model = YOLO(YOLO_MODEL_PATH)  # Fine-tuned weapons model; override with YOLO_MODEL_PATH
+
+                # Optimize for real-time
+                model.overrides['verbose'] = False
+                model.overrides['save'] = False
+                model.overrides['show'] = False
+
+                # Warm up with dummy image
+                dummy_img = np.zeros((INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8)
+                model(dummy_img, conf=0.3, iou=0.45, imgsz=INPUT_SIZE, verbose=False)
+
+                MODEL_WARMUP_SECONDS.set(time.perf_counter() - started_at)
+                yolo_model = model  # Only publish the model once it is warm
+                current_app.logger.info("⚡ YOLO model optimized for real-time!")
+    return yolo_model
+
+def is_model_ready():
+    return yolo_model is not None
+
+def start_background_warmup(app):
+    """Loads and warms the model in a daemon thread so the first frame doesn't pay for it."""
+    def warm_up():
+        global warmup_error
+        with app.app_context():
+            try:
+                get_optimized_yolo_model()
+            except Exception as e:
+                warmup_error = str(e)
+                app.logger.error(f"❌ Background model warm-up failed: {e}")
+
+    thread = threading.Thread(target=warm_up, name='model-warmup', daemon=True)
+    thread.start()
+    return thread
+
+def decode_base64(image_b64):
+    """Stage 1: base64 payload -> JPEG bytes."""
+    return base64.b64decode(image_b64)
+
+def decode_frame(image_data):
+    """Stage 2: JPEG bytes -> BGR image (None if the bytes are not an image)."""
+    import cv2
+    import numpy as np
+    return cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+
+def preprocess_frame(image, roi=None, size=INPUT_SIZE):
+    """Stage 3: optional ROI crop ([x1, y1, x2, y2] normalized), then resize to the model input size."""
+    import cv2
+    if roi:
+        height, width = image.shape[:2]
+        x1, y1, x2, y2 = roi
+        image = image[int(y1 * height):int(y2 * height), int(x1 * width):int(x2 * width)]
+    return cv2.resize(image, (size, size))
+
+def run_inference(model, image, conf, imgsz=INPUT_SIZE):
+    """Stage 4: YOLO forward pass at `imgsz`.
+
+    Without an explicit imgsz ultralytics letterboxes every frame back up to the
+    640 it was trained at, whatever size preprocess_frame resized it to.
+    """
+    return model(image, conf=conf, imgsz=imgsz, verbose=False, save=False)
+
+def summarize_weapon_detections(results, threshold, roi=None):
+    """Stage 5: YOLO results -> (weapon_types, highest confidence, detected_objects) for weapon classes.
+
+    Each object carries its box as normalized [x1, y1, x2, y2] coordinates of the full frame
+    (mapped back out of the camera's ROI crop when there is one).
+    """
+    weapon_types = []
+    confidence = 0
+    detected_objects = []
+    for result in results:
+        if result.boxes is None:
+            continue
+        height, width = result.orig_shape[:2]
+        for box in result.boxes:
+            class_id = int(box.cls)
+            conf = float(box.conf)
+            if class_id in WEAPON_CLASS_NAMES and conf > threshold:
+                weapon_name = WEAPON_CLASS_NAMES[class_id]
+                weapon_types.append(weapon_name)
+                confidence = max(confidence, conf)
+                x1, y1, x2, y2 = box.xyxy[0].tolist()
+                detected_objects.append({
+                    'object': weapon_name,
+                    'confidence': conf,
+                    'class_id': class_id,
+                    'bbox': to_frame_coords((x1 / width, y1 / height, x2 / width, y2 / height), roi)
+                })
+    return weapon_types, confidence, detected_objects
+
+def pack_objects(detected_objects):
+    """detected_objects -> compact rows for detection_logs.objects: [class_id, conf_milli, x1, y1, x2, y2].
+
+    Confidence is stored in thousandths and the box in 1/10000 of the frame, so a
+    frame's objects stay a few dozen bytes of JSONB.
+    """
+    return [
+        [detected['class_id'], round(detected['confidence'] * 1000)] + [round(v * 10000) for v in detected['bbox']]
+        for detected in detected_objects
+    ]
+
+def unpack_objects(packed):
+    """Inverse of pack_objects, for API responses."""
+    return [{
+        'object': WEAPON_CLASS_NAMES.get(class_id, f"object_{class_id}"),
+        'class_id': class_id,
+        'confidence': conf_milli / 1000.0,
+        'bbox': [v / 10000.0 for v in box]
+    } for class_id, conf_milli, *box in packed or []]
+
+def to_frame_coords(bbox, roi=None):
+    """Maps a box normalized to the (ROI-cropped) model input back to normalized full-frame coordinates."""
+    if roi:
+        rx1, ry1, rx2, ry2 = roi
+        bbox = (rx1 + bbox[0] * (rx2 - rx1), ry1 + bbox[1] * (ry2 - ry1),
+                rx1 + bbox[2] * (rx2 - rx1), ry1 + bbox[3] * (ry2 - ry1))
+    return [round(min(1.0, max(0.0, v)), 4) for v in bbox]
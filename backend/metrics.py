@@ -0,0 +1,250 @@
+"""Prometheus-compatible metrics with per-thread sharded counters.
+
+Hot-path updates never take a lock: every thread increments its own shard and
+only /metrics walks the shards to add them up. Nothing is logged per frame.
+
+    FRAMES_ANALYZED.inc(('3',))
+    STAGE_SECONDS.observe(0.012, ('inference',))
+
+init_app(app) adds per-route request counters/latency histograms and the
+/metrics endpoint. Scrapes need `Authorization: Bearer $METRICS_TOKEN`; with
+no token set the endpoint only answers loopback clients, unless
+METRICS_ALLOW_UNAUTHENTICATED=true opens it explicitly.
+"""
+import bisect
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOW_UNAUTHENTICATED = os.getenv('METRICS_ALLOW_UNAUTHENTICATED', 'false').lower() == 'true'
+
+_LOOPBACK = ('127.0.0.1', '::1')
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+class _ShardedValues:
+    """label tuple -> value, one dict per thread.
+
+    Dead threads' shards are folded into `_retired` whenever a new shard is
+    created and on collect, so short-lived threads (one per request in the dev
+    server) don't accumulate between scrapes.
+    """
+
+    def __init__(self, new_value, merge):
+        self._new_value = new_value
+        self._merge = merge
+        self._local = threading.local()
+        self._shards = []  # (thread, dict)
+        self._shards_lock = threading.Lock()
+        self._retired = {}
+
+    def shard(self):
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = self._local.values = {}
+            with self._shards_lock:  # Once per thread, not per update
+                self._retire_dead_shards()
+                self._shards.append((threading.current_thread(), values))
+        return values
+
+    def _retire_dead_shards(self):
+        # Caller holds _shards_lock
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                # The owner is gone, so nobody writes this shard any more
+                for labels, value in list(values.items()):
+                    self._retired[labels] = self._merge(self._retired.get(labels), value)
+        self._shards = live
+
+    def collect(self):
+        with self._shards_lock:
+            self._retire_dead_shards()
+            totals = dict(self._retired)
+            for _, values in self._shards:
+                for labels, value in list(values.items()):
+                    totals[labels] = self._merge(totals.get(labels), value)
+        return totals
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = _ShardedValues(float, lambda total, value: (total or 0.0) + value)
+        _registry.append(self)
+
+    def inc(self, labels=(), amount=1.0):
+        values = self._values.shard()
+        values[labels] = values.get(labels, 0.0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self._values.collect().items()):
+            yield self.name, self._label_pairs(labels), value
+
+    def _label_pairs(self, labels):
+        return list(zip(self.labelnames, labels))
+
+
+class Histogram(Counter):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+        self._values = _ShardedValues(None, self._merge)
+
+    @staticmethod
+    def _merge(total, value):
+        # Returns a new state: `total` may be the retired state, which must survive the scrape unchanged
+        if total is None:
+            return [list(value[0]), value[1], value[2]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+    def observe(self, seconds, labels=()):
+        values = self._values.shard()
+        state = values.get(labels)
+        if state is None:
+            state = values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        state[1] += seconds
+        state[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self._values.collect().items()):
+            pairs = self._label_pairs(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", pairs + [('le', _format_value(bound))], cumulative
+            yield f"{self.name}_sum", pairs, total
+            yield f"{self.name}_count", pairs, count
+
+
+class Gauge:
+    """A value read at scrape time from a callback returning a number or {label tuple: number}."""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, callback=None, labelnames=(), metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.type = metric_type
+        self._callback = callback
+        self._value = 0.0
+        _registry.append(self)
+
+    def set(self, value):
+        self._value = value
+
+    def samples(self):
+        value = self._callback() if self._callback else self._value
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                yield self.name, list(zip(self.labelnames, labels)), v
+        else:
+            yield self.name, [], value
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def render():
+    """Renders every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        try:
+            for name, pairs, value in metric.samples():
+                label_text = ','.join(f'{key}="{_escape(v)}"' for key, v in pairs)
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text else f"{name} {_format_value(value)}")
+        except Exception as e:
+            lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+    return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    """Times consecutive stages of one request: timer.mark('decode'), timer.mark('inference'), ..."""
+    __slots__ = ('last', 'timings')
+
+    def __init__(self):
+        self.last = time.perf_counter()
+        self.timings = {}
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        self.timings[stage] = elapsed
+        STAGE_SECONDS.observe(elapsed, (stage,))
+        return elapsed
+
+
+# --- Metrics shared across modules ---
+HTTP_REQUESTS = Counter('camwatch_http_requests_total', "HTTP requests by route, method and status.",
+                        ('route', 'method', 'status'))
+HTTP_LATENCY = Histogram('camwatch_http_request_duration_seconds', "HTTP request latency by route.",
+                         ('route', 'method'))
+STAGE_SECONDS = Histogram('camwatch_frame_stage_seconds',
+                          "Per-stage frame processing time (decode, preprocess, inference, postprocess, persist).",
+                          ('stage',))
+FRAMES_ANALYZED = Counter('camwatch_frames_analyzed_total', "Frames run through the detector, per camera.", ('camera',))
+FRAMES_TRACKED = Counter('camwatch_frames_tracked_total', "Frames answered by the tracker without the detector, per camera.",
+                         ('camera',))
+WEAPONS_DETECTED = Counter('camwatch_weapons_detected_total', "Weapon detections, per camera and class.",
+                           ('camera', 'weapon'))
+DB_CONNECT_SECONDS = Histogram('camwatch_db_connect_seconds', "Time to open a PostgreSQL connection.")
+DB_ERRORS = Counter('camwatch_db_errors_total', "Failed database operations by operation.", ('operation',))
+MODEL_WARMUP_SECONDS = Gauge('camwatch_model_warmup_seconds', "Time spent loading and warming up the YOLO model.")
+
+
+def _scrape_allowed():
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+    # Fail closed: without a token only a scraper on this host gets in, unless opted out
+    return METRICS_ALLOW_UNAUTHENTICATED or request.remote_addr in _LOOPBACK
+
+
+def init_app(app):
+    """Registers request instrumentation and the /metrics endpoint on the Flask app."""
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started_at = g.get('request_started_at')
+        if started_at is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUESTS.inc((route, request.method, str(response.status_code)))
+            HTTP_LATENCY.observe(time.perf_counter() - started_at, (route, request.method))
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not _scrape_allowed():
+            return Response('Forbidden\n', status=403, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,241 @@
+"""Train, evaluate and benchmark YOLO weapon detectors for CPU serving.
+
+Sweeps model checkpoints, input sizes, export backends and thread counts, and
+reports per-class mAP next to CPU latency/throughput measured through the same
+preprocess/inference stages the server runs (inference.py). The Pareto table
+lists the configurations no other configuration beats on both accuracy and
+latency, so the serving settings (YOLO_MODEL_PATH, inference.INPUT_SIZE,
+torch threads) can be picked from data.
+
+--threads only applies to the formats that run on torch's thread pool
+(pytorch, torchscript). ultralytics runs onnx and openvino exports in their
+own runtime session with its default thread count, so those are measured
+once, with threads reported as '-'.
+
+Examples (from the backend directory):
+  python model_eval.py train --model yolov8s.pt --data dataset/data.yaml --imgsz 416 --epochs 10
+  python model_eval.py sweep --models runs/detect/train3/weights/best.pt yolov8n.pt \
+      --data dataset/data.yaml --imgsz 256 320 416 --formats pytorch onnx --threads 1 2 4 --output sweep.json
+  # CI: tiny random-weight model, tiny dataset, latency only without --data
+  python model_eval.py sweep --models yolov8n.yaml --imgsz 160 --iterations 10
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import time
+
+from benchmarks.common import load_frames, summarize_latencies
+
+FORMATS = ('pytorch', 'torchscript', 'onnx', 'openvino')
+TORCH_FORMATS = ('pytorch', 'torchscript')  # Honour torch.set_num_threads
+
+
+def train(model, data, epochs=10, imgsz=416, batch=4, device=None, project=None, name=None):
+    """Fine-tunes `model` on `data`; returns the path of the best checkpoint. device=None lets ultralytics pick."""
+    from ultralytics import YOLO
+
+    options = {key: value for key, value in (('device', device), ('project', project), ('name', name)) if value}
+    trainer_model = YOLO(model)
+    trainer_model.train(data=data, epochs=epochs, imgsz=imgsz, batch=batch, **options)
+    return str(trainer_model.trainer.best)
+
+
+def load_model(checkpoint, imgsz, export_format):
+    """Loads the checkpoint, exporting it to `export_format` at `imgsz` first if needed."""
+    from ultralytics import YOLO
+
+    model = YOLO(checkpoint)
+    if export_format == 'pytorch':
+        return model
+    exported = model.export(format=export_format, imgsz=imgsz, device='cpu', verbose=False)
+    return YOLO(exported, task='detect')
+
+
+def evaluate_accuracy(model, data, imgsz):
+    """Validation-set mAP overall and per class."""
+    metrics = model.val(data=data, imgsz=imgsz, batch=1, device='cpu', plots=False, verbose=False)
+    box = metrics.box
+    per_class = {}
+    for i, class_index in enumerate(box.ap_class_index):
+        precision, recall, map50, map50_95 = box.class_result(i)
+        per_class[metrics.names[int(class_index)]] = {
+            "precision": round(float(precision), 4), "recall": round(float(recall), 4),
+            "map50": round(float(map50), 4), "map50_95": round(float(map50_95), 4),
+        }
+    return {
+        "map50": round(float(box.map50), 4),
+        "map50_95": round(float(box.map), 4),
+        "precision": round(float(box.mp), 4),
+        "recall": round(float(box.mr), 4),
+        "per_class": per_class,
+    }
+
+
+def benchmark_latency(model, frames, imgsz, threads, iterations, warmup, conf=0.15):
+    """Single-stream CPU latency of preprocess + inference, as analyze-frame-smart runs them.
+
+    threads=None leaves the thread count to the backend (exported runtimes ignore torch's).
+    """
+    import torch
+    import inference
+
+    if threads:
+        torch.set_num_threads(threads)
+    images = [inference.decode_frame(frame) for frame in frames]
+    for i in range(warmup):
+        image = inference.preprocess_frame(images[i % len(images)], size=imgsz)
+        inference.run_inference(model, image, conf, imgsz=imgsz)
+    latencies_ms = []
+    for i in range(iterations):
+        started = time.perf_counter_ns()
+        image = inference.preprocess_frame(images[i % len(images)], size=imgsz)
+        inference.run_inference(model, image, conf, imgsz=imgsz)
+        latencies_ms.append((time.perf_counter_ns() - started) / 1e6)
+    stats = summarize_latencies(latencies_ms)
+    stats["throughput_fps"] = round(1000.0 / stats["mean_ms"], 2) if stats["mean_ms"] else 0.0
+    return stats
+
+
+def pareto_front(rows, accuracy_key='map50_95'):
+    """Rows not dominated on (higher accuracy, lower p50 latency). Without accuracy, latency alone decides."""
+    front = []
+    for row in rows:
+        accuracy = row.get(accuracy_key) or 0.0
+        dominated = any(
+            (other.get(accuracy_key) or 0.0) >= accuracy and other['p50_ms'] <= row['p50_ms']
+            and ((other.get(accuracy_key) or 0.0) > accuracy or other['p50_ms'] < row['p50_ms'])
+            for other in rows if other is not row
+        )
+        if not dominated:
+            front.append(row)
+    return sorted(front, key=lambda row: row['p50_ms'])
+
+
+def sweep(args):
+    frames = load_frames(args.frames, count=args.fixtures, size=max(args.imgsz))
+    rows = []
+    for checkpoint in args.models:
+        for imgsz in args.imgsz:
+            for export_format in args.formats:
+                print(f"→ {checkpoint} @ {imgsz} ({export_format})")
+                model = load_model(checkpoint, imgsz, export_format)
+                # Accuracy doesn't depend on the thread count: measure it once per model/size/backend
+                accuracy = evaluate_accuracy(model, args.data, imgsz) if args.data else {}
+                thread_counts = args.threads if export_format in TORCH_FORMATS else [None]
+                if export_format not in TORCH_FORMATS:
+                    print(f"  {export_format} runs in its own runtime with its default threads: --threads not swept")
+                for threads in thread_counts:
+                    latency = benchmark_latency(model, frames, imgsz, threads, args.iterations, args.warmup)
+                    rows.append({
+                        "model": os.path.basename(checkpoint),
+                        "checkpoint": checkpoint,
+                        "imgsz": imgsz,
+                        "format": export_format,
+                        "threads": threads,
+                        "map50": accuracy.get("map50"),
+                        "map50_95": accuracy.get("map50_95"),
+                        "per_class": accuracy.get("per_class", {}),
+                        "p50_ms": latency["p50_ms"],
+                        "p95_ms": latency["p95_ms"],
+                        "throughput_fps": latency["throughput_fps"],
+                    })
+    return rows
+
+
+def print_table(rows, title):
+    print(f"\n{title}")
+    print(f"{'model':<24} {'imgsz':>5} {'format':<11} {'thr':>3} {'mAP50':>7} {'mAP50-95':>9} {'p50 ms':>8} {'p95 ms':>8} {'FPS':>7}")
+    for row in rows:
+        map50 = f"{row['map50']:.3f}" if row['map50'] is not None else '-'
+        map50_95 = f"{row['map50_95']:.3f}" if row['map50_95'] is not None else '-'
+        print(f"{row['model'][:24]:<24} {row['imgsz']:>5} {row['format']:<11} {row['threads'] or '-':>3} {map50:>7} {map50_95:>9} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['throughput_fps']:>7.1f}")
+
+
+def print_per_class(rows):
+    classes = sorted({name for row in rows for name in row['per_class']})
+    if not classes:
+        return
+    print("\nmAP50-95 per class")
+    print(f"{'config':<40} " + ' '.join(f"{name[:10]:>10}" for name in classes))
+    seen = set()
+    for row in rows:
+        key = (row['checkpoint'], row['imgsz'], row['format'])
+        if key in seen:
+            continue
+        seen.add(key)
+        label = f"{row['model'][:24]}@{row['imgsz']} {row['format']}"
+        print(f"{label:<40} " + ' '.join(
+            f"{row['per_class'][name]['map50_95']:>10.3f}" if name in row['per_class'] else f"{'-':>10}" for name in classes))
+
+
+def write_report(rows, front, args):
+    result = {
+        "benchmark": "model_eval",
+        "data": args.data,
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "results": rows,
+        "pareto": [{key: row[key] for key in ('checkpoint', 'imgsz', 'format', 'threads')} for row in front],
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['model', 'imgsz', 'format', 'threads', 'map50', 'map50_95', 'p50_ms', 'p95_ms', 'throughput_fps', 'pareto'])
+            for row in rows:
+                writer.writerow([row['checkpoint'], row['imgsz'], row['format'], row['threads'], row['map50'],
+                                 row['map50_95'], row['p50_ms'], row['p95_ms'], row['throughput_fps'], row in front])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train, evaluate and benchmark YOLO weapon detectors on CPU.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = commands.add_parser('train', help="Fine-tune a checkpoint on a dataset.")
+    train_parser.add_argument('--model', default='yolov8s.pt')
+    train_parser.add_argument('--data', required=True, help="Dataset data.yaml")
+    train_parser.add_argument('--epochs', type=int, default=10)
+    train_parser.add_argument('--imgsz', type=int, default=416)
+    train_parser.add_argument('--batch', type=int, default=4)
+    train_parser.add_argument('--device', help="e.g. cpu, 0. Default: GPU if available.")
+    train_parser.add_argument('--project')
+    train_parser.add_argument('--name')
+    train_parser.add_argument('--sweep', action='store_true', help="Run the default sweep on the trained checkpoint.")
+
+    sweep_parser = commands.add_parser('sweep', help="Evaluate and benchmark every model/size/backend/threads combination.")
+    sweep_parser.add_argument('--models', nargs='+', required=True, help="Checkpoints (.pt) or model YAMLs.")
+    sweep_parser.add_argument('--data', help="Dataset data.yaml; without it only latency is measured.")
+    sweep_parser.add_argument('--imgsz', nargs='+', type=int, default=[320])
+    sweep_parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['pytorch'])
+    sweep_parser.add_argument('--threads', nargs='+', type=int, default=[os.cpu_count() or 1])
+    sweep_parser.add_argument('--frames', help="Directory of frames for the latency benchmark. Default: synthetic.")
+    sweep_parser.add_argument('--fixtures', type=int, default=8)
+    sweep_parser.add_argument('--iterations', type=int, default=50)
+    sweep_parser.add_argument('--warmup', type=int, default=5)
+    sweep_parser.add_argument('--output', help="Write the full report as JSON.")
+    sweep_parser.add_argument('--csv', help="Write one row per configuration as CSV.")
+
+    args = parser.parse_args()
+    if args.command == 'train':
+        best = train(args.model, args.data, args.epochs, args.imgsz, args.batch, args.device, args.project, args.name)
+        print(f"Best checkpoint: {best}")
+        if not args.sweep:
+            return
+        sizes = sorted({256, 320, args.imgsz})
+        args = sweep_parser.parse_args(['--models', best, '--data', args.data, '--imgsz', *map(str, sizes)])
+
+    rows = sweep(args)
+    front = pareto_front(rows)
+    print_table(rows, "All configurations")
+    print_per_class(rows)
+    print_table(front, "Pareto front (nothing else is both more accurate and faster)")
+    write_report(rows, front, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""Partition maintenance for the range-partitioned detection_logs table.
+
+Creates the daily/monthly partitions ahead of time and retires expired ones
+(optionally exporting them to gzip'd CSV first) so old detections are removed
+with a cheap DETACH/DROP instead of a bulk DELETE. Evidence frames that only
+expired detections referenced are removed in the same pass.
+
+Run from cron:      python partition_maintenance.py
+Convert old table:  python partition_maintenance.py --migrate
+Or let the Flask app run it in a background thread by setting
+PARTITION_MAINTENANCE_INTERVAL_MINUTES (see start_maintenance_thread).
+"""
+import argparse
+import gzip
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+from dotenv import load_dotenv
+
+from db_utils import get_db_connection
+import evidence_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'detection_logs'
+LEGACY_TABLE = 'detection_logs_legacy'
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), 'schema.sql')
+
+PARTITION_INTERVAL = os.getenv('DETECTION_PARTITION_INTERVAL', 'day').lower()  # 'day' or 'month'
+PARTITIONS_AHEAD = int(os.getenv('DETECTION_PARTITIONS_AHEAD', 7))
+RETENTION_DAYS = int(os.getenv('DETECTION_RETENTION_DAYS', 90))  # 0 keeps everything
+RETENTION_MODE = os.getenv('DETECTION_RETENTION_MODE', 'drop').lower()  # 'drop' or 'detach'
+ARCHIVE_DIR = os.getenv('DETECTION_ARCHIVE_DIR', '')  # Export to <dir>/<partition>.csv.gz before retiring
+
+# Arbitrary but fixed key so concurrent workers/cron runs never race on DDL
+MAINTENANCE_LOCK_ID = 7_402_611
+
+_PARTITION_NAME_RE = re.compile(r'^%s_p(\d{6}|\d{8})$' % PARENT_TABLE)
+
+
+def get_retention_cutoff(now=None):
+    """Returns the UTC instant before which detections are expired, or None if retention is disabled."""
+    if RETENTION_DAYS <= 0:
+        return None
+    now = now or datetime.now(timezone.utc)
+    return now - timedelta(days=RETENTION_DAYS)
+
+
+def _period_start(moment, interval):
+    if interval == 'month':
+        return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+    return datetime(moment.year, moment.month, moment.day, tzinfo=timezone.utc)
+
+
+def _next_period(start, interval):
+    if interval == 'month':
+        return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start + timedelta(days=1)
+
+
+def partition_name(start, interval):
+    suffix = start.strftime('%Y%m') if interval == 'month' else start.strftime('%Y%m%d')
+    return f"{PARENT_TABLE}_p{suffix}"
+
+
+def parse_partition_name(name):
+    """Returns (start, end) UTC bounds encoded in a partition name, or None for non-range partitions."""
+    match = _PARTITION_NAME_RE.match(name)
+    if not match:
+        return None
+    suffix = match.group(1)
+    if len(suffix) == 6:
+        start = datetime.strptime(suffix, '%Y%m').replace(tzinfo=timezone.utc)
+        return start, _next_period(start, 'month')
+    start = datetime.strptime(suffix, '%Y%m%d').replace(tzinfo=timezone.utc)
+    return start, _next_period(start, 'day')
+
+
+def list_partitions(conn):
+    """Returns the names of all partitions currently attached to detection_logs."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = %s
+            ORDER BY child.relname
+        """, (PARENT_TABLE,))
+        return [row[0] for row in cur.fetchall()]
+
+
+def ensure_partitions(conn, interval=None, ahead=None, start_from=None):
+    """Creates the partitions covering start_from (default: now) through `ahead` future periods."""
+    interval = interval or PARTITION_INTERVAL
+    ahead = PARTITIONS_AHEAD if ahead is None else ahead
+    start = _period_start(start_from or datetime.now(timezone.utc), interval)
+    end = _period_start(datetime.now(timezone.utc), interval)
+    for _ in range(ahead):
+        end = _next_period(end, interval)
+
+    existing = set(list_partitions(conn))
+    created = []
+    while start <= end:
+        name = partition_name(start, interval)
+        upper = _next_period(start, interval)
+        if name not in existing:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM (%s) TO (%s)",
+                        (start.isoformat(), upper.isoformat())
+                    )
+                conn.commit()
+                created.append(name)
+            except psycopg2.Error as e:
+                # Usually rows for this range already sit in the default partition
+                conn.rollback()
+                logger.error(f"Could not create partition {name}: {e}")
+        start = upper
+    if created:
+        logger.info(f"Created detection_logs partitions: {', '.join(created)}")
+    return created
+
+
+def export_partition(conn, name, archive_dir):
+    """Writes a partition to <archive_dir>/<name>.csv.gz and returns the file path."""
+    os.makedirs(archive_dir, exist_ok=True)
+    final_path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = final_path + '.tmp'
+    with conn.cursor() as cur, gzip.open(tmp_path, 'wb') as archive:
+        cur.copy_expert(f"COPY (SELECT * FROM {name} ORDER BY detected_at) TO STDOUT WITH CSV HEADER", archive)
+    os.replace(tmp_path, final_path)  # Never leave a half-written archive behind
+    return final_path
+
+
+def expire_partitions(conn, cutoff=None, mode=None, archive_dir=None):
+    """Detaches (and with mode='drop' drops) every partition that ends at or before the cutoff."""
+    cutoff = cutoff or get_retention_cutoff()
+    if cutoff is None:
+        return []
+    mode = mode or RETENTION_MODE
+    archive_dir = ARCHIVE_DIR if archive_dir is None else archive_dir
+
+    retired = []
+    for name in list_partitions(conn):
+        bounds = parse_partition_name(name)
+        if not bounds or bounds[1] > cutoff:
+            continue
+        try:
+            if archive_dir:
+                path = export_partition(conn, name, archive_dir)
+                logger.info(f"Archived {name} to {path}")
+            with conn.cursor() as cur:
+                cur.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+                if mode == 'drop':
+                    cur.execute(f"DROP TABLE {name}")
+            conn.commit()
+            retired.append(name)
+        except (psycopg2.Error, OSError) as e:
+            conn.rollback()
+            logger.error(f"Could not retire partition {name}: {e}")
+    if retired:
+        logger.info(f"Retired detection_logs partitions ({mode}): {', '.join(retired)}")
+    return retired
+
+
+def migrate_legacy_table(conn):
+    """Converts a pre-partitioning detection_logs heap into the partitioned layout from schema.sql."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE relname = %s", (PARENT_TABLE,))
+        row = cur.fetchone()
+        if not row or row[0] == 'p':
+            logger.info("detection_logs is already partitioned (or missing); nothing to migrate.")
+            return False
+
+        cur.execute(f"ALTER TABLE {PARENT_TABLE} RENAME TO {LEGACY_TABLE}")
+        cur.execute(f"ALTER INDEX IF EXISTS {PARENT_TABLE}_pkey RENAME TO {LEGACY_TABLE}_pkey")
+        # Free the old index names so schema.sql's CREATE INDEX IF NOT EXISTS builds them on the new table
+        cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+                    (LEGACY_TABLE, f"idx_{PARENT_TABLE}_%"))
+        for (index_name,) in cur.fetchall():
+            cur.execute(f"ALTER INDEX {index_name} RENAME TO {index_name}_legacy")
+        with open(SCHEMA_FILE) as schema:
+            cur.execute(schema.read())
+        cur.execute(f"SELECT MIN(detected_at) FROM {LEGACY_TABLE}")
+        oldest = cur.fetchone()[0]
+    conn.commit()
+
+    ensure_partitions(conn, start_from=oldest.astimezone(timezone.utc) if oldest else None)
+
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO {PARENT_TABLE} (id, camera_id, detection_type, confidence, detected_at, image_path, details, created_at)
+            SELECT id, camera_id, detection_type, confidence, COALESCE(detected_at, created_at, NOW()), image_path, details, created_at
+            FROM {LEGACY_TABLE}
+        """)
+        copied = cur.rowcount
+        cur.execute(f"""
+            SELECT setval(pg_get_serial_sequence('{PARENT_TABLE}', 'id'), COALESCE((SELECT MAX(id) FROM {PARENT_TABLE}), 1))
+        """)
+        cur.execute(f"DROP TABLE {LEGACY_TABLE}")
+    conn.commit()
+    logger.info(f"Migrated {copied} detection_logs rows into the partitioned table.")
+    return True
+
+
+def collect_evidence(cutoff=None, interval=None):
+    """Removes evidence frames that only expired detections could reference.
+
+    Partitions are retired whole, so rows as old as the start of the cutoff's
+    period can still exist; frames are kept until that period is retired too.
+    """
+    cutoff = cutoff or get_retention_cutoff()
+    if cutoff is None:
+        return 0
+    return evidence_store.collect_garbage(_period_start(cutoff, interval or PARTITION_INTERVAL))
+
+
+def run_maintenance():
+    """Runs one maintenance pass under an advisory lock. Returns False if another process holds it."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (MAINTENANCE_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                return False
+        try:
+            ensure_partitions(conn)
+            expire_partitions(conn)
+            collect_evidence()
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_ID,))
+            conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+def start_maintenance_thread(app, interval_minutes):
+    """Runs run_maintenance() every interval_minutes in a daemon thread of the Flask app."""
+    def loop():
+        while True:
+            try:
+                run_maintenance()
+            except Exception as e:
+                app.logger.error(f"Partition maintenance failed: {e}")
+            time.sleep(interval_minutes * 60)
+
+    thread = threading.Thread(target=loop, name='partition-maintenance', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain detection_logs partitions.")
+    parser.add_argument('--migrate', action='store_true', help="Convert an unpartitioned detection_logs table first.")
+    parser.add_argument('--loop', type=int, metavar='MINUTES', help="Keep running every MINUTES instead of once.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    if args.migrate:
+        conn = get_db_connection()
+        try:
+            migrate_legacy_table(conn)
+        finally:
+            conn.close()
+
+    while True:
+        if not run_maintenance():
+            logger.info("Another maintenance run holds the lock; skipping.")
+        if not args.loop:
+            break
+        time.sleep(args.loop * 60)
+
+
+if __name__ == '__main__':
+    main()
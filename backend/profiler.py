@@ -0,0 +1,270 @@
+"""On-demand sampling profiler and slow-request tracing.
+
+Both are off by default and cost nothing until an admin turns them on through
+/api/admin/profiling/* (see routes/admin_routes.py):
+
+  * sample_stacks(seconds, interval) walks sys._current_frames() from the
+    calling (admin request) thread and returns collapsed stacks ("a;b;c 42" lines) that
+    flamegraph.pl / speedscope render directly. Frames of threads waiting in
+    the GIL, Postgres, YOLO or the SmolVLM HTTP call all show up by function.
+    It only sees the process it runs in, so under serve.py the response
+    carries the pid of the worker that was sampled.
+  * While slow-request tracing is enabled, requests over the threshold are
+    kept with the per-stage breakdown recorded by metrics.StageTimer, both in
+    a ring buffer of the most recent ones and a list of the slowest ones.
+
+Tracing is switched through slow_requests.json in PROFILING_DIR, like
+recording.py's capture.json: every worker process re-reads it at most once a
+second and publishes its buffers to slow_requests.<pid>.json, which
+snapshot() merges so the admin API sees all workers whichever one it hits.
+"""
+import collections
+import glob
+import heapq
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'profiling'))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv('SLOW_REQUEST_BUFFER_SIZE', 50))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 60))
+
+_CONTROL_FILE = 'slow_requests.json'
+_CONTROL_CHECK_S = 1.0
+
+_profile_lock = threading.Lock()  # One sampling session at a time
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _collapse(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+def sample_stacks(seconds, interval=0.005, include_idle=False):
+    """Samples every thread's stack for `seconds`. Returns (Counter of collapsed stacks, sample count)."""
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profiling session is already running.")
+    try:
+        me = threading.get_ident()
+        names = {}
+        stacks = collections.Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                # Idle pool/server threads parked in wait()/select() only add noise
+                if not include_idle and _is_idle(frame):
+                    continue
+                stacks[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+            samples += 1
+            time.sleep(interval)
+        return stacks, samples
+    finally:
+        _profile_lock.release()
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    return (code.co_name in ('wait', 'select', 'poll', 'accept', '_worker', 'get')
+            and os.path.basename(code.co_filename) in ('threading.py', 'selectors.py', 'socket.py', 'thread.py', 'queue.py', 'socketserver.py'))
+
+
+def format_collapsed(stacks):
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class SlowRequestTracker:
+    """Keeps the last N requests over the threshold, and the N slowest since it was enabled.
+
+    The settings live in the control file shared by all workers; `since` (when
+    the buffers were last reset) tells a worker to clear its own buffers and
+    keeps published buffers from an earlier session out of snapshot().
+    """
+
+    def __init__(self, size=SLOW_REQUEST_BUFFER_SIZE, directory=PROFILING_DIR):
+        self.size = size
+        self.directory = directory
+        self.enabled = False
+        self.threshold_ms = 0.0
+        self._control = None
+        self._checked_at = 0.0
+        self._dirty = False
+        self._published_at = 0.0
+        self._recent = collections.deque(maxlen=size)
+        self._heap = []  # min-heap on duration
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def status(self):
+        """The shared settings ({'enabled', 'threshold_ms', 'since'}), or None if tracing was never enabled."""
+        try:
+            with open(os.path.join(self.directory, _CONTROL_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def enable(self, threshold_ms=0.0, reset=True):
+        """Turns tracing on in every worker within a second (this one immediately)."""
+        current = self.status()
+        since = current['since'] if current and not reset else time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        if reset:
+            for path in self._published_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        _write_json(os.path.join(self.directory, _CONTROL_FILE),
+                    {'enabled': True, 'threshold_ms': threshold_ms, 'since': since})
+        self._checked_at = 0.0
+        self.refresh()
+
+    def disable(self):
+        """Turns tracing off in every worker; the buffers stay readable until the next reset."""
+        current = self.status()
+        if current is None:
+            return
+        _write_json(os.path.join(self.directory, _CONTROL_FILE), dict(current, enabled=False))
+        self._checked_at = 0.0
+        self.refresh()
+
+    def refresh(self):
+        """Cheap check for the request path: re-reads the control file at most once a second.
+
+        Also publishes this worker's buffers if they changed since the last check.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < _CONTROL_CHECK_S:
+            return self.enabled
+        self._checked_at = now
+        control = self.status()
+        with self._lock:
+            if control != self._control:
+                if control is None or self._control is None or control['since'] != self._control['since']:
+                    self._heap = []
+                    self._recent.clear()
+                    self._dirty = False
+                self._control = control
+                self.threshold_ms = control['threshold_ms'] if control else 0.0
+                self.enabled = bool(control and control['enabled'])
+            if self._dirty:
+                self._publish()
+        return self.enabled
+
+    def record(self, duration_ms, entry):
+        if duration_ms < self.threshold_ms:
+            return
+        with self._lock:
+            self._recent.append(entry)
+            item = (duration_ms, next(self._seq), entry)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            elif duration_ms > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+            self._dirty = True
+            # A burst is published by the next refresh(); an isolated slow request right away
+            if time.monotonic() - self._published_at >= _CONTROL_CHECK_S:
+                self._publish()
+
+    def _publish(self):
+        # Caller holds _lock
+        self._dirty = False
+        self._published_at = time.monotonic()
+        try:
+            _write_json(os.path.join(self.directory, f"slow_requests.{os.getpid()}.json"), self._local_snapshot())
+        except OSError as e:
+            logger.warning(f"Could not publish slow requests: {e}")
+
+    def _local_snapshot(self):
+        # Caller holds _lock
+        return {
+            "pid": os.getpid(),
+            "since": self._control['since'] if self._control else None,
+            "slowest": [entry for _, _, entry in sorted(self._heap, key=lambda item: item[0], reverse=True)],
+            "recent": list(reversed(self._recent)),
+        }
+
+    def _published_files(self):
+        return glob.glob(os.path.join(self.directory, 'slow_requests.*.json'))
+
+    def snapshot(self):
+        """The slowest and most recent slow requests of all workers, each tagged with its worker's pid."""
+        with self._lock:
+            own = self._local_snapshot()
+        control = self.status()
+        since = control['since'] if control else None
+        reports = [own] if own['since'] == since else []
+        for path in self._published_files():
+            try:
+                with open(path) as f:
+                    report = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if report.get('pid') != own['pid'] and report.get('since') == since:
+                reports.append(report)
+        slowest = [entry for report in reports for entry in report['slowest']]
+        recent = [entry for report in reports for entry in report['recent']]
+        return {
+            "workers": sorted(report['pid'] for report in reports),
+            "slowest": sorted(slowest, key=lambda entry: entry['duration_ms'], reverse=True)[:self.size],
+            "recent": sorted(recent, key=lambda entry: entry['at'], reverse=True)[:self.size],
+        }
+
+
+slow_requests = SlowRequestTracker()
+
+
+def _utc_timestamp():
+    now = time.time()
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)) + f".{int(now * 1000) % 1000:03d}Z"
+
+
+def init_app(app):
+    """Hooks slow-request tracing into the app. A clock check per request, a file read once a second."""
+
+    @app.after_request
+    def _trace_slow_request(response):
+        if slow_requests.refresh():
+            started_at = g.get('request_started_at')  # Set by metrics.init_app
+            if started_at is not None:
+                duration_ms = (time.perf_counter() - started_at) * 1000.0
+                timer = g.get('stage_timer')
+                slow_requests.record(duration_ms, {
+                    "route": request.url_rule.rule if request.url_rule else request.path,
+                    "method": request.method,
+                    "status": response.status_code,
+                    "duration_ms": round(duration_ms, 3),
+                    "stages_ms": {stage: round(seconds * 1000.0, 3) for stage, seconds in timer.timings.items()} if timer else {},
+                    "stream": g.get('stream_key'),
+                    "pid": os.getpid(),
+                    "at": _utc_timestamp(),
+                })
+        return response
@@ -0,0 +1,79 @@
+"""Bulk-provision users or cameras from a CSV or JSON file, straight into the database.
+
+Same validation and single-transaction insert as POST /api/admin/users/bulk and
+/api/admin/cameras/bulk (see provisioning.py), without an API call per row and
+without the interactive prompts of register_admin.py.
+
+    python provision.py users staff.csv                   # from the backend directory
+    python provision.py cameras site-42.json --on-error skip
+    python provision.py cameras site-42.csv --dry-run --report report.json
+
+Cameras created here reach running workers on their next camera registry
+refresh (CAMERA_REGISTRY_TTL); the API route updates its own worker at once.
+"""
+import argparse
+import json
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db_utils import get_db_connection
+from provisioning import ON_ERROR_MODES, ProvisioningError, parse_rows, provision_cameras, provision_users
+
+PROVISIONERS = {'users': provision_users, 'cameras': provision_cameras}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-create users or cameras from a CSV or JSON file.")
+    parser.add_argument('kind', choices=sorted(PROVISIONERS))
+    parser.add_argument('file', help="CSV with a header line, or a JSON list of objects ('-' for stdin).")
+    parser.add_argument('--on-error', choices=ON_ERROR_MODES, default='abort',
+                        help="abort: write nothing if any row fails (default); skip: create the valid rows.")
+    parser.add_argument('--dry-run', action='store_true', help="Validate and check conflicts only.")
+    parser.add_argument('--report', help="Write the per-row report to this JSON file.")
+    args = parser.parse_args()
+
+    if args.file == '-':
+        body, content_type = sys.stdin.buffer.read(), ''
+    else:
+        with open(args.file, 'rb') as f:
+            body = f.read()
+        content_type = 'text/csv' if args.file.lower().endswith('.csv') else 'application/json'
+
+    started = time.perf_counter()
+    try:
+        rows = parse_rows(body, content_type)
+        conn = get_db_connection()
+        try:
+            report, _ = PROVISIONERS[args.kind](conn, rows, on_error=args.on_error, dry_run=args.dry_run)
+        finally:
+            conn.close()
+    except ProvisioningError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+    elapsed = time.perf_counter() - started
+
+    for result in report['results']:
+        if result['status'] == 'failed':
+            print(f"  row {result['row']}: {result['message']}")
+    summary = report['summary']
+    if report['aborted']:
+        print(f"❌ Nothing written: {summary['failed']} of {summary['total']} row(s) failed (use --on-error skip to import the rest)")
+    elif args.dry_run:
+        print(f"✅ Dry run: {summary['valid']} valid, {summary['failed']} failed of {summary['total']} ({elapsed:.2f}s)")
+    else:
+        print(f"✅ {summary['created']} {args.kind} created, {summary['skipped']} skipped, "
+              f"{summary['failed']} failed of {summary['total']} ({elapsed:.2f}s)")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+    sys.exit(1 if summary['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
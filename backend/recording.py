@@ -0,0 +1,306 @@
+"""Recording of analyze-frame-smart traffic for deterministic replay.
+
+While a capture is running, every analyzed frame is appended to a recording
+together with what the pipeline answered, so benchmarks/replay.py can feed
+real traffic back through the server at its original pace (or as fast as
+possible) and diff the verdicts after a model or performance change.
+
+A recording is two append-only files in RECORDINGS_DIR:
+
+    <name>.<pid>.rec      b'CAMREC01', then per frame: <JPEG bytes> <meta JSON>
+    <name>.<pid>.rec.idx  b'CAMIDX01', then one fixed-size entry per frame:
+                          <i64 wall time ns> <u64 offset> <u32 frame length>
+                          <u32 meta length> <i32 camera id, -1 = none> <u32 crc32>
+
+The index makes the data file randomly accessible through mmap without
+parsing it, and frames are handed out as zero-copy memoryviews. An index
+entry is written only after its record, so a worker killed mid-append leaves
+at most an unindexed tail. The meta JSON holds the request's stream_id and
+the verdict (weapon_detected, whether the detector ran, the objects).
+
+Captures are started and stopped through the admin API, which writes
+capture.json into RECORDINGS_DIR; every worker process checks that file at
+most once a second and records its own traffic into its own <pid> pair.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+RECORDINGS_DIR = os.getenv('RECORDINGS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'recordings'))
+RECORDING_MAX_FRAMES = int(os.getenv('RECORDING_MAX_FRAMES', 100000))  # Per worker process
+RECORDING_MAX_SECONDS = int(os.getenv('RECORDING_MAX_SECONDS', 3600))
+
+DATA_MAGIC = b'CAMREC01'
+INDEX_MAGIC = b'CAMIDX01'
+_ENTRY = struct.Struct('<qQIIiI')
+_CONTROL_FILE = 'capture.json'
+_CONTROL_CHECK_S = 1.0
+
+_NAME_CHARS = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_')
+
+
+class RecordingError(Exception):
+    pass
+
+
+def valid_name(name):
+    return bool(name) and len(name) <= 64 and set(name) <= _NAME_CHARS
+
+
+class RecordingWriter:
+    """Appends frames to one data/index pair."""
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        self._data = open(path, 'ab')
+        self._index = open(path + '.idx', 'ab')
+        if self._data.tell() == 0:
+            self._data.write(DATA_MAGIC)
+        if self._index.tell() == 0:
+            self._index.write(INDEX_MAGIC)
+        self._offset = self._data.tell()
+
+    def append(self, frame, camera_id, meta, timestamp_ns=None):
+        meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+        crc = zlib.crc32(meta_bytes, zlib.crc32(frame))
+        self._data.write(frame)
+        self._data.write(meta_bytes)
+        self._data.flush()  # The record must be in the file before its index entry
+        self._index.write(_ENTRY.pack(timestamp_ns or time.time_ns(), self._offset, len(frame), len(meta_bytes),
+                                      -1 if camera_id is None else int(camera_id), crc))
+        self._index.flush()
+        self._offset += len(frame) + len(meta_bytes)
+        self.frames += 1
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class Record:
+    __slots__ = ('timestamp_ns', 'camera_id', 'frame', 'meta')
+
+    def __init__(self, timestamp_ns, camera_id, frame, meta):
+        self.timestamp_ns = timestamp_ns
+        self.camera_id = camera_id
+        self.frame = frame  # memoryview into the mapped data file
+        self.meta = meta
+
+
+class RecordingReader:
+    """Memory-maps a recording. Supports len(), indexing and iteration in capture order."""
+
+    def __init__(self, path, verify=True):
+        self.path = path
+        self.verify = verify
+        self._data_file = open(path, 'rb')
+        self._index_file = open(path + '.idx', 'rb')
+        data_size = os.fstat(self._data_file.fileno()).st_size
+        index_size = os.fstat(self._index_file.fileno()).st_size
+        self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ) if data_size else b''
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ) if index_size else b''
+        if self._data[:len(DATA_MAGIC)] != DATA_MAGIC or self._index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.close()
+            raise RecordingError(f"{path} is not a frame recording")
+
+        count = (index_size - len(INDEX_MAGIC)) // _ENTRY.size
+        # Drop entries pointing past the end of the data file (a writer killed mid-append)
+        while count and self._entry(count - 1)[1] + sum(self._entry(count - 1)[2:4]) > data_size:
+            count -= 1
+        self._count = count
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._index, len(INDEX_MAGIC) + i * _ENTRY.size)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        timestamp_ns, offset, frame_length, meta_length, camera_id, crc = self._entry(i)
+        view = memoryview(self._data)
+        frame = view[offset:offset + frame_length]
+        meta_bytes = view[offset + frame_length:offset + frame_length + meta_length]
+        if self.verify and zlib.crc32(meta_bytes, zlib.crc32(frame)) != crc:
+            raise RecordingError(f"{os.path.basename(self.path)}: record {i} is corrupt")
+        return Record(timestamp_ns, None if camera_id < 0 else camera_id, frame, json.loads(bytes(meta_bytes)))
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def time_span(self):
+        """(first, last) capture time in ns, or None when empty."""
+        if not self._count:
+            return None
+        return self._entry(0)[0], self._entry(self._count - 1)[0]
+
+    def close(self):
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass  # A caller still holds a frame view; the mapping goes away with it
+        self._data_file.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def recording_files(name=None, directory=None):
+    """Data files of the recording `name` (one per worker process), or of every recording."""
+    directory = directory or RECORDINGS_DIR
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, filename) for filename in os.listdir(directory)
+                  if filename.endswith('.rec') and (name is None or filename.rsplit('.', 2)[0] == name))
+
+
+def list_recordings(directory=None):
+    """Summary of every recording in the directory, grouped by name."""
+    recordings = {}
+    for path in recording_files(directory=directory):
+        name = os.path.basename(path).rsplit('.', 2)[0]
+        summary = recordings.setdefault(name, {'name': name, 'files': 0, 'frames': 0, 'bytes': 0,
+                                               'started_at_ns': None, 'ended_at_ns': None})
+        try:
+            with RecordingReader(path, verify=False) as reader:
+                span = reader.time_span()
+                summary['frames'] += len(reader)
+            summary['bytes'] += os.path.getsize(path) + os.path.getsize(path + '.idx')
+        except (OSError, RecordingError) as e:
+            logger.warning(f"⚠️ Skipping unreadable recording {path}: {e}")
+            continue
+        summary['files'] += 1
+        if span:
+            summary['started_at_ns'] = min(filter(None, (summary['started_at_ns'], span[0])))
+            summary['ended_at_ns'] = max(filter(None, (summary['ended_at_ns'], span[1])))
+    return sorted(recordings.values(), key=lambda summary: summary['started_at_ns'] or 0)
+
+
+class Recorder:
+    """Per-process capture state, driven by the control file the admin API writes."""
+
+    def __init__(self, directory=RECORDINGS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._control = None
+        self._writer = None
+        self._pid = None
+
+    def start(self, name, max_seconds=RECORDING_MAX_SECONDS, max_frames=RECORDING_MAX_FRAMES, camera_id=None):
+        if not valid_name(name):
+            raise ValueError("Recording names may only contain letters, digits, '-' and '_' (max 64).")
+        if recording_files(name, self.directory):
+            raise RecordingError(f"A recording named '{name}' already exists.")
+        current = self.status()
+        if current:
+            raise RecordingError(f"Capture '{current['name']}' is already running.")
+        control = {
+            'name': name,
+            'started_at': time.time(),
+            'until': time.time() + max_seconds,
+            'max_frames': max_frames,
+            'camera_id': camera_id,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f"{_CONTROL_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(control, f)
+        os.replace(tmp_path, os.path.join(self.directory, _CONTROL_FILE))
+        self._checked_at = 0.0
+        return control
+
+    def stop(self):
+        """Ends the capture in every worker. Returns the stopped capture, or None if none was running."""
+        control = self.status()
+        try:
+            os.remove(os.path.join(self.directory, _CONTROL_FILE))
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._close_writer()
+            self._control = None
+            self._checked_at = 0.0
+        return control
+
+    def status(self):
+        """The running capture's settings, or None."""
+        try:
+            with open(os.path.join(self.directory, _CONTROL_FILE)) as f:
+                control = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return control if time.time() < control['until'] else None
+
+    @property
+    def active(self):
+        """Cheap check for the request path: re-reads the control file at most once a second."""
+        now = time.monotonic()
+        if now - self._checked_at >= _CONTROL_CHECK_S:
+            self._checked_at = now
+            control = self.status()
+            if control != self._control:
+                with self._lock:
+                    self._close_writer()
+                    self._control = control
+        return self._control is not None
+
+    def capture(self, frame, camera_id, stream_id, verdict):
+        """Appends one analyzed frame. Never raises into the request path."""
+        with self._lock:
+            control = self._control
+            if control is None or (control['camera_id'] is not None and control['camera_id'] != camera_id):
+                return
+            try:
+                if self._writer is None or self._pid != os.getpid():
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._pid = os.getpid()
+                    self._writer = RecordingWriter(os.path.join(self.directory, f"{control['name']}.{self._pid}.rec"))
+                if self._writer.frames >= control['max_frames'] or time.time() >= control['until']:
+                    return
+                self._writer.append(frame, camera_id, {'stream_id': stream_id, 'verdict': verdict})
+            except (OSError, ValueError, TypeError) as e:
+                logger.error(f"❌ Frame capture failed, stopping it in this worker: {e}")
+                self._close_writer()
+                self._control = None
+
+    def _close_writer(self):
+        if self._writer is not None and self._pid == os.getpid():
+            try:
+                self._writer.close()
+            except OSError:
+                pass
+        self._writer = None
+
+
+def verdict_of(payload):
+    """The part of an analyze response a replay compares."""
+    return {
+        'weapon_detected': bool(payload.get('weapon_detected')),
+        'keyframe': payload.get('keyframe', True),  # False: the tracker answered, the detector didn't run
+        'objects': [
+            {key: obj.get(key) for key in ('object', 'class_id', 'confidence', 'bbox', 'track_id')}
+            for obj in payload.get('detected_objects', [])
+        ],
+    }
+
+
+recorder = Recorder()
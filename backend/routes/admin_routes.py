@@ -1,9 +1,18 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response
 from db_utils import get_db_connection, hash_password
-from auth_utils import admin_required
+from auth_utils import admin_required, set_user_status
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras # For DictCursor
-import re # For email validation
+import os
+from camera_registry import camera_registry, CAMERA_COLUMNS
+from profiler import sample_stacks, format_collapsed, slow_requests, ProfilerBusy
+from alerts import dispatcher as alert_dispatcher, ALERT_DEAD_LETTER_PATH
+from provisioning import (
+    validate_user_fields, validate_camera_fields, parse_rows, provision_users, provision_cameras,
+    ProvisioningError
+)
+from recording import recorder, list_recordings, RecordingError, RECORDING_MAX_FRAMES, RECORDING_MAX_SECONDS
 
 admin_bp = Blueprint('admin_bp', __name__)
 
@@ -48,24 +57,11 @@ def get_users_route(current_admin_user):
 @admin_bp.route('/users', methods=['POST'])
 @admin_required
 def create_user_route(current_admin_user):
-    data = request.get_json()
-    name = data.get('name')
-    email = data.get('email', '').lower().strip()
-    password = data.get('password')
-    role = data.get('role', 'staff').lower()
-
-    # --- Input Validation ---
-    if not all([name, email, password]):
-        return jsonify({"success": False, "message": "Name, email, and password are required."}), 400
-    
-    if not re.match(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$", email):
-        return jsonify({"success": False, "message": "Invalid email format."}), 400
-        
-    if len(password) < 6: # Consider making password policy more robust
-        return jsonify({"success": False, "message": "Password must be at least 6 characters long."}), 400
-
-    if role not in ['admin', 'staff']:
-        return jsonify({"success": False, "message": "Invalid role. Must be 'admin' or 'staff'."}), 400
+    # --- Input Validation (same rules as the bulk import) ---
+    fields, error = validate_user_fields(request.get_json() or {})
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+    name, email, password, role = fields['name'], fields['email'], fields['password'], fields['role']
 
     conn = None
     try:
@@ -122,6 +118,120 @@ def create_user_route(current_admin_user):
         if conn:
             conn.close()
 
+# --- Bulk Provisioning ---
+def run_bulk_import(current_admin_user, kind, provision):
+    """Shared body of /users/bulk and /cameras/bulk: JSON list or CSV in, per-row report out."""
+    on_error = request.args.get('on_error', 'abort')
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    try:
+        rows = parse_rows(request.get_data(), request.content_type or '')
+    except ProvisioningError as e:
+        return jsonify({"success": False, "message": str(e)}), 400, []
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        report, created = provision(conn, rows, on_error=on_error, dry_run=dry_run)
+    except ProvisioningError as e:
+        return jsonify({"success": False, "message": str(e)}), 400, []
+    except psycopg2.Error as db_error:
+        current_app.logger.error(f"Database error during bulk {kind} import: {db_error}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": f"A database error occurred; no {kind} were created."}), 500, []
+    finally:
+        if conn:
+            conn.close()
+
+    summary = report['summary']
+    current_app.logger.info(
+        f"Bulk {kind} import by admin {current_admin_user.get('email')}: {summary['created']} created, "
+        f"{summary['failed']} failed of {summary['total']}{' (dry run)' if dry_run else ''}")
+    if dry_run:
+        message = f"Dry run: {summary['valid']} row(s) valid, {summary['failed']} row(s) failed."
+        return jsonify({"success": not summary['failed'], "message": message, "data": report}), 200, created
+    if report['aborted']:
+        message = f"No {kind} were created: {summary['failed']} row(s) failed validation."
+        return jsonify({"success": False, "message": message, "data": report}), 400, created
+    message = f"{summary['created']} {kind} created, {summary['failed']} row(s) failed."
+    return jsonify({"success": True, "message": message, "data": report}), 200, created
+
+@admin_bp.route('/users/bulk', methods=['POST'])
+@admin_required
+def bulk_create_users_route(current_admin_user):
+    """Creates users from a JSON list or CSV (name,email,password,role[,is_active]). ?on_error=abort|skip&dry_run=true"""
+    response, status, _ = run_bulk_import(current_admin_user, 'users', provision_users)
+    return response, status
+
+@admin_bp.route('/users/<int:user_id_to_update>', methods=['PUT'])
+@admin_required
+def update_user_route(current_admin_user, user_id_to_update):
+    data = request.get_json() or {}
+    updates = {}
+
+    if 'name' in data:
+        if not data['name']:
+            return jsonify({"success": False, "message": "Name cannot be empty."}), 400
+        updates['name'] = data['name']
+
+    if 'role' in data:
+        role = str(data['role']).lower()
+        if role not in ['admin', 'staff']:
+            return jsonify({"success": False, "message": "Invalid role. Must be 'admin' or 'staff'."}), 400
+        updates['role'] = role
+
+    if 'is_active' in data:
+        if not isinstance(data['is_active'], bool):
+            return jsonify({"success": False, "message": "Invalid 'is_active' status provided."}), 400
+        if current_admin_user.get('id') == user_id_to_update and not data['is_active']:
+            return jsonify({"success": False, "message": "Administrators cannot deactivate their own account."}), 403
+        updates['is_active'] = data['is_active']
+
+    if not updates:
+        return jsonify({"success": False, "message": "No valid fields to update."}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            set_clause = ", ".join(f"{column} = %s" for column in updates)
+            cur.execute(
+                f"""
+                UPDATE users SET {set_clause}, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING id, name, email, role, is_active, created_at, updated_at;
+                """,
+                (*updates.values(), user_id_to_update)
+            )
+            updated_user_record = cur.fetchone()
+            if not updated_user_record:
+                conn.rollback()
+                return jsonify({"success": False, "message": "User not found."}), 404
+            conn.commit()
+
+            # Deactivation takes effect on the user's very next request
+            set_user_status(user_id_to_update, updated_user_record['is_active'])
+
+            user_data_for_response = dict(updated_user_record)
+            for key, value in user_data_for_response.items():
+                if hasattr(value, 'isoformat'):
+                    user_data_for_response[key] = value.isoformat()
+            return jsonify({"success": True, "message": "User updated successfully.", "data": user_data_for_response}), 200
+
+    except psycopg2.Error as db_error:
+        current_app.logger.error(f"Database error during user update: {db_error}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": "A database error occurred while updating the user."}), 500
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error during user update: {e}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": "An unexpected error occurred. Please try again."}), 500
+    finally:
+        if conn:
+            conn.close()
+
 @admin_bp.route('/users/<int:user_id_to_delete>', methods=['DELETE'])
 @admin_required
 def delete_user_route(current_admin_user, user_id_to_delete):
@@ -157,6 +267,7 @@ def delete_user_route(current_admin_user, user_id_to_delete):
                 return jsonify({"success": False, "message": "User not found or already deleted."}), 404
             
             conn.commit()
+            set_user_status(user_id_to_delete, None) # Revoke the user's existing tokens right away
             return jsonify({"success": True, "message": "User deleted successfully."}), 200
 
     except psycopg2.Error as db_error:
@@ -173,6 +284,140 @@ def delete_user_route(current_admin_user, user_id_to_delete):
         if conn:
             conn.close()
 
+# --- Camera Management ---
+@admin_bp.route('/cameras', methods=['GET'])
+@admin_required
+def get_cameras_route(current_admin_user):
+    try:
+        cameras_list, etag = camera_registry.all()
+        response = jsonify({"success": True, "data": cameras_list})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    except psycopg2.Error as db_error:
+        current_app.logger.error(f"Database error fetching cameras: {db_error}")
+        return jsonify({"success": False, "message": "A database error occurred while fetching cameras."}), 500
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error fetching cameras: {e}")
+        return jsonify({"success": False, "message": "An unexpected error occurred."}), 500
+
+@admin_bp.route('/cameras', methods=['POST'])
+@admin_required
+def create_camera_route(current_admin_user):
+    fields, error = validate_camera_fields(request.get_json() or {})
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            columns = ", ".join(fields)
+            placeholders = ", ".join(["%s"] * len(fields))
+            cur.execute(
+                f"INSERT INTO cameras ({columns}) VALUES ({placeholders}) RETURNING {CAMERA_COLUMNS}",
+                tuple(fields.values())
+            )
+            new_camera = cur.fetchone()
+            conn.commit()
+            camera_registry.upsert(new_camera)
+            return jsonify({"success": True, "message": f"Camera '{new_camera['name']}' created.", "data": dict(new_camera)}), 201
+    except psycopg2.errors.UniqueViolation:
+        conn.rollback()
+        return jsonify({"success": False, "message": "A camera with this name already exists at this location."}), 409
+    except psycopg2.Error as db_error:
+        current_app.logger.error(f"Database error during camera creation: {db_error}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": "A database error occurred while creating the camera."}), 500
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error during camera creation: {e}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": "An unexpected error occurred. Please try again."}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@admin_bp.route('/cameras/bulk', methods=['POST'])
+@admin_required
+def bulk_create_cameras_route(current_admin_user):
+    """Creates cameras from a JSON list or CSV (name,location[,ip_address,rtsp_url,is_active,roi,confidence_threshold])."""
+    response, status, created = run_bulk_import(current_admin_user, 'cameras', provision_cameras)
+    if created:
+        camera_registry.upsert_many(created)
+    return response, status
+
+@admin_bp.route('/cameras/<int:camera_id>', methods=['PUT'])
+@admin_required
+def update_camera_route(current_admin_user, camera_id):
+    fields, error = validate_camera_fields(request.get_json() or {}, partial=True)
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+    if not fields:
+        return jsonify({"success": False, "message": "No valid fields to update."}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            set_clause = ", ".join(f"{column} = %s" for column in fields)
+            cur.execute(
+                f"UPDATE cameras SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING {CAMERA_COLUMNS}",
+                (*fields.values(), camera_id)
+            )
+            updated_camera = cur.fetchone()
+            if not updated_camera:
+                conn.rollback()
+                return jsonify({"success": False, "message": "Camera not found."}), 404
+            conn.commit()
+            camera_registry.upsert(updated_camera)
+            return jsonify({"success": True, "message": "Camera updated successfully.", "data": dict(updated_camera)}), 200
+    except psycopg2.errors.UniqueViolation:
+        conn.rollback()
+        return jsonify({"success": False, "message": "A camera with this name already exists at this location."}), 409
+    except psycopg2.Error as db_error:
+        current_app.logger.error(f"Database error during camera update: {db_error}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": "A database error occurred while updating the camera."}), 500
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error during camera update: {e}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": "An unexpected error occurred. Please try again."}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@admin_bp.route('/cameras/<int:camera_id>', methods=['DELETE'])
+@admin_required
+def delete_camera_route(current_admin_user, camera_id):
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM cameras WHERE id = %s", (camera_id,))
+            if cur.rowcount == 0:
+                conn.rollback()
+                return jsonify({"success": False, "message": "Camera not found."}), 404
+            conn.commit()
+            camera_registry.remove(camera_id)
+            return jsonify({"success": True, "message": "Camera deleted successfully."}), 200
+    except psycopg2.Error as db_error:
+        current_app.logger.error(f"Database error during camera deletion: {db_error}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": "A database error occurred while deleting the camera."}), 500
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error during camera deletion: {e}")
+        if conn:
+            conn.rollback()
+        return jsonify({"success": False, "message": "An unexpected error occurred. Please try again."}), 500
+    finally:
+        if conn:
+            conn.close()
+
 # --- Admin Statistics ---
 @admin_bp.route('/stats', methods=['GET'])
 @admin_required
@@ -232,4 +477,158 @@ def get_admin_stats_route(current_admin_user):
         return jsonify({"success": False, "message": "An unexpected error occurred."}), 500
     finally:
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+# --- Runtime Profiling ---
+@admin_bp.route('/profiling/profile', methods=['POST'])
+@admin_required
+def profile_route(current_admin_user):
+    """Samples all threads for N seconds and returns collapsed stacks (flamegraph.pl / speedscope input)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 10))
+        interval_ms = float(data.get('interval_ms', 5))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "'seconds' and 'interval_ms' must be numbers."}), 400
+    if seconds <= 0 or interval_ms <= 0:
+        return jsonify({"success": False, "message": "'seconds' and 'interval_ms' must be positive."}), 400
+
+    try:
+        stacks, samples = sample_stacks(seconds, interval_ms / 1000.0, bool(data.get('include_idle', False)))
+    except ProfilerBusy as e:
+        return jsonify({"success": False, "message": str(e)}), 409
+
+    # Sampling only sees this process; under serve.py the pid says which worker was profiled
+    current_app.logger.info(f"Profiled {samples} samples over {seconds}s in worker {os.getpid()} for admin {current_admin_user.get('email')}")
+    if data.get('format') == 'json':
+        return jsonify({
+            "success": True,
+            "data": {
+                "pid": os.getpid(),
+                "samples": samples,
+                "stacks": [{"stack": stack, "count": count} for stack, count in stacks.most_common(200)]
+            }
+        }), 200
+    return Response(format_collapsed(stacks), mimetype='text/plain', headers={'X-Worker-Pid': str(os.getpid())})
+
+@admin_bp.route('/profiling/slow-requests', methods=['GET'])
+@admin_required
+def get_slow_requests_route(current_admin_user):
+    # Settings from the shared control file, entries merged from every worker
+    control = slow_requests.status() or {}
+    return jsonify({
+        "success": True,
+        "data": {
+            "enabled": control.get('enabled', False),
+            "threshold_ms": control.get('threshold_ms', 0.0),
+            **slow_requests.snapshot()
+        }
+    }), 200
+
+@admin_bp.route('/profiling/slow-requests', methods=['PUT'])
+@admin_required
+def toggle_slow_requests_route(current_admin_user):
+    data = request.get_json(silent=True) or {}
+    enabled = data.get('enabled')
+    if not isinstance(enabled, bool):
+        return jsonify({"success": False, "message": "Invalid 'enabled' flag provided."}), 400
+    if enabled:
+        try:
+            threshold_ms = float(data.get('threshold_ms', 0))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "message": "'threshold_ms' must be a number."}), 400
+        try:
+            slow_requests.enable(threshold_ms, reset=data.get('reset', True))
+        except OSError as e:
+            current_app.logger.error(f"Could not enable slow-request tracing: {e}")
+            return jsonify({"success": False, "message": "Could not write the profiling control file."}), 500
+    else:
+        try:
+            slow_requests.disable()
+        except OSError as e:
+            current_app.logger.error(f"Could not disable slow-request tracing: {e}")
+            return jsonify({"success": False, "message": "Could not write the profiling control file."}), 500
+    return jsonify({"success": True, "message": f"Slow-request tracing {'enabled' if enabled else 'disabled'} in all workers."}), 200
+
+@admin_bp.route('/recordings', methods=['GET'])
+@admin_required
+def list_recordings_route(current_admin_user):
+    return jsonify({
+        "success": True,
+        "data": {"capture": recorder.status(), "recordings": list_recordings()}
+    }), 200
+
+@admin_bp.route('/recordings/start', methods=['POST'])
+@admin_required
+def start_recording_route(current_admin_user):
+    """Starts capturing analyzed frames and verdicts in every worker (replay with benchmarks/replay.py)."""
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+    camera_id = data.get('camera_id')
+    try:
+        max_seconds = float(data.get('max_seconds', RECORDING_MAX_SECONDS))
+        max_frames = int(data.get('max_frames', RECORDING_MAX_FRAMES))
+        camera_id = int(camera_id) if camera_id is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "'max_seconds', 'max_frames' and 'camera_id' must be numbers."}), 400
+    if max_seconds <= 0 or max_frames <= 0:
+        return jsonify({"success": False, "message": "'max_seconds' and 'max_frames' must be positive."}), 400
+
+    try:
+        capture = recorder.start(name, max_seconds, max_frames, camera_id)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except RecordingError as e:
+        return jsonify({"success": False, "message": str(e)}), 409
+    except OSError as e:
+        current_app.logger.error(f"❌ Could not start recording '{name}': {e}")
+        return jsonify({"success": False, "message": "Could not start the recording."}), 500
+
+    current_app.logger.info(f"⏺️ Recording '{name}' started by admin {current_admin_user.get('email')}")
+    return jsonify({"success": True, "message": f"Recording '{name}' started.", "data": capture}), 200
+
+@admin_bp.route('/recordings/stop', methods=['POST'])
+@admin_required
+def stop_recording_route(current_admin_user):
+    capture = recorder.stop()
+    if capture is None:
+        return jsonify({"success": False, "message": "No recording is running."}), 409
+    current_app.logger.info(f"⏹️ Recording '{capture['name']}' stopped by admin {current_admin_user.get('email')}")
+    return jsonify({"success": True, "message": f"Recording '{capture['name']}' stopped.", "data": capture}), 200
+
+@admin_bp.route('/alerts', methods=['GET'])
+@admin_required
+def get_alerts_status_route(current_admin_user):
+    return jsonify({
+        "success": True,
+        "data": {
+            "sinks": [sink.name for sink in alert_dispatcher.sinks],
+            "open_incidents": alert_dispatcher.open_incidents(),  # Host-wide
+            # The delivery queue and retries belong to the worker process answering this request
+            "worker_pid": os.getpid(),
+            "queued": alert_dispatcher.executor.queue_depth,
+            "pending_retries": alert_dispatcher.pending_retries(),
+            "dead_letters": alert_dispatcher.dead_letter_count(),
+            "dead_letter_path": ALERT_DEAD_LETTER_PATH,
+        }
+    }), 200
+
+@admin_bp.route('/alerts/test', methods=['POST'])
+@admin_required
+def send_test_alert_route(current_admin_user):
+    if not alert_dispatcher.enabled:
+        return jsonify({"success": False, "message": "No alert sinks are configured."}), 409
+    alert = alert_dispatcher.send_test()
+    current_app.logger.info(f"Test alert {alert['alert_id']} queued by admin {current_admin_user.get('email')}")
+    return jsonify({"success": True, "message": "Test alert queued.", "data": alert}), 200
+
+@admin_bp.route('/alerts/redeliver', methods=['POST'])
+@admin_required
+def redeliver_alerts_route(current_admin_user):
+    """Queues every dead-lettered alert delivery again."""
+    try:
+        queued = alert_dispatcher.redeliver_dead_letters()
+    except OSError as e:
+        current_app.logger.error(f"❌ Could not redeliver dead-lettered alerts: {e}")
+        return jsonify({"success": False, "message": "Could not read the dead-letter file."}), 500
+    return jsonify({"success": True, "message": f"{queued} alert deliveries queued again.", "data": {"queued": queued}}), 200
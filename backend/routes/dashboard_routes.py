@@ -1,18 +1,29 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, g, send_file
 from db_utils import get_db_connection
 from auth_utils import token_required
+from camera_registry import camera_registry, CAMERA_COLUMNS
+from admission import admission_controlled, inference_admission, vlm_admission
+from frame_control import update_motion, suggest_frame_control
+from tracking import get_tracker
+from spool import spool_detection
+import evidence_store
+from recording import recorder, verdict_of
+from alerts import dispatcher as alert_dispatcher
+from serialization import respond, columnar
+from metrics import StageTimer, FRAMES_ANALYZED, FRAMES_TRACKED, WEAPONS_DETECTED, STAGE_SECONDS
+from inference import (
+    get_optimized_yolo_model, decode_base64, decode_frame, preprocess_frame, run_inference,
+    summarize_weapon_detections, pack_objects, unpack_objects, WEAPON_CLASS_NAMES, INPUT_SIZE
+)
 import psycopg2
 import psycopg2.extras
 import requests
 import os
 from dotenv import load_dotenv
-import cv2
-import numpy as np
-from ultralytics import YOLO
-from datetime import datetime
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime
 
 load_dotenv()
 
@@ -20,35 +31,6 @@ dashboard_bp = Blueprint('dashboard_bp', __name__)
 
 LLAMA_SERVER_URL = os.getenv("LLAMA_SERVER_URL", "http://localhost:8080/v1/chat/completions")
 
-# Global thread pool for parallel processing
-thread_pool = ThreadPoolExecutor(max_workers=4)
-
-# Global model cache
-yolo_model = None
-model_lock = threading.Lock()
-
-def get_optimized_yolo_model():
-    """Get cached, optimized YOLO model"""
-    global yolo_model
-    if yolo_model is None:
-        with model_lock:
-            if yolo_model is None:
-                current_app.logger.info("🚀 Loading optimized YOLO model...")
-                # yolo_model = YOLO('yolov8n.pt')  # Use nano for speed
-                yolo_model = YOLO(r'H:\Code\Final Year Projectsss\CamWatch\code\runs\detect\train3\weights\best.pt')  # Use nano for speed
-                
-                # Optimize for real-time
-                yolo_model.overrides['verbose'] = False
-                yolo_model.overrides['save'] = False
-                yolo_model.overrides['show'] = False
-                
-                # Warm up with dummy image
-                dummy_img = np.zeros((320, 320, 3), dtype=np.uint8)
-                yolo_model(dummy_img, conf=0.3, iou=0.45, verbose=False)
-                
-                current_app.logger.info("⚡ YOLO model optimized for real-time!")
-    return yolo_model
-
 # Load fine-tuned YOLOv8m model for weapons detection
 # yolo_model = YOLO('yolov8m.pt')  # Replace with your fine-tuned model path
 # # yolo_model = YOLO(r'H:\Code\Final Year Projectsss\CamWatch\code\runs\detect\train3\weights\best.pt')  # Use nano for speed
@@ -62,6 +44,19 @@ def get_optimized_yolo_model():
 WEAPON_CLASSES = [
     'automatic rifle', 'granade launcher', 'knife', 'machine gun', 'pistol', 'rocket launcher', 'shotgun', 'sniper', 'sword'
 ]
+# Used when a frame doesn't name a camera known to the registry, or the camera has no threshold set
+DEFAULT_CAMERA_ID = 1
+DEFAULT_WEAPON_THRESHOLD = 0.15
+
+# detection id -> evidence reference; a detection's image never changes once written
+EVIDENCE_MAX_AGE = int(os.getenv('EVIDENCE_MAX_AGE', 7 * 24 * 3600))
+IMAGE_REF_CACHE_SIZE = 4096
+
+# The recent-detections feed only looks this far back, so older partitions are pruned from the plan
+RECENT_DETECTIONS_DAYS = int(os.getenv('RECENT_DETECTIONS_DAYS', 7))
+_image_refs = OrderedDict()
+_image_refs_lock = threading.Lock()
+
 # Suspicious objects
 SUSPICIOUS_CLASSES = [
     'backpack', 'handbag', 'suitcase'
@@ -70,23 +65,19 @@ SUSPICIOUS_CLASSES = [
 @dashboard_bp.route('/cameras', methods=['GET'])
 @token_required
 def get_dashboard_cameras(current_user):
-    conn = None
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute("SELECT id, name, location, ip_address, rtsp_url, is_active FROM cameras ORDER BY id ASC")
-            cameras = cur.fetchall()
-            cameras_list = [dict(cam_record) for cam_record in cameras]
-            return jsonify({"success": True, "data": cameras_list}), 200
+        cameras_list, etag = camera_registry.all()
+        # Conditional GET: the dashboard polls this, but the camera list rarely changes
+        response = jsonify({"success": True, "data": cameras_list})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
     except psycopg2.Error as db_error:
         current_app.logger.error(f"Database error fetching cameras: {db_error}")
         return jsonify({"success": False, "message": "Database error fetching cameras."}), 500
     except Exception as e:
         current_app.logger.error(f"Unexpected error fetching cameras: {e}")
         return jsonify({"success": False, "message": "An unexpected error occurred."}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @dashboard_bp.route('/cameras/<int:camera_id>/status', methods=['PUT'])
 @token_required
@@ -102,7 +93,7 @@ def toggle_camera_status(current_user, camera_id):
         conn = get_db_connection()
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
             cur.execute(
-                "UPDATE cameras SET is_active = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING id, name, is_active",
+                f"UPDATE cameras SET is_active = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING {CAMERA_COLUMNS}",
                 (is_active, camera_id)
             )
             updated_camera = cur.fetchone()
@@ -110,6 +101,7 @@ def toggle_camera_status(current_user, camera_id):
                 conn.rollback()
                 return jsonify({"success": False, "message": "Camera not found."}), 404
             conn.commit()
+            camera_registry.upsert(updated_camera)
             return jsonify({"success": True, "message": "Camera status updated.", "data": dict(updated_camera)}), 200
     except psycopg2.Error as db_error:
         current_app.logger.error(f"Database error updating camera: {db_error}")
@@ -125,6 +117,8 @@ def toggle_camera_status(current_user, camera_id):
         if conn:
             conn.close()
 
+DETECTION_COLUMNS = ('id', 'camera_id', 'detection_type', 'confidence', 'detected_at', 'image_path', 'objects', 'camera_name')
+
 @dashboard_bp.route('/recent-detections', methods=['GET'])
 @token_required
 def get_dashboard_recent_detections(current_user):
@@ -132,8 +126,10 @@ def get_dashboard_recent_detections(current_user):
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            # Fixed query - removed dl.bbox since it doesn't exist
-            cur.execute("""
+            # Boxes live in dl.objects; ?class_id=N keeps frames containing that class (GIN on class_ids)
+            class_id = request.args.get('class_id', type=int)
+            class_filter = "AND dl.class_ids @> ARRAY[%s]::smallint[]" if class_id is not None else ""
+            cur.execute(f"""
                 SELECT 
                     dl.id,
                     dl.camera_id,
@@ -141,22 +137,33 @@ def get_dashboard_recent_detections(current_user):
                     dl.confidence,
                     dl.detected_at,
                     dl.image_path,
+                    dl.objects,
                     COALESCE(c.name, 'Local Webcam') as camera_name
                 FROM detection_logs dl
                 LEFT JOIN cameras c ON dl.camera_id = c.id
+                WHERE dl.detected_at >= NOW() - make_interval(days => %s)
+                {class_filter}
                 ORDER BY dl.detected_at DESC
                 LIMIT 50
-            """)
+            """, (RECENT_DETECTIONS_DAYS,) + ((class_id,) if class_id is not None else ()))
             detections = cur.fetchall()
+            # ?format=columnar: one list per column, objects packed as stored plus the class table once
+            if request.args.get('format') == 'columnar':
+                data = columnar(detections, DETECTION_COLUMNS)
+                data['classes'] = WEAPON_CLASS_NAMES
+                return respond({"success": True, "data": data})
             detections_list = []
             for det_record in detections:
-                det_dict = dict(det_record)
-                if 'detected_at' in det_dict and hasattr(det_dict['detected_at'], 'isoformat'):
-                    det_dict['detected_at'] = det_dict['detected_at'].isoformat()
-                det_dict['details'] = f"{det_dict.get('detection_type', 'Unknown')} detection with {det_dict.get('confidence', 0):.2%} confidence"
+                det_dict = dict(det_record)  # detected_at is encoded as ISO 8601 by respond()
+                det_dict['objects'] = unpack_objects(det_dict.get('objects'))
+                if det_dict['objects']:
+                    names = ', '.join(sorted({obj['object'] for obj in det_dict['objects']}))
+                    det_dict['details'] = f"{names} detected with {det_dict.get('confidence', 0):.2%} confidence"
+                else:
+                    det_dict['details'] = f"{det_dict.get('detection_type', 'Unknown')} detection with {det_dict.get('confidence', 0):.2%} confidence"
                 detections_list.append(det_dict)
             current_app.logger.info(f"Fetched {len(detections_list)} detections")
-            return jsonify({"success": True, "data": detections_list}), 200
+            return respond({"success": True, "data": detections_list})
     except psycopg2.Error as db_error:
         current_app.logger.error(f"Database error fetching detections: {db_error}")
         return jsonify({"success": False, "message": "Database error fetching detections."}), 500
@@ -167,8 +174,76 @@ def get_dashboard_recent_detections(current_user):
         if conn:
             conn.close()
 
+def get_detection_image_ref(detection_id, detected_at=None):
+    """Returns a detection's image_path ('' if it has none, None if it doesn't exist), cached in memory.
+
+    With detected_at the lookup is pruned to the one partition holding the row;
+    without it every partition's primary key is probed.
+    """
+    with _image_refs_lock:
+        if detection_id in _image_refs:
+            _image_refs.move_to_end(detection_id)
+            return _image_refs[detection_id]
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            if detected_at is not None:
+                cur.execute("SELECT image_path FROM detection_logs WHERE id = %s AND detected_at = %s LIMIT 1",
+                            (detection_id, detected_at))
+            else:
+                cur.execute("SELECT image_path FROM detection_logs WHERE id = %s LIMIT 1", (detection_id,))
+            row = cur.fetchone()
+    finally:
+        if conn:
+            conn.close()
+    if row is None:
+        return None
+    with _image_refs_lock:
+        _image_refs[detection_id] = row[0] or ''
+        if len(_image_refs) > IMAGE_REF_CACHE_SIZE:
+            _image_refs.popitem(last=False)
+    return row[0] or ''
+
+@dashboard_bp.route('/detections/<int:detection_id>/image', methods=['GET'])
+@token_required
+def get_detection_image(current_user, detection_id):
+    """Evidence frame of a detection: ?size=thumb (default), preview or full; ?at=<detected_at> narrows the lookup."""
+    size = request.args.get('size', 'thumb')
+    if size != 'full' and size not in evidence_store.VARIANT_SIZES:
+        return jsonify({"success": False, "message": "size must be thumb, preview or full."}), 400
+    detected_at = request.args.get('at')
+    if detected_at is not None:
+        try:
+            detected_at = datetime.fromisoformat(detected_at.replace('Z', '+00:00'))
+        except ValueError:
+            return jsonify({"success": False, "message": "at must be an ISO 8601 timestamp."}), 400
+    try:
+        image_ref = get_detection_image_ref(detection_id, detected_at)
+    except psycopg2.Error as db_error:
+        current_app.logger.error(f"Database error fetching detection image: {db_error}")
+        return jsonify({"success": False, "message": "Database error fetching detection image."}), 500
+    if image_ref is None:
+        return jsonify({"success": False, "message": "Detection not found."}), 404
+
+    path = evidence_store.variant_path(image_ref, size) if image_ref else None
+    if path is None:
+        return jsonify({"success": False, "message": "No image stored for this detection."}), 404
+
+    # conditional=True answers If-None-Match/If-Modified-Since with 304 and Range with 206;
+    # the file is handed to the server's file wrapper (sendfile) rather than read into memory.
+    # The ETag is the frame's hash: a mtime-based one would change whenever the store touches the file
+    digest = evidence_store.digest_of(image_ref)
+    etag = f"{digest}-{size}" if digest else True
+    response = send_file(path, mimetype='image/jpeg', conditional=True, etag=etag, max_age=EVIDENCE_MAX_AGE)
+    response.cache_control.public = False
+    response.cache_control.private = True  # Authenticated content: browser cache only
+    response.cache_control.immutable = True
+    return response
+
 @dashboard_bp.route('/analyze-frame', methods=['POST'])
 @token_required
+@admission_controlled(vlm_admission)
 def analyze_frame_route(current_user):
     current_app.logger.info("Received /analyze-frame request")
     data = request.get_json()
@@ -204,141 +279,9 @@ def analyze_frame_route(current_user):
         current_app.logger.error(f"Error contacting SmolVLM: {e}")
         return jsonify({"success": False, "message": f"SmolVLM error: {e}"}), 500
 
-def analyze_detections_realtime(results, image_data, image_b64, is_realtime):
-    """Ultra-fast detection analysis using YOUR CUSTOM TRAINED MODEL"""
-    detected_objects = []
-    weapon_detected = False
-    weapon_types = []
-    highest_weapon_confidence = 0.0
-    
-    # ✅ YOUR ACTUAL TRAINED WEAPON CLASSES (from data.yaml)
-    YOUR_WEAPON_CLASSES = {
-        0: 'automatic rifle',
-        1: 'granade launcher', 
-        2: 'knife',
-        3: 'machine gun',
-        4: 'pistol',
-        5: 'rocket launcher',
-        6: 'shotgun',
-        7: 'sniper',
-        8: 'sword'
-    }
-    
-    current_app.logger.info("🎯 ANALYZING WITH YOUR CUSTOM WEAPON MODEL...")
-    
-    # Process YOLO results from YOUR trained model
-    for result in results:
-        boxes = result.boxes
-        if boxes is not None:
-            current_app.logger.info(f"📦 Found {len(boxes)} detections")
-            
-            for box in boxes:
-                class_id = int(box.cls)
-                confidence = float(box.conf)
-                
-                # ✅ CHECK YOUR CUSTOM WEAPON CLASSES FIRST
-                if class_id in YOUR_WEAPON_CLASSES:
-                    weapon_name = YOUR_WEAPON_CLASSES[class_id]
-                    is_custom_weapon = True
-                    current_app.logger.warning(f"🚨 CUSTOM WEAPON FOUND: {weapon_name} (ID:{class_id}, conf:{confidence:.3f})")
-                else:
-                    # Fallback to standard YOLO classes
-                    weapon_name = results[0].names[class_id].lower() if class_id in results[0].names else f"object_{class_id}"
-                    is_custom_weapon = False
-                    current_app.logger.info(f"📝 Standard object: {weapon_name} (ID:{class_id}, conf:{confidence:.3f})")
-                
-                detected_objects.append({
-                    'object': weapon_name,
-                    'confidence': round(confidence, 3),
-                    'class_id': class_id,
-                    'is_custom_weapon': is_custom_weapon
-                })
-                
-                # ✅ IMMEDIATE WEAPON DETECTION - VERY LOW THRESHOLD
-                if is_custom_weapon and confidence > 0.15:  # Very low threshold for trained model
-                    weapon_detected = True
-                    weapon_types.append(weapon_name)
-                    highest_weapon_confidence = max(highest_weapon_confidence, confidence)
-                    current_app.logger.error(f"🚨🚨🚨 WEAPON ALERT: {weapon_name} detected with {confidence:.3f} confidence!")
-    
-    # ✅ IMMEDIATE RESPONSE
-    if weapon_detected:
-        description = f"🚨 WEAPON DETECTED: {', '.join(weapon_types)} ({highest_weapon_confidence:.2%} confidence)"
-        
-        # Save immediately in background (don't block)
-        def immediate_save():
-            try:
-                save_weapon_detection_fast(image_data, weapon_types, highest_weapon_confidence)
-                current_app.logger.info(f"✅ Weapon saved: {weapon_types}")
-            except Exception as e:
-                current_app.logger.error(f"Save error: {e}")
-        
-        thread_pool.submit(immediate_save)
-        
-        return {
-            "success": True,
-            "description": description,
-            "weapon_detected": True,
-            "detected_objects": detected_objects,
-            "weapon_types": weapon_types,
-            "confidence": highest_weapon_confidence,
-            "processing_time": "ultra_fast",
-            "ai_description": f"TRAINED MODEL DETECTED: {', '.join(weapon_types)}",
-            "smol_used": False,
-            "suspicious_detected": False,
-            "alert_level": "CRITICAL"
-        }
-    else:
-        # ✅ MINIMAL RESPONSE FOR SAFE FRAMES
-        current_app.logger.info(f"✅ Safe scan: {len(detected_objects)} objects, no weapons")
-        return {
-            "success": True,
-            "description": f"✅ Safe - {len(detected_objects)} objects monitored",
-            "weapon_detected": False,
-            "detected_objects": [],  # Don't send objects for safe frames
-            "weapon_types": [],
-            "confidence": 0,
-            "processing_time": "ultra_fast",
-            "ai_description": "",
-            "smol_used": False
-        }
-
-def save_weapon_detection(image_data, weapon_types, confidence, description):
-    """Fast database save for real-time detections"""
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            # Save image in background
-            images_dir = os.path.join(os.path.dirname(__file__), '..', 'detection_images')
-            os.makedirs(images_dir, exist_ok=True)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  # Include milliseconds
-            image_filename = f"realtime_weapon_{timestamp}.jpg"
-            image_path = os.path.join(images_dir, image_filename)
-            
-            with open(image_path, 'wb') as f:
-                f.write(image_data)
-            
-            # Fast database insert
-            cur.execute("""
-                INSERT INTO detection_logs 
-                (camera_id, detection_type, confidence, detected_at, image_path)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
-                1, 'weapon', confidence, datetime.now(), image_filename
-            ))
-            
-            conn.commit()
-            current_app.logger.info(f"⚡ Real-time detection saved: {weapon_types}")
-            
-    except Exception as e:
-        current_app.logger.error(f"❌ Fast save failed: {e}")
-    finally:
-        if conn:
-            conn.close()
-
 @dashboard_bp.route('/analyze-frame-smart', methods=['POST'])
 @token_required
+@admission_controlled(inference_admission)
 def analyze_frame_smart(current_user):
     """SILENT ultra-fast analysis - NO LOGGING"""
     data = request.get_json()
@@ -347,94 +290,123 @@ def analyze_frame_smart(current_user):
     
     if not image_b64:
         return jsonify({"success": False}), 400
+
+    # ✅ Per-camera settings come from the in-memory registry, never from Postgres
+    camera = None
+    if data.get('camera_id') is not None:
+        try:
+            camera = camera_registry.get(int(data['camera_id']))  # Registry keys are ints; JSON may send "3"
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "message": "camera_id must be an integer."}), 400
+    if camera and not camera['is_active']:
+        return jsonify({"success": False, "message": "Camera is inactive."}), 409
+    threshold = DEFAULT_WEAPON_THRESHOLD
+    if camera and camera.get('confidence_threshold') is not None:
+        threshold = camera['confidence_threshold']
+    camera_id = camera['id'] if camera else DEFAULT_CAMERA_ID
     
     try:
+        timer = g.stage_timer = StageTimer()
+
         # ✅ SILENT decode
-        import base64
-        image_data = base64.b64decode(image_b64)
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # ✅ FAST resize
-        image = cv2.resize(image, (320, 320))
+        image_data = decode_base64(image_b64)
+        image = decode_frame(image_data)
+        timer.mark('decode')
         
-        # ✅ SILENT YOLO
-        model = get_optimized_yolo_model()
-        results = model(image, conf=0.15, verbose=False, save=False)
-        
-        # ✅ SILENT analysis
-        return analyze_detections_silent(results, image_data, image_b64)
+        # ✅ FAST resize (only inside the camera's region of interest)
+        roi = camera.get('roi') if camera else None
+        image = preprocess_frame(image, roi)
+        motion = update_motion(g.get('stream_key'), image)
+        timer.mark('preprocess')
+
+        # ✅ YOLO on keyframes only; the tracker moves the boxes on the frames in between
+        tracker = get_tracker(g.get('stream_key'))
+        keyframe = tracker.needs_detection(threshold, motion)
+        if not keyframe:
+            detected_objects = tracker.predict()
+            timer.mark('track')
+            FRAMES_TRACKED.inc((str(camera_id),))
+            response = detection_response(detected_objects, keyframe=False)
+        else:
+            # ✅ SILENT YOLO
+            model = get_optimized_yolo_model()
+            results = run_inference(model, image, threshold, imgsz=INPUT_SIZE)
+            timer.mark('inference')
+            FRAMES_ANALYZED.inc((str(camera_id),))
+
+            # ✅ SILENT analysis
+            response = analyze_detections_silent(results, image_data, image_b64, threshold, camera_id, roi, tracker)
+
+        # ✅ Traffic capture for benchmarks/replay.py (off unless an admin started one)
+        if recorder.active:
+            # The camera the frame was analyzed as; None for frames that fell back to DEFAULT_CAMERA_ID
+            recorder.capture(image_data, camera['id'] if camera else None, data.get('stream_id'),
+                             verdict_of(g.response_payload))
+        return response
         
     except Exception as e:
         if not silent_mode:
             current_app.logger.error(f"Analysis error: {e}")
         return jsonify({"success": False}), 500
 
-def analyze_detections_silent(results, image_data, image_b64):
+def analyze_detections_silent(results, image_data, image_b64, threshold=None, camera_id=None, roi=None, tracker=None):
     """SILENT detection analysis - NO LOGGING"""
-    weapon_detected = False
-    weapon_types = []
-    confidence = 0
-    detected_objects = []
-    
-    WEAPON_CLASSES = {
-        0: 'automatic rifle', 1: 'granade launcher', 2: 'knife',
-        3: 'machine gun', 4: 'pistol', 5: 'rocket launcher',
-        6: 'shotgun', 7: 'sniper', 8: 'sword'
-    }
-    
+    threshold = DEFAULT_WEAPON_THRESHOLD if threshold is None else threshold
+    camera_id = DEFAULT_CAMERA_ID if camera_id is None else camera_id
+
     # ✅ FAST processing
-    for result in results:
-        if result.boxes is not None:
-            for box in result.boxes:
-                class_id = int(box.cls)
-                conf = float(box.conf)
-                
-                if class_id in WEAPON_CLASSES and conf > 0.15:
-                    weapon_detected = True
-                    weapon_name = WEAPON_CLASSES[class_id]
-                    weapon_types.append(weapon_name)
-                    confidence = max(confidence, conf)
-                    
-                    detected_objects.append({
-                        'object': weapon_name,
-                        'confidence': conf,
-                        'class_id': class_id
-                    })
-                    
-                    # ✅ SILENT background save
-                    thread_pool.submit(save_detection_silent, image_data, weapon_name, conf)
+    weapon_types, confidence, detected_objects = summarize_weapon_detections(results, threshold, roi)
+    if tracker:
+        detected_objects = tracker.update(detected_objects)  # Adds stable track ids
+    if 'stage_timer' in g:
+        g.stage_timer.mark('postprocess')
+
+    # ✅ SILENT save: one row per frame with every object; a spool append is cheap enough for the request thread
+    for detected in detected_objects:
+        WEAPONS_DETECTED.inc((str(camera_id), detected['object']))
+    image_ref = None
+    if detected_objects:
+        image_ref = save_detection_silent(image_data, detected_objects, camera_id)
     
-    # ✅ MINIMAL response
-    if weapon_detected:
-        return jsonify({
+    if weapon_types:
+        # Alerting streams jump the admission queue for a while
+        inference_admission.note_alert(g.get('stream_key'))
+        # ✅ Notify security staff; only queues deliveries, and only when an incident opens or escalates
+        alert_dispatcher.notify(camera_id, weapon_types, confidence, image_ref)
+    return detection_response(detected_objects)
+
+def detection_response(detected_objects, keyframe=True):
+    """MINIMAL response for a detected (keyframe) or tracked frame"""
+    if detected_objects:
+        weapon_types = [detected['object'] for detected in detected_objects]
+        confidence = max(detected['confidence'] for detected in detected_objects)
+        payload = {
             "success": True,
             "weapon_detected": True,
             "weapon_types": weapon_types,
             "confidence": confidence,
             "description": f"🚨 {', '.join(weapon_types)} detected",
-            "detected_objects": detected_objects
-        }), 200
+            "detected_objects": detected_objects,
+            "keyframe": keyframe,
+            "control": suggest_frame_control(g.get('stream_key'))
+        }
     else:
-        return jsonify({
+        payload = {
             "success": True,
             "weapon_detected": False,
-            "description": "✅ Safe"
-        }), 200
+            "description": "✅ Safe",
+            "keyframe": keyframe,
+            "control": suggest_frame_control(g.get('stream_key'))
+        }
+    g.response_payload = payload  # For the traffic recorder, whatever the encoding
+    return respond(payload)
 
-def save_detection_silent(image_data, weapon_name, confidence):
-    """SILENT save - NO LOGGING"""
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO detection_logs 
-                (camera_id, detection_type, confidence, detected_at)
-                VALUES (%s, %s, %s, %s)
-            """, (1, 'weapon', confidence, datetime.now()))
-            conn.commit()
-    except:
-        pass  # Silent failure
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+def save_detection_silent(image_data, detected_objects, camera_id=DEFAULT_CAMERA_ID):
+    """SILENT save - NO LOGGING. Appends to the local spool; the drainer writes it to Postgres."""
+    started_at = time.perf_counter()
+    image_ref = evidence_store.reference_of(image_data)
+    confidence = max(detected['confidence'] for detected in detected_objects)
+    if spool_detection(camera_id, 'weapon', confidence, image_path=image_ref, objects=pack_objects(detected_objects),
+                       image=image_data):
+        STAGE_SECONDS.observe(time.perf_counter() - started_at, ('persist',))
+    return image_ref
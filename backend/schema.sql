@@ -24,30 +24,60 @@ CREATE TABLE IF NOT EXISTS cameras (
     ip_address INET,
     rtsp_url VARCHAR(500),
     is_active BOOLEAN DEFAULT TRUE,
+    roi JSONB, -- Optional region of interest [x1, y1, x2, y2], normalized to 0..1
+    confidence_threshold REAL CHECK (confidence_threshold >= 0 AND confidence_threshold <= 1), -- NULL uses the default
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Per-camera inference settings for databases created before they existed
+ALTER TABLE cameras ADD COLUMN IF NOT EXISTS roi JSONB;
+ALTER TABLE cameras ADD COLUMN IF NOT EXISTS confidence_threshold REAL CHECK (confidence_threshold >= 0 AND confidence_threshold <= 1);
+
 -- Create indexes for cameras table
 CREATE INDEX IF NOT EXISTS idx_cameras_active ON cameras(is_active);
 CREATE INDEX IF NOT EXISTS idx_cameras_location ON cameras(location);
+-- One camera per name and location, case-insensitively (bulk imports insert with ON CONFLICT DO NOTHING).
+-- Rename duplicates in existing databases before applying this.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cameras_name_location ON cameras (lower(name), lower(location));
 
 -- =================================
 -- Detection Logs (After AI Detection)
 -- =================================
 CREATE TABLE IF NOT EXISTS detection_logs (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     camera_id INTEGER REFERENCES cameras(id) ON DELETE SET NULL, -- Link to camera
     detection_type VARCHAR(50) NOT NULL, -- e.g., 'weapon', 'violence', 'intrusion'
     confidence REAL CHECK (confidence >= 0 AND confidence <= 1), -- Confidence score
-    detected_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- When it was detected
+    detected_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP, -- When it was detected (partition key)
+    event_id UUID, -- Assigned when the detection is spooled; makes spool replay idempotent
     image_path VARCHAR(255), -- Optional: path to a stored image/frame
     details TEXT, -- Optional: any other details in JSON or text
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP -- When the log entry was created
-);
+    objects JSONB, -- Every object in the frame: [[class_id, conf_milli, x1, y1, x2, y2], ...], box in 1/10000 of the frame
+    class_ids SMALLINT[], -- Distinct class ids in objects, for class-filtered queries
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- When the log entry was created
+    PRIMARY KEY (id, detected_at) -- The partition key must be part of the primary key
+) PARTITION BY RANGE (detected_at);
 
--- Create indexes for detection_logs table
-CREATE INDEX IF NOT EXISTS idx_detection_logs_camera_id ON detection_logs(camera_id);
-CREATE INDEX IF NOT EXISTS idx_detection_logs_type ON detection_logs(detection_type);
+-- Catch-all for rows outside every range partition. partition_maintenance.py
+-- creates the daily/monthly partitions ahead of time so this should stay empty.
+CREATE TABLE IF NOT EXISTS detection_logs_default PARTITION OF detection_logs DEFAULT;
+
+-- Create indexes for detection_logs table (propagated to every partition).
+-- The B-tree serves ORDER BY detected_at DESC LIMIT n (the dashboard feed); rows
+-- arrive in detected_at order, so the BRIN index keeps wide range scans (exports,
+-- reports) to a few pages per partition. Lookups by id use the primary key.
 CREATE INDEX IF NOT EXISTS idx_detection_logs_detected_at ON detection_logs(detected_at);
-CREATE INDEX IF NOT EXISTS idx_detection_logs_confidence ON detection_logs(confidence);
+CREATE INDEX IF NOT EXISTS idx_detection_logs_detected_at_brin ON detection_logs USING BRIN (detected_at) WITH (pages_per_range = 32);
+CREATE INDEX IF NOT EXISTS idx_detection_logs_camera_detected ON detection_logs(camera_id, detected_at);
+
+-- Spool replay inserts with ON CONFLICT (event_id, detected_at) DO NOTHING
+-- (a unique index on a partitioned table must include the partition key).
+ALTER TABLE detection_logs ADD COLUMN IF NOT EXISTS event_id UUID;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_detection_logs_event_id ON detection_logs(event_id, detected_at);
+
+-- Per-object storage: one row per analyzed frame, objects packed into JSONB.
+-- "Frames with a pistol" is WHERE class_ids @> ARRAY[4]::smallint[] (GIN index).
+ALTER TABLE detection_logs ADD COLUMN IF NOT EXISTS objects JSONB;
+ALTER TABLE detection_logs ADD COLUMN IF NOT EXISTS class_ids SMALLINT[];
+CREATE INDEX IF NOT EXISTS idx_detection_logs_class_ids ON detection_logs USING GIN (class_ids);
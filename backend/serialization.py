@@ -0,0 +1,89 @@
+"""Response serialization for the high-frequency endpoints.
+
+respond() encodes with orjson when it is installed (datetime, UUID and numpy
+values natively, Decimal as a number), falling back to the standard json
+module otherwise. Clients that send Accept: application/msgpack get
+MessagePack instead, if msgpack is installed; JSON stays the default, so
+existing clients see no difference. Datetimes are ISO 8601 strings in both
+encodings.
+
+columnar() turns a list of row dicts into one list per column, which drops
+the repeated keys and compresses better; recent-detections serves it for
+?format=columnar.
+"""
+import datetime
+import decimal
+import json
+import uuid
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if hasattr(value, 'tolist'):  # numpy scalars and arrays
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps_json(payload):
+        return orjson.dumps(payload, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps_json(payload):
+        return json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_msgpack(payload):
+    return msgpack.packb(payload, default=_default, use_bin_type=True, datetime=False)
+
+
+def negotiate():
+    """The response mimetype for the current request's Accept header."""
+    if msgpack is None:
+        return JSON_MIMETYPE
+    best = request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES, default=JSON_MIMETYPE)
+    return best
+
+
+def respond(payload, status=200, headers=None):
+    """Encodes payload as JSON or MessagePack, whichever the client asked for."""
+    mimetype = negotiate()
+    body = dumps_msgpack(payload) if mimetype in MSGPACK_MIMETYPES else dumps_json(payload)
+    response = Response(body, status=status, mimetype=mimetype, headers=headers)
+    if msgpack is not None:
+        response.vary.add('Accept')
+    return response
+
+
+def columnar(rows, columns=None):
+    """[{'a': 1, 'b': 2}, ...] -> {'count': n, 'columns': {'a': [1, ...], 'b': [2, ...]}}.
+
+    `columns` picks and orders the columns; by default those of the first row.
+    """
+    if columns is None:
+        columns = list(rows[0]) if rows else []
+    return {
+        'count': len(rows),
+        'columns': {column: [row.get(column) for row in rows] for column in columns},
+    }
@@ -0,0 +1,122 @@
+"""Production entry point: pre-fork gunicorn with the model shared copy-on-write.
+
+The master imports the app and loads + warms the YOLO model once (preload_app),
+then forks the workers. The weights' pages are shared between all workers
+until one of them writes to them, which inference never does, so each extra
+worker costs its own Python heap rather than another copy of the model.
+gc.freeze() before forking keeps the collector from touching (and therefore
+copying) the objects created at boot.
+
+    python serve.py                       # from the backend directory
+    WEB_WORKERS=6 WEB_THREADS=2 python serve.py
+
+Threads started at import (partition maintenance) run in the master only.
+
+The master plans the CPU layout for all workers (cpu_topology.py); each
+worker gets a slot in pre_fork, which a recycled worker's replacement
+reuses, and applies that slot's cores and thread counts in post_fork.
+
+Admission budgets are per process, so SERVE_INFERENCE_CONCURRENCY (default:
+INFERENCE_CONCURRENCY) is the host-wide number of concurrent inferences and
+each worker gets an equal share of it, at least one.
+"""
+import gc
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Warm up in the master before forking, never in a background thread that the fork would drop
+os.environ['MODEL_WARMUP'] = os.getenv('SERVE_MODEL_WARMUP', 'sync')
+
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', max(2, (os.cpu_count() or 2) // 2)))
+SERVE_INFERENCE_CONCURRENCY = int(os.getenv('SERVE_INFERENCE_CONCURRENCY', os.getenv('INFERENCE_CONCURRENCY', 2)))
+# Per-worker share, set before admission.py and cpu_topology.py read it
+WORKER_INFERENCE_CONCURRENCY = max(1, SERVE_INFERENCE_CONCURRENCY // max(1, WEB_WORKERS))
+os.environ['INFERENCE_CONCURRENCY'] = str(WORKER_INFERENCE_CONCURRENCY)
+
+from gunicorn.app.base import BaseApplication
+
+import cpu_topology
+
+WEB_THREADS = int(os.getenv('WEB_THREADS', 4))                            # per worker
+WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', 5000))               # recycle workers (0 = never)
+WEB_MAX_REQUESTS_JITTER = int(os.getenv('WEB_MAX_REQUESTS_JITTER', 500))  # so workers don't recycle together
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', 60))
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))         # drain in-flight requests on SIGTERM/HUP
+WEB_KEEPALIVE = int(os.getenv('WEB_KEEPALIVE', 5))
+
+cpu_topology.defer_to_workers()
+cpu_layout = cpu_topology.plan_layout(cpu_topology.get_topology(), workers=WEB_WORKERS)
+
+
+def on_starting(server):
+    server.log.info(cpu_topology.format_report(cpu_layout))
+    total = WORKER_INFERENCE_CONCURRENCY * WEB_WORKERS
+    server.log.info(f"Inference admission: {WORKER_INFERENCE_CONCURRENCY} per worker x {WEB_WORKERS} workers = {total} "
+                    f"concurrent (SERVE_INFERENCE_CONCURRENCY={SERVE_INFERENCE_CONCURRENCY})")
+    if total > SERVE_INFERENCE_CONCURRENCY:
+        server.log.warning(f"⚠️ Every worker needs at least one inference slot; lower WEB_WORKERS to stay within "
+                           f"SERVE_INFERENCE_CONCURRENCY={SERVE_INFERENCE_CONCURRENCY}")
+
+
+def pre_fork(server, worker):
+    # Lowest slot no live worker holds, so a recycled worker's replacement takes over its cores
+    taken = {getattr(live, 'cpu_slot', None) for live in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+    # Objects that exist now (model, modules) are shared; keep the GC from writing to their headers
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Give each worker its share of the cores instead of every worker spawning one thread per core."""
+    layout = cpu_topology.apply_layout(cpu_layout, worker.cpu_slot)
+    if layout is None:
+        server.log.info(f"Worker {worker.pid} ready ({server.cfg.threads} request threads, default CPU layout)")
+        return
+    server.log.info(f"Worker {worker.pid} ready in slot {layout.slot}: inference CPUs "
+                    f"{cpu_topology.format_cpulist(layout.inference_cpus)} ({layout.torch_threads} torch threads), "
+                    f"io CPUs {cpu_topology.format_cpulist(layout.io_cpus)}, {server.cfg.threads} request threads")
+
+
+class CamWatchServer(BaseApplication):
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app
+
+
+def main():
+    host = os.getenv('HOST', '127.0.0.1')
+    port = int(os.getenv('PORT', 5000))
+    options = {
+        'bind': f"{host}:{port}",
+        'workers': WEB_WORKERS,
+        'threads': WEB_THREADS,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'max_requests': WEB_MAX_REQUESTS,
+        'max_requests_jitter': WEB_MAX_REQUESTS_JITTER,
+        'timeout': WEB_TIMEOUT,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        'keepalive': WEB_KEEPALIVE,
+        'on_starting': on_starting,
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+        'accesslog': os.getenv('WEB_ACCESS_LOG') or None,
+    }
+    CamWatchServer(options).run()
+
+
+if __name__ == '__main__':
+    main()
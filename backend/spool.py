@@ -0,0 +1,405 @@
+"""Local write-ahead spool for detection records.
+
+Detections are appended to local segment files first and replayed into
+detection_logs by a background drainer, so the analyze path never waits on
+Postgres and nothing is lost while the database is slow, restarting or
+failing over.
+
+Segments live in SPOOL_DIR as <pid>-<start>-<seq>.open while a process
+writes to them and are renamed to .log ("sealed") once they are full or
+SPOOL_SEAL_MS old. Each record is framed as
+
+    <u32 payload length> <u32 crc32(payload)> <payload>
+
+where the payload is the detection as JSON, optionally followed by a newline
+and the evidence frame's bytes (compact JSON never contains a raw newline).
+The frame rides in the record so it is exactly as durable as the detection;
+the drainer writes it to evidence_store before inserting the row, so no row
+ever points at a frame a crash lost. Appends are unbuffered writes, so they
+survive a crashed worker; a flusher thread per process fsyncs the open
+segment every SPOOL_FSYNC_INTERVAL_MS, so many appends share one fsync, and
+seals full segments. Neither holds the lock appends take, so a request never
+waits on the disk.
+
+The drainer (one at a time across processes, via flock) reads sealed
+segments in order, bulk-inserts them with ON CONFLICT (event_id, detected_at)
+DO NOTHING and deletes the segment after the commit. A crash anywhere in
+between only means the segment is replayed again, which the unique event_id
+makes harmless. Segments left .open by a dead process are sealed by the
+drainer; a torn record at their end is skipped.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+import psycopg2
+import psycopg2.extras
+
+import cpu_topology
+import evidence_store
+from db_utils import get_db_connection
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = os.getenv('SPOOL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'detection_spool'))
+SPOOL_SEGMENT_BYTES = int(os.getenv('SPOOL_SEGMENT_BYTES', 16 * 1024 * 1024))
+SPOOL_SEAL_MS = int(os.getenv('SPOOL_SEAL_MS', 1000))                    # Max age before a segment can be drained
+SPOOL_FSYNC_INTERVAL_MS = int(os.getenv('SPOOL_FSYNC_INTERVAL_MS', 50))  # Group-commit window
+SPOOL_DRAIN_INTERVAL_MS = int(os.getenv('SPOOL_DRAIN_INTERVAL_MS', 1000))
+SPOOL_BATCH_SIZE = int(os.getenv('SPOOL_BATCH_SIZE', 500))
+
+_FRAME = struct.Struct('<II')
+
+RECORDS = Counter('camwatch_spool_records_total',
+                  "Spooled detection records by outcome (appended, append_failed, replayed, duplicate, rejected, corrupt).",
+                  ('outcome',))
+REPLAY_SECONDS = Gauge('camwatch_spool_last_replay_timestamp_seconds', "Unix time of the last successful spool replay.")
+
+
+def _segment_paths(suffix):
+    return sorted(glob.glob(os.path.join(SPOOL_DIR, f'*{suffix}')), key=_segment_sort_key)
+
+
+def _segment_sort_key(path):
+    pid, started, seq = os.path.basename(path).split('.')[0].split('-')
+    return int(started), int(pid), int(seq)
+
+
+def spool_backlog():
+    """(segments, bytes) not yet replayed into the database."""
+    paths = _segment_paths('.log') + _segment_paths('.open')
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return len(paths), total
+
+
+Gauge('camwatch_spool_backlog_bytes', "Bytes of spooled detections waiting to be replayed.", lambda: spool_backlog()[1])
+
+
+class _Segment:
+    __slots__ = ('path', 'file', 'opened_at', 'written', 'durable', 'failed')
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab', buffering=0)  # Each append reaches the page cache, surviving a worker crash
+        self.opened_at = time.monotonic()
+        self.written = 0      # Records appended
+        self.durable = 0      # Records known to be on disk
+        self.failed = False   # fsync/seal failed: waiters must not wait forever
+
+
+class SpoolWriter:
+    """Appends framed records to this process's open segment.
+
+    Appends only write() under the lock. fsync, close and rename run on the
+    flusher thread (or in close()) outside it, so a request never waits on the
+    disk: a full or old segment is swapped out under the lock and sealed by
+    the flusher, and the next append opens a new one.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES,
+                 seal_ms=SPOOL_SEAL_MS, fsync_interval_ms=SPOOL_FSYNC_INTERVAL_MS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.seal_after = seal_ms / 1000.0
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)   # Signalled when records become durable
+        self._work = threading.Condition(self._lock)     # Wakes the flusher for a full segment
+        self._io_lock = threading.Lock()                 # Serializes fsync/close/rename (flusher vs close())
+        self._pid = None
+        self._segment = None
+        self._full = []        # Swapped-out segments waiting for the flusher to seal them
+        self._seq = 0
+        self._started = 0
+
+    def append(self, payload, wait=False):
+        """Appends one record. With wait=True, returns only after it has been fsynced."""
+        frame = _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            self._ensure_process()
+            if self._segment is None:
+                self._seq += 1
+                self._segment = _Segment(os.path.join(self.directory, f"{self._pid}-{self._started}-{self._seq}.open"))
+            segment = self._segment
+            segment.file.write(frame)
+            segment.written += 1
+            target = segment.written
+            if segment.file.tell() >= self.segment_bytes:
+                self._full.append(segment)
+                self._segment = None
+                self._work.notify()
+            if wait:
+                while segment.durable < target and not segment.failed:
+                    self._synced.wait()
+                if segment.failed:
+                    raise OSError(f"Spool segment {os.path.basename(segment.path)} could not be synced")
+
+    def _ensure_process(self):
+        # The flusher thread doesn't survive fork(); neither should a segment shared with the parent
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._segment = None
+        self._full = []
+        self._started = time.time_ns()
+        self._seq = 0
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name='spool-flusher', daemon=True).start()
+
+    def _sync(self, segment, target):
+        """Fsyncs outside the lock, then marks the first `target` records durable."""
+        try:
+            os.fsync(segment.file.fileno())
+        except OSError:
+            with self._lock:
+                segment.failed = True
+                self._synced.notify_all()
+            raise
+        with self._lock:
+            segment.durable = max(segment.durable, target)
+            self._synced.notify_all()
+
+    def _seal(self, segment):
+        """Fsyncs, closes and renames a segment nobody appends to any more (called outside the lock)."""
+        self._sync(segment, segment.written)
+        segment.file.close()
+        os.rename(segment.path, segment.path[:-len('.open')] + '.log')
+
+    def _take_work(self, seal_all=False):
+        # Caller holds _lock: swaps out segments to seal, and snapshots the open one for an fsync
+        to_seal, self._full = self._full, []
+        segment = self._segment
+        if segment is not None and (seal_all or time.monotonic() - segment.opened_at >= self.seal_after):
+            to_seal.append(segment)
+            self._segment = segment = None
+        target = segment.written if segment is not None and segment.durable < segment.written else 0
+        return to_seal, segment, target
+
+    def _flush_loop(self):
+        cpu_topology.pin_current_thread('io')
+        pid = os.getpid()
+        while self._pid == pid:
+            with self._lock:
+                if not self._full:
+                    self._work.wait(self.fsync_interval)
+            with self._io_lock:
+                with self._lock:
+                    to_seal, segment, target = self._take_work()
+                try:
+                    if target:
+                        self._sync(segment, target)
+                except OSError as e:
+                    logger.error(f"❌ Spool flush failed: {e}")
+                for full in to_seal:
+                    try:
+                        self._seal(full)
+                    except OSError as e:
+                        logger.error(f"❌ Could not seal spool segment {os.path.basename(full.path)}: {e}")
+                        if not full.file.closed:
+                            with self._lock:
+                                self._full.append(full)  # Retried on the next pass
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        with self._io_lock:
+            with self._lock:
+                to_seal, _, _ = self._take_work(seal_all=True)
+            for segment in to_seal:
+                try:
+                    self._seal(segment)
+                except OSError as e:
+                    logger.error(f"❌ Could not seal spool segment {os.path.basename(segment.path)}: {e}")
+
+
+def encode_record(header, image=None):
+    payload = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return payload if image is None else payload + b'\n' + image
+
+
+def decode_record(payload):
+    """The record's header, with the evidence frame (or None) under 'image'."""
+    document, _, image = payload.partition(b'\n')
+    header = json.loads(document)
+    header['image'] = image or None
+    return header
+
+
+def read_segment(path):
+    """Yields the header of every intact record; stops at the first torn or corrupt one."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            RECORDS.inc(('corrupt',))
+            logger.warning(f"⚠️ Spool segment {os.path.basename(path)} is torn at byte {offset}; skipping the rest")
+            return
+        yield decode_record(payload)
+        offset += _FRAME.size + length
+
+
+writer = SpoolWriter()
+atexit.register(writer.close)
+
+
+def spool_detection(camera_id, detection_type, confidence, image_path=None, details=None,
+                    detected_at=None, objects=None, image=None, wait=False):
+    """Appends one detection to the spool. Returns its event_id, or None if the spool couldn't be written.
+
+    `objects` are the frame's objects as packed by inference.pack_objects. `image` is the evidence
+    frame stored under `image_path` (see evidence_store.reference_of); the drainer writes it.
+    """
+    event_id = str(uuid.uuid4())
+    header = {
+        'event_id': event_id,
+        'camera_id': camera_id,
+        'detection_type': detection_type,
+        'confidence': confidence,
+        'detected_at': (detected_at or datetime.now(timezone.utc)).isoformat(),
+        'image_path': image_path,
+        'details': details,
+        'objects': objects,
+    }
+    try:
+        writer.append(encode_record(header, image), wait=wait)
+    except (OSError, ValueError, TypeError) as e:
+        RECORDS.inc(('append_failed',))
+        logger.error(f"❌ Could not spool detection: {e}")
+        return None
+    RECORDS.inc(('appended',))
+    return event_id
+
+
+# --- Replay ---
+
+INSERT_SQL = """
+    INSERT INTO detection_logs
+    (event_id, camera_id, detection_type, confidence, detected_at, image_path, details, objects, class_ids)
+    VALUES %s
+    ON CONFLICT (event_id, detected_at) DO NOTHING
+"""
+
+
+def _row(header):
+    objects = header.get('objects')
+    class_ids = sorted({obj[0] for obj in objects}) if objects is not None else None
+    return (header['event_id'], header['camera_id'], header['detection_type'], header['confidence'],
+            header['detected_at'], header['image_path'], header['details'],
+            psycopg2.extras.Json(objects) if objects is not None else None, class_ids)
+
+
+def _insert_rows(conn, rows):
+    """Bulk-inserts rows; if the batch is refused, retries row by row so one bad record can't block the spool."""
+    try:
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(cur, INSERT_SQL, rows, page_size=len(rows))
+            inserted = cur.rowcount
+        conn.commit()
+        RECORDS.inc(('replayed',), inserted)
+        RECORDS.inc(('duplicate',), len(rows) - inserted)
+        return
+    except (psycopg2.IntegrityError, psycopg2.DataError):
+        conn.rollback()
+    for row in rows:
+        try:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, INSERT_SQL, [row])
+                RECORDS.inc(('replayed',) if cur.rowcount else ('duplicate',))
+            conn.commit()
+        except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+            conn.rollback()
+            RECORDS.inc(('rejected',))
+            logger.error(f"❌ Dropping spooled detection {row[0]}: {e}")
+
+
+def replay_segment(conn, path, batch_size=SPOOL_BATCH_SIZE):
+    """Inserts a segment's rows, storing each record's evidence frame first.
+
+    An OSError from the evidence store propagates: the segment stays and is replayed on the next pass.
+    """
+    rows = []
+    for header in read_segment(path):
+        if header['image'] is not None and header['image_path']:
+            evidence_store.store(header['image_path'], header['image'])
+        rows.append(_row(header))
+        if len(rows) >= batch_size:
+            _insert_rows(conn, rows)
+            rows = []
+    if rows:
+        _insert_rows(conn, rows)
+
+
+def _seal_orphans():
+    """Seals .open segments whose writer process is gone."""
+    for path in _segment_paths('.open'):
+        pid = int(os.path.basename(path).split('-')[0])
+        if pid == os.getpid():
+            continue
+        try:
+            os.kill(pid, 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue
+        os.rename(path, path[:-len('.open')] + '.log')
+
+
+def drain(batch_size=SPOOL_BATCH_SIZE):
+    """Replays every sealed segment. Returns the number of segments replayed, or None if another drainer runs."""
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    with open(os.path.join(SPOOL_DIR, 'drain.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        _seal_orphans()
+        paths = _segment_paths('.log')
+        if not paths:
+            return 0
+        conn = get_db_connection()
+        try:
+            for path in paths:
+                replay_segment(conn, path, batch_size)
+                os.remove(path)  # Only after its rows are committed
+        finally:
+            conn.close()
+        REPLAY_SECONDS.set(time.time())
+        return len(paths)
+
+
+def start_drainer(app, interval_ms=SPOOL_DRAIN_INTERVAL_MS):
+    """Replays the spool in a daemon thread, backing off while the database is unreachable."""
+    def loop():
+        cpu_topology.pin_current_thread('io')
+        delay = interval_ms / 1000.0
+        while True:
+            time.sleep(delay)
+            try:
+                drain()
+                delay = interval_ms / 1000.0
+            except Exception as e:
+                delay = min(30.0, delay * 2)
+                app.logger.warning(f"⚠️ Spool replay failed, retrying in {delay:.0f}s: {e}")
+
+    thread = threading.Thread(target=loop, name='spool-drainer', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,186 @@
+"""Bounded background executor for fire-and-forget work (alert delivery).
+
+Unlike ThreadPoolExecutor, the queue has a fixed capacity, so an alert storm
+can't pile up unbounded closures that each hold a full frame. When the queue
+is full the executor applies its policy:
+  * drop_oldest - evict the oldest queued task to make room (default; the
+    newest detections matter most),
+  * reject      - refuse the new task,
+  * block       - wait up to block_timeout_ms for room, then refuse.
+submit() returns False when the task was refused; nothing is raised into the
+request path.
+
+Worker threads start on the first submit (and again after a fork, so the
+pre-fork master in serve.py never hands dead threads to its workers).
+Pending tasks are drained at exit: gunicorn workers exit normally on SIGTERM,
+and install_shutdown_hooks() turns SIGTERM into a normal exit for the
+development server.
+"""
+import atexit
+import collections
+import logging
+import os
+import signal
+import threading
+import time
+
+import cpu_topology
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 4))
+BACKGROUND_QUEUE_SIZE = int(os.getenv('BACKGROUND_QUEUE_SIZE', 256))
+BACKGROUND_QUEUE_POLICY = os.getenv('BACKGROUND_QUEUE_POLICY', 'drop_oldest').lower()  # drop_oldest|reject|block
+BACKGROUND_BLOCK_TIMEOUT_MS = int(os.getenv('BACKGROUND_BLOCK_TIMEOUT_MS', 100))
+TASK_DRAIN_TIMEOUT = float(os.getenv('TASK_DRAIN_TIMEOUT', 10))  # Keep below the server's graceful timeout
+
+POLICIES = ('drop_oldest', 'reject', 'block')
+
+TASKS = Counter('camwatch_background_tasks_total',
+                "Background tasks by executor and outcome (submitted, completed, failed, dropped, rejected, abandoned).",
+                ('executor', 'outcome'))
+
+_executors = []
+
+
+class BoundedExecutor:
+    def __init__(self, name, workers=BACKGROUND_WORKERS, capacity=BACKGROUND_QUEUE_SIZE,
+                 policy=BACKGROUND_QUEUE_POLICY, block_timeout_ms=BACKGROUND_BLOCK_TIMEOUT_MS):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}' (expected one of {', '.join(POLICIES)})")
+        self.name = name
+        self.workers = max(1, workers)
+        self.capacity = max(1, capacity)
+        self.policy = policy
+        self.block_timeout = block_timeout_ms / 1000.0
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._threads = []
+        self._pid = None
+        self._running = 0
+        self._closed = False
+        _executors.append(self)
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    @property
+    def active(self):
+        return self._running
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs). Returns False if the task was refused."""
+        task = (fn, args, kwargs)
+        with self._lock:
+            if self._closed:
+                TASKS.inc((self.name, 'rejected'))
+                return False
+            self._ensure_workers()
+            if len(self._queue) >= self.capacity:
+                if self.policy == 'drop_oldest':
+                    self._queue.popleft()
+                    TASKS.inc((self.name, 'dropped'))
+                elif self.policy == 'block':
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.capacity and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._not_full.wait(remaining):
+                            break
+                    if len(self._queue) >= self.capacity or self._closed:
+                        TASKS.inc((self.name, 'rejected'))
+                        return False
+                else:
+                    TASKS.inc((self.name, 'rejected'))
+                    return False
+            self._queue.append(task)
+            self._not_empty.notify()
+        TASKS.inc((self.name, 'submitted'))
+        return True
+
+    def _ensure_workers(self):
+        # Called with the lock held. Threads don't survive fork(), so a new pid means a fresh pool
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._running = 0
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        cpu_topology.pin_current_thread('io')  # Keep background I/O off the inference cores
+        while True:
+            with self._lock:
+                while not self._queue:
+                    if self._closed:
+                        return
+                    self._not_empty.wait()
+                fn, args, kwargs = self._queue.popleft()
+                self._running += 1
+                self._not_full.notify()
+            try:
+                fn(*args, **kwargs)
+                TASKS.inc((self.name, 'completed'))
+            except Exception:
+                TASKS.inc((self.name, 'failed'))
+                logger.exception(f"Background task {getattr(fn, '__name__', fn)} failed")
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    if not self._queue and not self._running:
+                        self._idle.notify_all()
+
+    def shutdown(self, timeout=TASK_DRAIN_TIMEOUT):
+        """Stops accepting tasks and waits up to `timeout` seconds for the queue to drain.
+
+        Returns the number of tasks abandoned.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            if self._pid == os.getpid():
+                while self._queue or self._running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._idle.wait(remaining)
+            abandoned = len(self._queue)
+            self._queue.clear()
+        if abandoned:
+            TASKS.inc((self.name, 'abandoned'), abandoned)
+            logger.warning(f"{self.name}: {abandoned} background task(s) abandoned at shutdown")
+        return abandoned
+
+
+Gauge('camwatch_background_queue_depth', "Background tasks waiting for a worker thread.",
+      lambda: {(executor.name,): executor.queue_depth for executor in _executors}, ('executor',))
+Gauge('camwatch_background_queue_capacity', "Capacity of each background task queue.",
+      lambda: {(executor.name,): executor.capacity for executor in _executors}, ('executor',))
+Gauge('camwatch_background_tasks_active', "Background tasks currently running.",
+      lambda: {(executor.name,): executor.active for executor in _executors}, ('executor',))
+
+
+def drain_all(timeout=TASK_DRAIN_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    for executor in _executors:
+        executor.shutdown(max(0.0, deadline - time.monotonic()))
+
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(0)  # Runs the atexit hooks, unlike the default SIGTERM action
+
+
+def install_shutdown_hooks():
+    """Drains every executor at exit, and makes SIGTERM a normal exit when nothing else handles it."""
+    atexit.register(drain_all)
+    if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
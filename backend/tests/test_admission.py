@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify
+
+from admission import AdmissionController, AdmissionRejected, admission_controlled
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def _acquire_in_thread(controller, key, outcomes):
+    def run():
+        try:
+            controller.acquire(key)
+            outcomes.append('granted')
+        except AdmissionRejected as rejected:
+            outcomes.append(rejected.status)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_newer_frame_replaces_queued_frame():
+    controller = AdmissionController('test', 1, max_queue=4, max_wait_ms=2000)
+    controller.acquire('busy')
+    older, newer = [], []
+
+    first = _acquire_in_thread(controller, 'camera:1', older)
+    _wait_for(lambda: controller.queue_depth == 1)
+    second = _acquire_in_thread(controller, 'camera:1', newer)
+    first.join(2)
+    assert older == [429]
+    assert controller.queue_depth == 1
+    assert controller.superseded == 1
+
+    controller.release()
+    second.join(2)
+    assert newer == ['granted']
+    assert controller.in_flight == 1
+
+
+def test_expired_frame_is_dropped():
+    controller = AdmissionController('test', 1, max_queue=4, max_wait_ms=20)
+    controller.acquire('busy')
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('camera:1')
+    assert rejected.value.status == 503
+    assert rejected.value.retry_after > 0
+    assert controller.queue_depth == 0
+    assert controller.expired == 1
+
+    # The expired waiter must not be handed the slot when it frees up
+    controller.release()
+    assert controller.in_flight == 0
+    controller.acquire('camera:2')
+    assert controller.in_flight == 1
+
+
+def _app(controller):
+    app = Flask(__name__)
+    guarded = admission_controlled(controller)(lambda current_user: jsonify({"success": True}))
+
+    @app.route('/analyze', methods=['POST'])
+    def analyze():
+        return guarded({'id': 1})
+
+    return app
+
+
+def test_overloaded_queue_answers_503_with_retry_after():
+    controller = AdmissionController('test', 1, max_queue=0, max_wait_ms=20)
+    controller.acquire('busy')
+
+    response = _app(controller).test_client().post('/analyze', json={'camera_id': 1})
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after_ms'] > 0
+
+
+def test_superseded_frame_answers_429_with_retry_after():
+    controller = AdmissionController('test', 1, max_queue=4, max_wait_ms=2000)
+    app = _app(controller)
+    controller.acquire('busy')
+    responses = {}
+
+    def post(name):
+        responses[name] = app.test_client().post('/analyze', json={'camera_id': 1})
+
+    first = threading.Thread(target=post, args=('older',))
+    first.start()
+    _wait_for(lambda: controller.queue_depth == 1)
+    second = threading.Thread(target=post, args=('newer',))
+    second.start()
+    first.join(2)
+    controller.release()
+    second.join(2)
+
+    assert responses['older'].status_code == 429
+    assert responses['older'].headers['Retry-After'] == '0'
+    assert responses['newer'].status_code == 200
+    assert controller.in_flight == 0
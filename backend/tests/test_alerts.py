@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import alerts
+from alerts import AlertDispatcher, IncidentStore, WebhookSink
+from benchmarks.alert_sink import make_handler
+from task_queue import BoundedExecutor
+
+
+class RecordingSink:
+    name = 'recording'
+
+    def __init__(self):
+        self.alerts = []
+
+    def send(self, alert):
+        self.alerts.append(alert)
+
+
+class ThreadCheckingStore(IncidentStore):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.threads = set()
+
+    def update(self, camera_id, change):
+        self.threads.add(threading.current_thread().name)
+        return super().update(camera_id, change)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_notify_leaves_incident_updates_to_the_scheduler(tmp_path):
+    sink = RecordingSink()
+    store = ThreadCheckingStore(str(tmp_path))
+    dispatcher = AlertDispatcher(sinks=[sink], coalesce_seconds=60, dead_letter_path=str(tmp_path / 'dead.jsonl'),
+                                 incidents=store)
+
+    dispatcher.notify(3, ['knife'], 0.6)
+    dispatcher.notify(3, ['knife'], 0.8)
+    _wait_for(lambda: dispatcher.open_incidents() == 1 and sink.alerts)
+    dispatcher.notify(3, ['pistol'], 0.7)
+    _wait_for(lambda: len(sink.alerts) == 2)
+
+    assert store.threads == {'alert-scheduler'}
+    assert [alert['event'] for alert in sink.alerts] == ['opened', 'escalated']
+    assert sink.alerts[1]['weapon_types'] == ['knife', 'pistol']
+    assert sink.alerts[1]['frames'] == 3
+    assert sink.alerts[1]['max_confidence'] == 0.8
+
+
+@pytest.fixture
+def alert_sink():
+    """Starts benchmarks/alert_sink.py on a free port. Call it with (fail_first, status); returns (url, delivered latencies)."""
+    servers = []
+
+    def start(fail_first=0, status=503):
+        latencies_ms = []
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(fail_first, status, latencies_ms))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/alerts", latencies_ms
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(alerts, 'ALERT_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(alerts, 'ALERT_RETRY_BASE_MS', 20)
+    monkeypatch.setattr(alerts.random, 'uniform', lambda low, high: high)  # No jitter: the backoff is exact
+
+
+def _webhook_dispatcher(tmp_path, url):
+    executor = BoundedExecutor('test-alerts', workers=1, capacity=8, policy='reject')
+    return AlertDispatcher(sinks=[WebhookSink(url)], executor=executor, coalesce_seconds=60,
+                           dead_letter_path=str(tmp_path / 'dead.jsonl'), incidents=IncidentStore(str(tmp_path)))
+
+
+def _dead_letters(dispatcher):
+    with open(dispatcher.dead_letter_path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_failed_delivery_is_retried_with_backoff(tmp_path, alert_sink, fast_retries):
+    url, delivered = alert_sink(fail_first=2)
+    dispatcher = _webhook_dispatcher(tmp_path, url)
+
+    started = time.monotonic()
+    dispatcher.send_test()
+    _wait_for(lambda: delivered)
+    assert time.monotonic() - started >= (20 + 40) / 1000.0  # Two retries, the second waiting twice as long
+    assert dispatcher.pending_retries() == 0
+    assert dispatcher.dead_letter_count() == 0
+
+
+def test_delivery_is_dead_lettered_after_max_attempts_and_redelivered(tmp_path, alert_sink, fast_retries):
+    url, delivered = alert_sink(fail_first=3)
+    dispatcher = _webhook_dispatcher(tmp_path, url)
+
+    alert = dispatcher.send_test()
+    _wait_for(lambda: dispatcher.dead_letter_count() == 1)
+    (entry,) = _dead_letters(dispatcher)
+    assert (entry['sink'], entry['attempts'], entry['error']) == ('webhook', 3, 'HTTP 503')
+    assert entry['alert']['alert_id'] == alert['alert_id']
+    assert not delivered
+
+    # The receiver has recovered: redelivery empties the dead-letter file
+    assert dispatcher.redeliver_dead_letters() == 1
+    _wait_for(lambda: delivered)
+    assert dispatcher.dead_letter_count() == 0
+
+
+def test_permanent_error_is_dead_lettered_without_retries(tmp_path, alert_sink, fast_retries):
+    url, delivered = alert_sink(fail_first=5, status=400)
+    dispatcher = _webhook_dispatcher(tmp_path, url)
+
+    dispatcher.send_test()
+    _wait_for(lambda: dispatcher.dead_letter_count() == 1)
+    (entry,) = _dead_letters(dispatcher)
+    assert (entry['attempts'], entry['error']) == (1, 'HTTP 400')
+    assert dispatcher.pending_retries() == 0
+
+
+def test_quiet_incident_is_resolved(tmp_path):
+    sink = RecordingSink()
+    dispatcher = AlertDispatcher(sinks=[sink], coalesce_seconds=0.05, dead_letter_path=str(tmp_path / 'dead.jsonl'),
+                                 incidents=IncidentStore(str(tmp_path)))
+
+    dispatcher.notify(5, ['pistol'], 0.9)
+    _wait_for(lambda: len(sink.alerts) == 2, timeout=5.0)
+    opened, resolved = sink.alerts
+    assert (opened['event'], resolved['event']) == ('opened', 'resolved')
+    assert resolved['incident_id'] == opened['incident_id']
+    assert dispatcher.open_incidents() == 0
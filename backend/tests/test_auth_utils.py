@@ -0,0 +1,108 @@
+import datetime
+import multiprocessing
+import time
+
+import jwt
+import pytest
+from flask import Flask, jsonify
+
+import auth_utils
+
+SECRET = 'test-secret-of-at-least-thirty-two-bytes'
+
+
+def _token(user_id):
+    payload = {'user_id': user_id, 'role': 'staff', 'email': 'staff@camwatch.local', 'name': 'Staff',
+               'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)}
+    return jwt.encode(payload, SECRET, algorithm='HS256')
+
+
+@pytest.fixture
+def auth(tmp_path, monkeypatch):
+    """auth_utils with empty caches, a private revocations file and a users table kept in a file."""
+    status_file = tmp_path / 'is_active'
+    status_file.write_text('1')
+    lookups = tmp_path / 'lookups'
+    lookups.write_text('')
+
+    def get_user_active_status(user_id):
+        with open(lookups, 'a') as f:
+            f.write('x')
+        return status_file.read_text() == '1'
+
+    monkeypatch.setattr(auth_utils, '_jwt_secret', SECRET)
+    monkeypatch.setattr(auth_utils, '_token_cache', auth_utils.OrderedDict())
+    monkeypatch.setattr(auth_utils, '_user_status_cache', {})
+    monkeypatch.setattr(auth_utils, '_revocations', {'checked_at': 0.0, 'inode': None, 'offset': None})
+    monkeypatch.setattr(auth_utils, '_REVOCATIONS_CHECK_S', 0.0)
+    monkeypatch.setattr(auth_utils, 'USER_REVOCATIONS_FILE', str(tmp_path / 'user_revocations.log'))
+    monkeypatch.setattr(auth_utils, 'get_user_active_status', get_user_active_status)
+    return status_file, lookups
+
+
+def _app():
+    app = Flask(__name__)
+
+    @app.route('/me')
+    @auth_utils.token_required
+    def me(current_user):
+        return jsonify({'success': True, 'id': current_user['id']})
+
+    return app
+
+
+def _worker(connection, token):
+    """Another worker process: answers each 'request' with the status code of GET /me."""
+    client = _app().test_client()
+    while connection.recv() == 'request':
+        response = client.get('/me', headers={'Authorization': f'Bearer {token}'})
+        connection.send(response.status_code)
+
+
+def test_revocation_reaches_cached_tokens_in_another_process(auth):
+    status_file, lookups = auth
+    token = _token(7)
+    context = multiprocessing.get_context('fork')
+    parent_end, worker_end = context.Pipe()
+    worker = context.Process(target=_worker, args=(worker_end, token))
+    worker.start()
+    try:
+        def request():
+            parent_end.send('request')
+            assert parent_end.poll(5)
+            return parent_end.recv()
+
+        assert request() == 200
+        # Deactivated in the database only: the worker keeps answering from its caches
+        status_file.write_text('0')
+        assert request() == 200
+        assert lookups.read_text() == 'x'
+
+        # Deactivated through the admin API in this process: the worker sees the revocations file
+        with _app().app_context():
+            auth_utils.set_user_status(7, False)
+        assert request() == 401
+        assert lookups.read_text() == 'xx'
+    finally:
+        parent_end.send('stop')
+        worker.join(5)
+    assert worker.exitcode == 0
+
+
+def test_old_revocations_are_rotated_out(auth):
+    revocations = auth_utils.USER_REVOCATIONS_FILE
+    stale = time.time() - auth_utils.USER_STATUS_CACHE_TTL - 10
+    with open(revocations, 'w') as f:
+        f.write(f"3 {stale:.0f}\n4\n")  # The second entry predates timestamps
+    auth_utils._apply_revocations()  # This process has read everything so far
+
+    with _app().app_context():
+        auth_utils.set_user_status(7, False)
+    with open(revocations) as f:
+        assert [line.split()[0] for line in f] == ['7']
+
+    # Another worker's view: it cached both users before the revocation and sees the file rotated
+    auth_utils._user_status_cache.update({5: (True, time.monotonic()), 7: (True, time.monotonic())})
+    auth_utils._apply_revocations()
+    assert 7 not in auth_utils._user_status_cache
+    assert 5 in auth_utils._user_status_cache
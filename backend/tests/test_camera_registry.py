@@ -0,0 +1,67 @@
+import camera_registry as registry_module
+from camera_registry import CameraRegistry
+
+
+class FakeCursor:
+    def __init__(self, rows, during_select):
+        self.rows = rows
+        self.during_select = during_select
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.during_select()
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, rows, during_select):
+        self.rows = rows
+        self.during_select = during_select
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self.rows, self.during_select)
+
+    def close(self):
+        pass
+
+
+def _camera(camera_id, **settings):
+    return {'id': camera_id, 'name': f'Camera {camera_id}', 'is_active': True, **settings}
+
+
+def _use_database(monkeypatch, rows, during_select=lambda: None):
+    monkeypatch.setattr(registry_module, 'get_db_connection', lambda: FakeConnection(rows, during_select))
+
+
+def test_load_that_overlaps_a_write_is_dropped(monkeypatch):
+    registry = CameraRegistry()
+    _use_database(monkeypatch, [_camera(1, is_active=True)])
+    assert registry.load()
+
+    # An admin deactivates camera 1 while a refresh's SELECT is still reading the old row
+    stale_rows = [_camera(1, is_active=True)]
+    _use_database(monkeypatch, stale_rows, lambda: registry.upsert(_camera(1, is_active=False)))
+    assert not registry.load()
+    assert registry.get(1)['is_active'] is False
+
+    _use_database(monkeypatch, [_camera(1, is_active=False)])
+    assert registry.load()
+    assert registry.get(1)['is_active'] is False
+
+
+def test_remove_during_load_keeps_the_camera_gone(monkeypatch):
+    registry = CameraRegistry()
+    _use_database(monkeypatch, [_camera(1), _camera(2)])
+    registry.load()
+
+    _use_database(monkeypatch, [_camera(1), _camera(2)], lambda: registry.remove(2))
+    assert not registry.load()
+    assert registry.get(2) is None
+    assert [camera['id'] for camera in registry.all()[0]] == [1]
@@ -0,0 +1,44 @@
+import datetime
+import os
+
+import jwt
+import pytest
+from flask import Flask
+
+import auth_utils
+import evidence_store
+from routes import dashboard_routes
+
+SECRET = 'test-secret-of-at-least-thirty-two-bytes'
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(evidence_store, 'EVIDENCE_DIR', str(tmp_path))
+    monkeypatch.setattr(auth_utils, '_jwt_secret', SECRET)
+    monkeypatch.setattr(auth_utils, 'get_user_active_status', lambda user_id: True)
+    app = Flask(__name__)
+    app.register_blueprint(dashboard_routes.dashboard_bp, url_prefix='/api/dashboard')
+    token = jwt.encode({'user_id': 1, 'role': 'admin',
+                        'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)},
+                       SECRET, algorithm='HS256')
+    return app.test_client(), {'Authorization': f'Bearer {token}'}
+
+
+def test_evidence_etag_survives_a_touch(client, monkeypatch):
+    test_client, headers = client
+    frame = b'\xff\xd8 frame bytes'
+    reference = evidence_store.reference_of(frame)
+    evidence_store.store(reference, frame)
+    monkeypatch.setattr(dashboard_routes, 'get_detection_image_ref', lambda detection_id, detected_at=None: reference)
+
+    first = test_client.get('/api/dashboard/detections/1/image?size=full', headers=headers)
+    assert first.status_code == 200
+    assert first.headers['ETag'] == f'"{evidence_store.digest_of(reference)}-full"'
+
+    # Storing the same frame again bumps its mtime; the ETag must not change
+    os.utime(evidence_store.resolve(reference), (1, 1))
+    evidence_store.store(reference, frame)
+    revalidated = test_client.get('/api/dashboard/detections/1/image?size=full',
+                                  headers={**headers, 'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
@@ -0,0 +1,78 @@
+import threading
+
+from flask import Flask
+
+import metrics
+from metrics import Counter, Histogram
+
+
+def _observe_in_thread(metric, *values):
+    thread = threading.Thread(target=lambda: [metric.observe(v, ('a',)) for v in values])
+    thread.start()
+    thread.join()
+
+
+def test_histogram_scrapes_are_stable():
+    histogram = Histogram('test_stable_seconds', "Test histogram.", ('stage',), buckets=(0.1, 1.0))
+    _observe_in_thread(histogram, 0.05, 0.5)  # Retired shard
+    histogram.observe(2.0, ('a',))            # Live shard
+
+    first = list(histogram.samples())
+    assert list(histogram.samples()) == first
+    assert list(histogram.samples()) == first
+    assert ('test_stable_seconds_count', [('stage', 'a')], 3) in first
+    assert ('test_stable_seconds_bucket', [('stage', 'a'), ('le', '+Inf')], 3) in first
+
+
+def test_histogram_keeps_counting_after_scrapes():
+    histogram = Histogram('test_growing_seconds', "Test histogram.", ('stage',), buckets=(0.1,))
+    _observe_in_thread(histogram, 0.05)
+    histogram.observe(0.05, ('a',))
+    list(histogram.samples())
+    _observe_in_thread(histogram, 0.5)
+
+    samples = dict((name, value) for name, _, value in histogram.samples() if not name.endswith('_bucket'))
+    assert samples['test_growing_seconds_count'] == 3
+    assert abs(samples['test_growing_seconds_sum'] - 0.6) < 1e-9
+
+
+def test_counter_scrapes_are_stable():
+    counter = Counter('test_stable_total', "Test counter.", ('camera',))
+    thread = threading.Thread(target=counter.inc, args=(('1',), 2.0))
+    thread.start()
+    thread.join()
+    counter.inc(('1',))
+
+    assert list(counter.samples()) == list(counter.samples()) == [('test_stable_total', [('camera', '1')], 3.0)]
+
+
+def test_dead_thread_shards_are_retired_without_scrapes():
+    counter = Counter('test_short_lived_total', "Test counter.", ('camera',))
+    for _ in range(200):
+        thread = threading.Thread(target=counter.inc, args=(('1',),))
+        thread.start()
+        thread.join()
+
+    assert len(counter._values._shards) <= 1
+    assert list(counter.samples()) == [('test_short_lived_total', [('camera', '1')], 200.0)]
+
+
+def _scrape(monkeypatch, token='', allow_unauthenticated=False, remote_addr='127.0.0.1', authorization=None):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', token)
+    monkeypatch.setattr(metrics, 'METRICS_ALLOW_UNAUTHENTICATED', allow_unauthenticated)
+    app = Flask(__name__)
+    metrics.init_app(app)
+    headers = {'Authorization': authorization} if authorization else {}
+    return app.test_client().get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': remote_addr}).status_code
+
+
+def test_metrics_without_a_token_only_serve_localhost(monkeypatch):
+    assert _scrape(monkeypatch) == 200
+    assert _scrape(monkeypatch, remote_addr='10.0.0.5') == 403
+    assert _scrape(monkeypatch, remote_addr='10.0.0.5', allow_unauthenticated=True) == 200
+
+
+def test_metrics_token_is_required_when_set(monkeypatch):
+    assert _scrape(monkeypatch, token='scrape-secret') == 403
+    assert _scrape(monkeypatch, token='scrape-secret', authorization='Bearer wrong') == 403
+    assert _scrape(monkeypatch, token='scrape-secret', remote_addr='10.0.0.5', authorization='Bearer scrape-secret') == 200
@@ -0,0 +1,55 @@
+import datetime
+import decimal
+import json
+
+import msgpack
+import numpy as np
+import pytest
+from flask import Flask
+
+from serialization import columnar, respond
+
+PAYLOAD = {
+    'detected_at': datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+    'confidence': decimal.Decimal('0.875'),
+    'score': np.float32(0.5),
+    'classes': {2: 'knife'},
+}
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_json_is_the_default(app):
+    with app.test_request_context():
+        response = respond(PAYLOAD, status=201)
+    assert response.status_code == 201
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == {
+        'detected_at': '2026-01-02T03:04:05+00:00', 'confidence': 0.875, 'score': 0.5, 'classes': {'2': 'knife'},
+    }
+
+
+@pytest.mark.parametrize('mimetype', ['application/msgpack', 'application/x-msgpack'])
+def test_msgpack_when_accepted(app, mimetype):
+    with app.test_request_context(headers={'Accept': mimetype}):
+        response = respond(PAYLOAD)
+    assert response.mimetype == mimetype
+    assert 'Accept' in response.vary
+    assert msgpack.unpackb(response.get_data(), strict_map_key=False) == {
+        'detected_at': '2026-01-02T03:04:05+00:00', 'confidence': 0.875, 'score': 0.5, 'classes': {2: 'knife'},
+    }
+
+
+def test_json_preferred_over_msgpack(app):
+    with app.test_request_context(headers={'Accept': 'application/json, application/msgpack;q=0.5'}):
+        assert respond(PAYLOAD).mimetype == 'application/json'
+
+
+def test_columnar():
+    rows = [{'id': 1, 'objects': [[2, 900, 1, 2, 3, 4]]}, {'id': 2, 'objects': None}]
+    assert columnar(rows) == {'count': 2, 'columns': {'id': [1, 2], 'objects': [[[2, 900, 1, 2, 3, 4]], None]}}
+    assert columnar(rows, ('objects',)) == {'count': 2, 'columns': {'objects': [[[2, 900, 1, 2, 3, 4]], None]}}
+    assert columnar([]) == {'count': 0, 'columns': {}}
@@ -0,0 +1,199 @@
+import fcntl
+import glob
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+import evidence_store
+import spool
+
+
+class FakeDatabase:
+    """detection_logs as a set of (event_id, detected_at), honouring the spool's ON CONFLICT DO NOTHING."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    encoding = 'UTF8'
+
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, template, args):  # Called by execute_values once per row
+        self._pending.append(args)
+        return b'(...)'
+
+    def execute(self, sql, params=None):
+        assert b'ON CONFLICT (event_id, detected_at) DO NOTHING' in sql
+        rows = self.connection.database.rows
+        self.rowcount = 0
+        for row in self._pending:
+            key = (row[0], row[4])
+            if key not in rows:
+                rows[key] = row
+                self.rowcount += 1
+        self._pending = []
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, 'SPOOL_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(spool, 'get_db_connection', database.connect)
+    return database
+
+
+def _write_segment(monkeypatch, directory, count):
+    """Spools `count` detections into one sealed segment. Returns its path."""
+    writer = spool.SpoolWriter(directory=str(directory), seal_ms=3_600_000)
+    monkeypatch.setattr(spool, 'writer', writer)
+    for i in range(count):
+        assert spool.spool_detection(1, 'weapon', 0.5 + i / 100, objects=[[2, 900, 1, 2, 3, 4]])
+    writer.close()
+    (path,) = spool._segment_paths('.log')
+    return path
+
+
+def test_torn_record_at_the_end_is_skipped(monkeypatch, spool_dir):
+    path = _write_segment(monkeypatch, spool_dir, 3)
+    with open(path, 'ab') as f:
+        # A writer killed mid-append: the frame promises more payload than made it to disk
+        f.write(struct.pack('<II', 100, 0) + b'{"event_id":')
+
+    headers = list(spool.read_segment(path))
+    assert [header['confidence'] for header in headers] == [0.5, 0.51, 0.52]
+
+
+def test_corrupt_record_stops_the_read(monkeypatch, spool_dir):
+    path = _write_segment(monkeypatch, spool_dir, 2)
+    with open(path, 'r+b') as f:
+        f.seek(-2, os.SEEK_END)
+        f.write(b'!!')
+
+    assert len(list(spool.read_segment(path))) == 1
+
+
+def test_replaying_a_segment_twice_inserts_each_row_once(monkeypatch, spool_dir, database):
+    path = _write_segment(monkeypatch, spool_dir, 5)
+
+    # A drainer that crashed after the commit but before deleting the segment replays it again
+    spool.replay_segment(database.connect(), path)
+    spool.replay_segment(database.connect(), path)
+    assert len(database.rows) == 5
+
+    assert spool.drain() == 1
+    assert len(database.rows) == 5
+    assert spool._segment_paths('.log') == []
+    assert all(row[7].adapted == [[2, 900, 1, 2, 3, 4]] and row[8] == [2] for row in database.rows.values())
+
+
+def test_lock_keeps_a_second_drainer_out(monkeypatch, spool_dir, database):
+    path = _write_segment(monkeypatch, spool_dir, 2)
+
+    with open(os.path.join(spool_dir, 'drain.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)  # Another drainer is running
+        assert spool.drain() is None
+        assert os.path.exists(path)
+        assert database.rows == {}
+
+    assert spool.drain() == 1
+    assert len(database.rows) == 2
+
+
+def test_appends_never_wait_for_fsync(monkeypatch, tmp_path):
+    fsync_started, release_fsync = threading.Event(), threading.Event()
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        fsync_started.set()
+        release_fsync.wait(5)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', slow_fsync)
+    writer = spool.SpoolWriter(directory=str(tmp_path), segment_bytes=64, fsync_interval_ms=1)
+    try:
+        writer.append(b'x' * 100)  # Fills the first segment: sealed by the flusher, not here
+        assert fsync_started.wait(2)
+
+        started = time.monotonic()
+        for _ in range(3):
+            writer.append(b'y' * 10)
+        assert time.monotonic() - started < 0.5
+    finally:
+        release_fsync.set()
+    writer.close()
+    assert len(glob.glob(os.path.join(tmp_path, '*.log'))) == 2
+    assert glob.glob(os.path.join(tmp_path, '*.open')) == []
+
+
+def test_drain_stores_the_spooled_evidence_frame(monkeypatch, spool_dir, database, tmp_path):
+    evidence_dir = tmp_path / 'evidence'
+    monkeypatch.setattr(evidence_store, 'EVIDENCE_DIR', str(evidence_dir))
+    writer = spool.SpoolWriter(directory=str(spool_dir), seal_ms=3_600_000)
+    monkeypatch.setattr(spool, 'writer', writer)
+    frame = b'\xff\xd8 frame bytes\nwith a newline'
+    reference = evidence_store.reference_of(frame)
+    assert spool.spool_detection(1, 'weapon', 0.9, image_path=reference, image=frame)
+    assert spool.spool_detection(1, 'weapon', 0.8)  # No frame: only the header is spooled
+    writer.close()
+
+    # Nothing is on disk until the drainer replays the record
+    assert not evidence_dir.exists()
+    assert spool.drain() == 1
+    assert (evidence_dir / reference).read_bytes() == frame
+    assert sorted(row[5] or '' for row in database.rows.values()) == ['', reference]
+
+
+def test_unwritable_evidence_store_keeps_the_segment(monkeypatch, spool_dir, database):
+    writer = spool.SpoolWriter(directory=str(spool_dir), seal_ms=3_600_000)
+    monkeypatch.setattr(spool, 'writer', writer)
+    frame = b'\xff\xd8 frame bytes'
+    assert spool.spool_detection(1, 'weapon', 0.9, image_path=evidence_store.reference_of(frame), image=frame)
+    writer.close()
+
+    def failing_store(reference, data):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(evidence_store, 'store', failing_store)
+    with pytest.raises(OSError):
+        spool.drain()
+    assert database.rows == {}
+    assert len(spool._segment_paths('.log')) == 1
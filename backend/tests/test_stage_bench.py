@@ -0,0 +1,50 @@
+"""pytest-benchmark suite for the detection hot path, one test per stage of benchmarks/stage_bench.py.
+
+Needs pytest-benchmark, OpenCV and YOLO weights, so it is skipped unless
+BENCH_MODEL names the weights to load (a tiny model in CI):
+
+    BENCH_MODEL=yolov8n.pt python -m pytest tests/test_stage_bench.py --benchmark-autosave
+    BENCH_MODEL=yolov8n.pt python -m pytest tests/test_stage_bench.py --benchmark-compare --benchmark-compare-fail=median:20%
+
+BENCH_DB=postgres times spool_replay against the database from .env.
+"""
+import itertools
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+pytest.importorskip('cv2')
+if not os.getenv('BENCH_MODEL'):
+    pytest.skip("BENCH_MODEL is not set", allow_module_level=True)
+
+from benchmarks import stage_bench
+
+
+@pytest.fixture(scope='module')
+def bench():
+    args = stage_bench.build_parser().parse_args(['--model', os.environ['BENCH_MODEL'], '--db', os.getenv('BENCH_DB', 'stub')])
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        import evidence_store
+        import spool
+
+        # Modules imported by other tests already read SPOOL_DIR/EVIDENCE_DIR; keep the repo's directories clean
+        scratch = tempfile.mkdtemp(prefix='camwatch-bench-')
+        monkeypatch.setattr(evidence_store, 'EVIDENCE_DIR', os.path.join(scratch, 'evidence'))
+        monkeypatch.setattr(spool, 'writer', spool.SpoolWriter(directory=os.path.join(scratch, 'spool')))
+        with stage_bench.prepared_stages(args) as (stage_fns, _):
+            yield args, stage_fns
+
+
+@pytest.mark.parametrize('stage', stage_bench.STAGES)
+def test_stage(benchmark, bench, stage):
+    args, stage_fns = bench
+    if stage not in stage_fns:
+        pytest.skip(f"{stage} is unavailable (msgpack not installed)")
+    fn, inputs = stage_fns[stage]
+    # Inputs round-robin like the standalone runner; spool_replay gets a fresh segment every round
+    items = itertools.cycle(inputs)
+    benchmark.group = 'stages'
+    benchmark.pedantic(fn, setup=lambda: ((next(items),), {}), rounds=stage_bench.stage_iterations(args, stage),
+                       warmup_rounds=args.warmup)
@@ -0,0 +1,92 @@
+import pytest
+
+from tracking import TRACKER_CONFIDENCE_DECAY, TRACKER_MAX_MISSES, StreamTracker, iou
+
+
+def _detection(bbox, confidence=0.9, class_id=2, name='knife'):
+    return {'object': name, 'confidence': confidence, 'class_id': class_id, 'bbox': bbox}
+
+
+def test_iou():
+    assert iou([0, 0, 1, 1], [0, 0, 1, 1]) == 1.0
+    assert iou([0, 0, 0.2, 0.2], [0.5, 0.5, 0.7, 0.7]) == 0.0
+    assert iou([0, 0, 0.2, 0.2], [0.1, 0, 0.3, 0.2]) == pytest.approx(1 / 3)
+
+
+def test_detects_every_keyframe_interval():
+    tracker = StreamTracker(keyframe_interval=4)
+    assert tracker.needs_detection(0.1, now=100.0)  # No keyframe yet
+    tracker.update([_detection([0.1, 0.1, 0.3, 0.3])], now=100.0)
+
+    decisions = []
+    for frame in range(1, 5):
+        now = 100.0 + frame * 0.1
+        decisions.append(tracker.needs_detection(0.1, now=now))
+        if not decisions[-1]:
+            tracker.predict(now=now)
+    assert decisions == [False, False, False, True]  # Three tracked frames, then the detector again
+
+
+def test_detects_on_every_frame_with_interval_one():
+    tracker = StreamTracker(keyframe_interval=1)
+    tracker.update([_detection([0.1, 0.1, 0.3, 0.3])], now=100.0)
+    assert tracker.needs_detection(0.1, now=100.1)
+
+
+def test_detects_after_a_gap_or_a_scene_cut():
+    tracker = StreamTracker(keyframe_interval=10)
+    tracker.update([_detection([0.1, 0.1, 0.3, 0.3])], now=100.0)
+    assert not tracker.needs_detection(0.1, now=100.1)
+    assert tracker.needs_detection(0.1, now=105.0)
+    assert tracker.needs_detection(0.1, motion=1.0, now=100.1)
+
+
+def test_confidence_decays_on_tracked_frames():
+    tracker = StreamTracker(keyframe_interval=10)
+    tracker.update([_detection([0.1, 0.1, 0.3, 0.3], confidence=0.9)], now=100.0)
+
+    first = tracker.predict(now=100.1)
+    second = tracker.predict(now=100.2)
+    assert first[0]['tracked'] and second[0]['tracked']
+    assert first[0]['confidence'] == pytest.approx(0.9 * TRACKER_CONFIDENCE_DECAY, abs=1e-4)
+    assert second[0]['confidence'] == pytest.approx(0.9 * TRACKER_CONFIDENCE_DECAY ** 2, abs=1e-4)
+
+
+def test_redetects_once_decayed_confidence_would_drop_below_threshold():
+    tracker = StreamTracker(keyframe_interval=10)
+    tracker.update([_detection([0.1, 0.1, 0.3, 0.3], confidence=0.9)], now=100.0)
+    threshold = 0.9 * TRACKER_CONFIDENCE_DECAY ** 2 - 0.01
+
+    assert not tracker.needs_detection(threshold, now=100.1)
+    tracker.predict(now=100.1)
+    assert not tracker.needs_detection(threshold, now=100.2)
+    tracker.predict(now=100.2)
+    assert tracker.needs_detection(threshold, now=100.3)
+
+
+def test_detections_keep_their_track_ids():
+    tracker = StreamTracker(keyframe_interval=4)
+    left, right = tracker.update([_detection([0.1, 0.1, 0.3, 0.3]), _detection([0.6, 0.6, 0.8, 0.8])], now=100.0)
+
+    # Moved slightly and reported in the other order
+    moved = tracker.update([_detection([0.62, 0.6, 0.82, 0.8]), _detection([0.12, 0.1, 0.32, 0.3])], now=100.1)
+    assert [obj['track_id'] for obj in moved] == [right['track_id'], left['track_id']]
+    assert not any(obj['tracked'] for obj in moved)
+
+
+def test_other_class_at_the_same_place_gets_a_new_track():
+    tracker = StreamTracker(keyframe_interval=4)
+    knife = tracker.update([_detection([0.1, 0.1, 0.3, 0.3])], now=100.0)[0]
+    pistol = tracker.update([_detection([0.1, 0.1, 0.3, 0.3], class_id=4, name='pistol')], now=100.1)[0]
+    assert pistol['track_id'] != knife['track_id']
+
+
+def test_unmatched_tracks_are_hidden_then_dropped():
+    tracker = StreamTracker(keyframe_interval=4)
+    tracker.update([_detection([0.1, 0.1, 0.3, 0.3])], now=100.0)
+
+    tracker.update([], now=100.1)
+    assert tracker.predict(now=100.2) == []  # Lost on the last keyframe: not drawn
+    for keyframe in range(TRACKER_MAX_MISSES):
+        tracker.update([], now=100.3 + keyframe * 0.1)
+    assert tracker.tracks == []
@@ -0,0 +1,189 @@
+"""Per-stream object tracking between detector keyframes.
+
+The detector only runs on keyframes: every TRACKER_KEYFRAME_INTERVAL frames,
+after a gap or a scene cut, and whenever a track's confidence has decayed
+below the detection threshold. On the frames in between, every track is moved
+along its constant-velocity estimate, which costs microseconds instead of a
+YOLO forward pass.
+
+Detections are matched to the predicted tracks greedily by IoU, falling back
+to centre distance for small fast-moving boxes (same class only), so each
+object keeps a stable track id across frames. Boxes are
+normalized [x1, y1, x2, y2] frame coordinates.
+"""
+import itertools
+import os
+import threading
+import time
+
+TRACKER_KEYFRAME_INTERVAL = int(os.getenv('TRACKER_KEYFRAME_INTERVAL', 4))   # 1 = detect on every frame
+TRACKER_MAX_GAP_MS = int(os.getenv('TRACKER_MAX_GAP_MS', 1000))              # Always detect after a longer gap
+TRACKER_CONFIDENCE_DECAY = float(os.getenv('TRACKER_CONFIDENCE_DECAY', 0.85))  # Per tracked (non-detected) frame
+TRACKER_MOTION_REDETECT = float(os.getenv('TRACKER_MOTION_REDETECT', 0.15))  # Scene cut: motion score from frame_control
+TRACKER_MIN_IOU = float(os.getenv('TRACKER_MIN_IOU', 0.3))
+TRACKER_MAX_JUMP = 1.0  # Without overlap, match centres up to this many box sizes apart
+TRACKER_MAX_MISSES = 2  # Keyframes a track survives without a matching detection
+
+_track_ids = itertools.count(1)
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    if intersection <= 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match_score(predicted, box):
+    """IoU when the boxes overlap enough; otherwise a small score that shrinks with centre distance (0 = no match)."""
+    overlap = iou(predicted, box)
+    if overlap >= TRACKER_MIN_IOU:
+        return overlap
+    gate = TRACKER_MAX_JUMP * max(predicted[2] - predicted[0], predicted[3] - predicted[1])
+    distance = (((predicted[0] + predicted[2]) - (box[0] + box[2])) ** 2 +
+                ((predicted[1] + predicted[3]) - (box[1] + box[3])) ** 2) ** 0.5 / 2
+    if gate <= 0 or distance > gate:
+        return 0.0
+    return TRACKER_MIN_IOU * (1.0 - distance / gate) * 0.99  # Always ranks below a real IoU match
+
+
+class Track:
+    __slots__ = ('track_id', 'class_id', 'name', 'box', 'velocity', 'confidence', 'detected_confidence',
+                 'updated_at', 'misses')
+
+    def __init__(self, detection, now):
+        self.track_id = next(_track_ids)
+        self.class_id = detection['class_id']
+        self.name = detection['object']
+        self.box = list(detection['bbox'])
+        self.velocity = [0.0, 0.0]  # Box centre, normalized units per second
+        self.confidence = self.detected_confidence = detection['confidence']
+        self.updated_at = now
+        self.misses = 0
+
+    def predicted_box(self, now):
+        dt = now - self.updated_at
+        dx, dy = self.velocity[0] * dt, self.velocity[1] * dt
+        # Shift, then clamp to the frame without changing the box size
+        dx = min(max(dx, -self.box[0]), 1.0 - self.box[2])
+        dy = min(max(dy, -self.box[1]), 1.0 - self.box[3])
+        return [self.box[0] + dx, self.box[1] + dy, self.box[2] + dx, self.box[3] + dy]
+
+    def correct(self, detection, now):
+        dt = now - self.updated_at
+        box = detection['bbox']
+        if dt > 0:
+            vx = ((box[0] + box[2]) - (self.box[0] + self.box[2])) / 2 / dt
+            vy = ((box[1] + box[3]) - (self.box[1] + self.box[3])) / 2 / dt
+            self.velocity = [0.5 * self.velocity[0] + 0.5 * vx, 0.5 * self.velocity[1] + 0.5 * vy]
+        self.box = list(box)
+        self.confidence = self.detected_confidence = detection['confidence']
+        self.updated_at = now
+        self.misses = 0
+
+    def as_object(self, box, tracked):
+        return {
+            'object': self.name,
+            'confidence': round(self.confidence, 4),
+            'class_id': self.class_id,
+            'bbox': [round(v, 4) for v in box],
+            'track_id': self.track_id,
+            'tracked': tracked  # True: propagated by the tracker, not seen by the detector on this frame
+        }
+
+
+class StreamTracker:
+    def __init__(self, keyframe_interval=TRACKER_KEYFRAME_INTERVAL):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.tracks = []
+        self.frames_since_keyframe = None  # None until the first keyframe
+        self.last_keyframe_at = 0.0
+        self.last_seen = 0.0
+        self._lock = threading.Lock()  # Two frames of one stream can be in flight at once
+
+    def needs_detection(self, threshold, motion=0.0, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            if self.frames_since_keyframe is None or self.keyframe_interval == 1:
+                return True
+            if self.frames_since_keyframe + 1 >= self.keyframe_interval:
+                return True
+            if (now - self.last_keyframe_at) * 1000.0 > TRACKER_MAX_GAP_MS or motion >= TRACKER_MOTION_REDETECT:
+                return True
+            decayed = TRACKER_CONFIDENCE_DECAY ** (self.frames_since_keyframe + 1)
+            return any(track.detected_confidence * decayed < threshold for track in self.tracks if not track.misses)
+
+    def update(self, detections, now=None):
+        """Keyframe: associates detector output with the tracks. Returns the detections with track ids."""
+        now = now or time.monotonic()
+        with self._lock:
+            candidates = []
+            for t_index, track in enumerate(self.tracks):
+                predicted = track.predicted_box(now)
+                for d_index, detection in enumerate(detections):
+                    if detection['class_id'] == track.class_id:
+                        score = match_score(predicted, detection['bbox'])
+                        if score > 0:
+                            candidates.append((score, t_index, d_index))
+            candidates.sort(reverse=True)
+
+            matched_tracks, matched_detections = set(), {}
+            for score, t_index, d_index in candidates:
+                if t_index in matched_tracks or d_index in matched_detections:
+                    continue
+                self.tracks[t_index].correct(detections[d_index], now)
+                matched_tracks.add(t_index)
+                matched_detections[d_index] = self.tracks[t_index]
+
+            survivors = []
+            for t_index, track in enumerate(self.tracks):
+                if t_index not in matched_tracks:
+                    track.misses += 1
+                    if track.misses > TRACKER_MAX_MISSES:
+                        continue
+                survivors.append(track)
+            objects = []
+            for d_index, detection in enumerate(detections):
+                track = matched_detections.get(d_index)
+                if track is None:
+                    track = Track(detection, now)
+                    survivors.append(track)
+                objects.append(track.as_object(track.box, tracked=False))
+            self.tracks = survivors
+            self.frames_since_keyframe = 0
+            self.last_keyframe_at = self.last_seen = now
+            return objects
+
+    def predict(self, now=None):
+        """In-between frame: propagates the live tracks. Returns them as detected objects."""
+        now = now or time.monotonic()
+        with self._lock:
+            self.frames_since_keyframe += 1
+            self.last_seen = now
+            objects = []
+            for track in self.tracks:
+                if track.misses:
+                    continue  # The detector lost it on the last keyframe; don't draw it
+                track.confidence = track.detected_confidence * TRACKER_CONFIDENCE_DECAY ** self.frames_since_keyframe
+                objects.append(track.as_object(track.predicted_box(now), tracked=True))
+            return objects
+
+
+_trackers = {}  # stream key -> StreamTracker
+_trackers_lock = threading.Lock()
+
+
+def get_tracker(stream_key):
+    now = time.monotonic()
+    with _trackers_lock:
+        tracker = _trackers.get(stream_key)
+        if tracker is None:
+            tracker = _trackers[stream_key] = StreamTracker()
+            if len(_trackers) > 4096:
+                for key in [k for k, v in _trackers.items() if now - v.last_seen > 600 and v is not tracker]:
+                    del _trackers[key]
+        tracker.last_seen = now
+        return tracker
@@ -1,9 +1,13 @@
-from ultralytics import YOLO
-
-model = YOLO('yolov8s.pt')
-model.train(
-    data=r'H:\Code\Final Year Projectsss\CamWatch\code\backend\dataset\weapons.v1i.yolov8\data.yaml',
-    epochs=10,
-    imgsz=416,
-    batch=4
-)
+"""Fine-tunes the weapons detector with the original settings.
+
+model_eval.py has the parameterized version (train / sweep), e.g.
+    python model_eval.py train --model yolov8s.pt --data <data.yaml> --imgsz 416 --sweep
+"""
+import os
+
+from model_eval import train
+
+DATASET = os.getenv('YOLO_DATASET', r'H:\Code\Final Year Projectsss\CamWatch\code\backend\dataset\weapons.v1i.yolov8\data.yaml')
+
+if __name__ == '__main__':
+    train('yolov8s.pt', data=DATASET, epochs=10, imgsz=416, batch=4)
@@ -3,6 +3,7 @@ import { useAuth } from '../context/AuthContext';
 import { Link } from 'react-router-dom';
 import apiService from '../services/apiService'; // Ensure this path is correct
 import { showToast, camwatchToast } from '../utils/toast'; // Ensure this path is correct
+import DetectionThumbnail from './common/DetectionThumbnail';
 
 const StaffDashboard = () => {
   const { user, logout } = useAuth();
@@ -23,6 +24,9 @@ const StaffDashboard = () => {
   const aiIntervalRef = useRef(null);
   const aiCanvasRef = useRef(null);
   const lastFrameRef = useRef(null); // Ref to store the last frame for motion detection
+  const streamIdRef = useRef(Math.random().toString(36).slice(2)); // Identifies this tab to the server's admission control
+  // Capture settings suggested by the server in each analyze response's `control` block
+  const frameControlRef = useRef({ intervalMs: 200, width: 320, height: 320, jpegQuality: 0.6 });
 
   // Add new state for live preview
   const [livePreview, setLivePreview] = useState(null);
@@ -258,9 +262,8 @@ const StaffDashboard = () => {
       throw new Error('Video element not available');
     }
     
-    // Smaller resolution for faster processing
-    const targetWidth = 320;  // YOLO optimal size
-    const targetHeight = 320;
+    // Resolution suggested by the server (320x320 = YOLO optimal size)
+    const { width: targetWidth, height: targetHeight, jpegQuality } = frameControlRef.current;
     
     canvas.width = targetWidth;
     canvas.height = targetHeight;
@@ -269,7 +272,7 @@ const StaffDashboard = () => {
     ctx.drawImage(video, 0, 0, targetWidth, targetHeight);
     
     // Lower quality for faster transfer
-    const dataUrl = canvas.toDataURL('image/jpeg', 0.6);
+    const dataUrl = canvas.toDataURL('image/jpeg', jpegQuality);
     const base64Image = dataUrl.split(',')[1];
     
     return { dataUrl, base64Image };
@@ -293,11 +296,27 @@ const StaffDashboard = () => {
         method: 'POST',
         body: JSON.stringify({ 
           image_b64: base64Image,
+          stream_id: streamIdRef.current,
           realtime: true,
           silent: true  // ✅ Tell backend to be silent
         }),
       });
       
+      // ✅ Follow the server's pacing: slower for quiet scenes, back off when it is overloaded
+      if (res?.control) {
+        frameControlRef.current = {
+          intervalMs: res.control.interval_ms,
+          width: res.control.width,
+          height: res.control.height,
+          jpegQuality: res.control.jpeg_quality
+        };
+      } else if (res?.retry_after_ms !== undefined) {
+        frameControlRef.current = {
+          ...frameControlRef.current,
+          intervalMs: Math.max(frameControlRef.current.intervalMs, res.retry_after_ms)
+        };
+      }
+
       if (res?.success) {
         // ✅ INSTANT UI updates
         setAiDescription(res.description);
@@ -326,8 +345,10 @@ const StaffDashboard = () => {
           // ✅ SINGLE toast only for real threats
           // camwatchToast.error("🚨 WEAPON DETECTED!");
           
-          // ✅ FAST background save
-          setTimeout(() => fetchRecentDetections(), 100);
+          // ✅ FAST background save (tracked-only frames weren't saved, nothing new to fetch)
+          if ((res.detected_objects || []).some(obj => !obj.tracked)) {
+            setTimeout(() => fetchRecentDetections(), 100);
+          }
         } else if (livePreview) {
           setLivePreview(null);
         }
@@ -342,6 +363,7 @@ const StaffDashboard = () => {
 
   // ✅ REPLACE useEffect with this SILENT version:
   useEffect(() => {
+    let cancelled = false;
     if (isWebcamOn && webcamVideoRef.current && webcamStream?.active) {
       // ✅ Clear existing interval
       if (realTimeIntervalRef.current) {
@@ -349,17 +371,24 @@ const StaffDashboard = () => {
         realTimeIntervalRef.current = null;
       }
       
+      // ✅ Each frame schedules the next one after the interval the server asked for (200ms = 5 FPS)
+      const scheduleNextFrame = () => {
+        realTimeIntervalRef.current = setTimeout(async () => {
+          if (cancelled) return;
+          if (isWebcamOn && webcamStream?.active) {
+            await analyzeWebcamFrame();
+            if (!cancelled) scheduleNextFrame();
+          } else {
+            realTimeIntervalRef.current = null;
+          }
+        }, frameControlRef.current.intervalMs);
+      };
+
       // ✅ FAST startup
       const startFastDetection = () => {
+        if (cancelled) return;
         if (webcamVideoRef.current?.readyState >= 2) {
-          realTimeIntervalRef.current = setInterval(() => {
-            if (isWebcamOn && webcamStream?.active) {
-              analyzeWebcamFrame();
-            } else {
-              clearInterval(realTimeIntervalRef.current);
-              realTimeIntervalRef.current = null;
-            }
-          }, 200); // ✅ MUCH FASTER - 200ms = 5 FPS
+          scheduleNextFrame();
         } else {
           setTimeout(startFastDetection, 100);
         }
@@ -374,6 +403,7 @@ const StaffDashboard = () => {
     }
     
     return () => {
+      cancelled = true;
       if (realTimeIntervalRef.current) {
         clearInterval(realTimeIntervalRef.current);
         realTimeIntervalRef.current = null;
@@ -805,6 +835,7 @@ const StaffDashboard = () => {
               <table className="w-full">
                 <thead className="bg-white/5">
                   <tr>
+                    <th className="px-6 py-4 text-left text-xs font-medium text-gray-300 uppercase tracking-wider">Image</th>
                     <th className="px-6 py-4 text-left text-xs font-medium text-gray-300 uppercase tracking-wider">Type</th>
                     <th className="px-6 py-4 text-left text-xs font-medium text-gray-300 uppercase tracking-wider">Confidence</th>
                     <th className="px-6 py-4 text-left text-xs font-medium text-gray-300 uppercase tracking-wider">Details</th>
@@ -815,6 +846,9 @@ const StaffDashboard = () => {
                 <tbody className="divide-y divide-white/10">
                   {recentDetections.map((detection) => (
                     <tr key={detection.id} className="hover:bg-white/5 transition-colors duration-150">
+                      <td className="px-6 py-4 whitespace-nowrap">
+                        {detection.image_path ? <DetectionThumbnail detectionId={detection.id} detectedAt={detection.detected_at} /> : <span className="text-xs text-gray-500">—</span>}
+                      </td>
                       <td className="px-6 py-4 whitespace-nowrap">
                         <span className={`inline-flex px-3 py-1 rounded-full text-xs font-medium ${
                           detection.detection_type === 'weapon' ? 'bg-red-500/30 text-red-200 border border-red-500/50' :
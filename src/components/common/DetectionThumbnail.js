@@ -0,0 +1,44 @@
+import React, { useState, useEffect } from 'react';
+import apiService from '../../services/apiService';
+
+// Small evidence image for a stored detection; opens the preview size on click
+const DetectionThumbnail = ({ detectionId, detectedAt }) => {
+  const [src, setSrc] = useState(null);
+
+  useEffect(() => {
+    let objectUrl = null;
+    let cancelled = false;
+    apiService.getDetectionImageUrl(detectionId, 'thumb', detectedAt).then((url) => {
+      if (cancelled) {
+        if (url) URL.revokeObjectURL(url);
+        return;
+      }
+      objectUrl = url;
+      setSrc(url);
+    });
+    return () => {
+      cancelled = true;
+      if (objectUrl) URL.revokeObjectURL(objectUrl);
+    };
+  }, [detectionId, detectedAt]);
+
+  const openPreview = async () => {
+    const url = await apiService.getDetectionImageUrl(detectionId, 'preview', detectedAt);
+    if (url) window.open(url, '_blank', 'noopener');
+  };
+
+  if (!src) {
+    return <div className="w-16 h-12 rounded bg-white/10" />;
+  }
+  return (
+    <img
+      src={src}
+      alt={`Detection ${detectionId}`}
+      loading="lazy"
+      onClick={openPreview}
+      className="w-16 h-12 object-cover rounded cursor-pointer border border-white/20"
+    />
+  );
+};
+
+export default DetectionThumbnail;
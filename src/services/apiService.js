@@ -135,6 +135,25 @@ class ApiService {
     });
   }
 
+  // Evidence frame of a detection as an object URL (size: 'thumb', 'preview' or 'full').
+  // Fetched with the auth header; the browser cache answers repeats (ETag / Cache-Control).
+  // detectedAt (the row's detected_at) lets the server look in a single partition.
+  async getDetectionImageUrl(detectionId, size = 'thumb', detectedAt = null) {
+    const at = detectedAt ? `&at=${encodeURIComponent(detectedAt)}` : '';
+    try {
+      const response = await fetch(`${this.baseURL}/dashboard/detections/${detectionId}/image?size=${size}${at}`, {
+        headers: this.getAuthHeaders(),
+      });
+      if (!response.ok) {
+        return null;
+      }
+      return URL.createObjectURL(await response.blob());
+    } catch (error) {
+      console.error("Image fetch error:", error);
+      return null;
+    }
+  }
+
   // Health check
   async healthCheck() {
     return this.request('/health');